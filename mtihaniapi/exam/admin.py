@@ -16,12 +16,13 @@ class ExamQuestionInline(admin.TabularInline):
 @admin.register(Exam)
 class ExamAdmin(admin.ModelAdmin):
     list_display = (
-        "id", "code", "classroom", "source_exam", "status", "is_published", "is_grading", "is_analysing", "generation_config", "generation_error", "type",
+        "id", "code", "classroom", "source_exam", "status", "is_published", "is_grading", "is_analysing", "running_task", "scheduled_task", "generation_config", "generation_error", "type",
     )
     list_filter = ("status", "is_published", "classroom__name",
                    "teacher__user__username")
     search_fields = ("code", "classroom__name", "teacher__user__username")
-    readonly_fields = ("created_at", "updated_at", "duration_min")
+    readonly_fields = ("created_at", "updated_at",
+                       "duration_min", "analysis_stages")
     inlines = [ExamQuestionInline]
 
 
@@ -226,3 +227,25 @@ class StudentAggregatePerformanceAdmin(admin.ModelAdmin):
                     "avg_expectation_level", "updated_at")
     search_fields = ("student__name",)
     readonly_fields = ("created_at", "updated_at")
+
+
+@admin.register(PerformanceScore)
+class PerformanceScoreAdmin(admin.ModelAdmin):
+    list_display = ("entity_type", "entity_id", "dimension_type",
+                    "strand", "dimension_name", "percentage")
+    list_filter = ("entity_type", "dimension_type")
+    search_fields = ("dimension_name", "strand")
+
+
+@admin.register(PipelineRun)
+class PipelineRunAdmin(admin.ModelAdmin):
+    list_display = (
+        "id", "exam", "task", "status", "started_at", "duration_seconds",
+        "llm_calls", "llm_seconds", "input_tokens", "output_tokens",
+        "cache_hits", "db_queries", "rows_written",
+    )
+    list_filter = ("task", "status", "exam__classroom__name")
+    search_fields = ("exam__code", "exam__classroom__name")
+    date_hierarchy = "started_at"
+    readonly_fields = [field.name for field in PipelineRun._meta.fields]
+
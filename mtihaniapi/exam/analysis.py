@@ -0,0 +1,1674 @@
+from mtihaniapi import settings
+import math
+import itertools
+import numpy as np
+import pandas as pd
+from sklearn.cluster import KMeans
+from sklearn.decomposition import PCA
+from scipy.stats import pearsonr
+from collections import defaultdict
+from celery import shared_task
+from django.utils import timezone
+from django.db import transaction
+from learner.models import set_classroom_mtihani_score
+from exam.models import *
+from gen.utils import *
+from typing import Counter, Dict, Any, List, Optional, Tuple, Union
+from django.db.models import Avg, F, Max, Min, OuterRef, Subquery
+import json
+from exam.utils import *
+from exam.pipeline import PipelineStage, run_pipeline
+from statistics import mode, stdev
+
+# Exam analysis tasks and the performance, cluster and aggregate helpers
+# they use. Imported by Celery workers only (see exam.generation), this is
+# where the numpy, pandas, scikit-learn and scipy imports live.
+
+
+# ==================================================================== ANALYSING EXAMS
+
+# =============================================
+# ==========ANY CHANGE TO THIS=================
+# =======!!!!RESTART CELERY!!!=================
+# =============================================
+@shared_task
+def generate_exam_analysis(exam_id):
+    try:
+        exam = Exam.objects.get(id=exam_id)
+        exam.update_to_analysing()
+
+        def save_stage_reports(reports):
+            exam.analysis_stages = json.dumps(reports)
+            exam.save(update_fields=["analysis_stages"])
+
+        _, reports = run_pipeline(
+            get_exam_analysis_stages(exam),
+            max_workers=settings.ANALYSIS_MAX_WORKERS,
+            on_progress=save_stage_reports,
+        )
+
+        failed_stage = next(
+            (name for name, report in reports.items() if report["status"] == "Failed"), None)
+        if failed_stage:
+            error_res = reports[failed_stage]["error"]
+            exam.status = "Failed"
+            exam.generation_error = error_res.get("error", "An error occurred")
+            if "details" in error_res:
+                label = ANALYSIS_STAGE_DETAIL_LABELS.get(failed_stage, "Details")
+                exam.generation_error += f" | {label}: {json.dumps(error_res['details'])}"
+            exam.save()
+            return
+
+        exam.status = "Complete"
+        exam.is_analysing = False
+        exam.save()
+
+    except Exception as e:
+        exam.status = "Failed"
+        exam.generation_error = f"Unexpected error: {str(e)}"
+        exam.save()
+        print(f"Background analysis failed for Exam ID {exam.id}: {e}")
+
+
+# What the items of a failed stage's error details are
+ANALYSIS_STAGE_DETAIL_LABELS = {
+    "session_performances": "Sessions",
+    "follow_up_exams": "Clusters",
+    "student_aggregates": "Students",
+}
+
+
+def get_exam_analysis_stages(exam) -> List[PipelineStage]:
+    """
+    The analysis as a DAG. The LLM calls (class, strand and sub strand
+    insights, cluster follow-ups) run on worker threads, the database
+    stages run on the task's thread while those are in flight.
+    """
+    performances = StudentExamSessionPerformance.objects.filter(
+        session__exam=exam).select_related("session__student", "session__exam")
+
+    def session_performances(inputs):
+        error_res = generate_all_exam_session_performances(exam)
+        if error_res:
+            return error_res
+        # Loads (and caches) the queryset for every later stage
+        return list(performances)
+
+    def class_statistics(inputs):
+        if not inputs["session_performances"]:
+            return {"error": "No student performances found for this exam."}
+        return compute_class_exam_statistics(performances)
+
+    def class_insights(inputs):
+        return get_llm_stage_result(generate_llm_class_perf_insights({
+            key: inputs["class_statistics"][key] for key in CLASS_INSIGHTS_FIELDS
+        }))
+
+    def strand_analysis(inputs):
+        return get_llm_stage_result(
+            generate_strand_analysis(inputs["session_performances"]))
+
+    def flagged_sub_strands(inputs):
+        return get_llm_stage_result(
+            generate_flagged_sub_strands(inputs["session_performances"]))
+
+    def class_performance(inputs):
+        try:
+            return save_class_exam_performance(
+                exam,
+                inputs["class_statistics"],
+                general_insights=inputs["class_insights"],
+                strand_analysis=inputs["strand_analysis"],
+                flagged_sub_strands=inputs["flagged_sub_strands"],
+            )
+        except Exception as e:
+            return {"error": f"Error while generating class performance: {str(e)}"}
+
+    def class_avg_differences(inputs):
+        try:
+            update_class_avg_differences(
+                inputs["class_performance"], performances)
+        except Exception as e:
+            return {"error": f"Failed updating student-class diffs: {str(e)}"}
+
+    def performance_clusters(inputs):
+        error_res = generate_exam_performance_clusters(exam, performances)
+        if error_res:
+            return error_res
+        clusters = list(ExamPerformanceCluster.objects.filter(exam=exam))
+        questions = list(ExamQuestion.objects.filter(exam=exam))
+        if not clusters or not questions:
+            return {"error": f"No performance clusters found for exam {exam.id}"}
+        return clusters, questions
+
+    def cluster_follow_ups(inputs):
+        return generate_all_cluster_follow_up_quizzes(
+            *inputs["performance_clusters"])
+
+    def follow_up_exams(inputs):
+        clusters, _ = inputs["performance_clusters"]
+        return save_cluster_follow_up_quizzes(
+            exam, clusters, inputs["cluster_follow_ups"])
+
+    return [
+        PipelineStage("session_performances", session_performances),
+        PipelineStage("class_statistics", class_statistics,
+                      ["session_performances"]),
+        PipelineStage("class_insights", class_insights,
+                      ["class_statistics"], in_worker=True),
+        PipelineStage("strand_analysis", strand_analysis,
+                      ["session_performances"], in_worker=True),
+        PipelineStage("flagged_sub_strands", flagged_sub_strands,
+                      ["session_performances"], in_worker=True),
+        PipelineStage("performance_clusters", performance_clusters,
+                      ["session_performances"]),
+        PipelineStage("cluster_follow_ups", cluster_follow_ups,
+                      ["performance_clusters"], in_worker=True),
+        PipelineStage("question_performance",
+                      lambda inputs: generate_exam_question_performance(exam)),
+        PipelineStage("student_aggregates",
+                      lambda inputs: update_all_student_aggregates(performances),
+                      ["session_performances"]),
+        PipelineStage("class_performance", class_performance,
+                      ["class_statistics", "class_insights", "strand_analysis", "flagged_sub_strands"]),
+        PipelineStage("class_avg_differences", class_avg_differences,
+                      ["class_performance"]),
+        PipelineStage("class_aggregate",
+                      lambda inputs: update_class_aggregate_performance(
+                          exam.classroom),
+                      ["class_performance"]),
+        PipelineStage("follow_up_exams", follow_up_exams,
+                      ["performance_clusters", "cluster_follow_ups"]),
+    ]
+
+
+def get_llm_stage_result(res) -> Union[List[Any], Dict[str, Any]]:
+    if isinstance(res, list):
+        return res
+    return {"error": res.get("error", "An error occurred")}
+
+
+@shared_task
+def generate_exam_incremental_analysis(exam_id, answer_ids):
+    """
+    Re-analyses an exam after teachers changed the scores of answer_ids.
+    Only those answers' students, questions and clusters plus the class
+    statistics, strand analysis and sub strand correlations are
+    recomputed. The LLM insights and follow-ups are kept and regenerated,
+    through a full analysis, only once the class average has drifted by at
+    least ANALYSIS_DRIFT_THRESHOLD points since they were generated.
+    """
+    try:
+        exam = Exam.objects.select_related("classroom").get(id=exam_id)
+    except Exam.DoesNotExist:
+        print(f"Incremental analysis skipped: exam {exam_id} not found")
+        return
+
+    answers = StudentExamSessionAnswer.objects.filter(
+        id__in=answer_ids, session__exam=exam)
+    session_ids = set(answers.values_list("session_id", flat=True))
+    question_ids = set(answers.values_list("question_id", flat=True))
+    if not session_ids:
+        return
+
+    class_perf = ClassExamPerformance.objects.filter(exam=exam).first()
+    if exam.status != "Complete" or class_perf is None:
+        # Nothing analysed to update yet
+        generate_exam_analysis(exam_id)
+        return
+
+    try:
+        # 1. the edited students' performances
+        performances_res, failed_updates = compute_session_performances(
+            StudentExamSessionAnswer.objects.filter(session_id__in=session_ids))
+        if failed_updates:
+            exam.status = "Failed"
+            exam.generation_error = f"Incremental analysis failed: {json.dumps(failed_updates)}"
+            exam.save()
+            return
+        save_session_performances(performances_res)
+
+        # 2. class statistics and every student's difference from them
+        performances = StudentExamSessionPerformance.objects.filter(
+            session__exam=exam).select_related("session__student", "session__exam")
+        insights_avg_score = class_perf.insights_avg_score
+        if insights_avg_score is None:
+            insights_avg_score = class_perf.avg_score
+
+        class_performance_data = compute_class_exam_statistics(performances)
+        drift = abs(class_performance_data["avg_score"] - insights_avg_score)
+        if drift >= settings.ANALYSIS_DRIFT_THRESHOLD:
+            print(f"Exam {exam.id} class average drifted {drift:.2f} points, running full analysis")
+            generate_exam_analysis(exam_id)
+            return
+
+        # the strand and sub strand numbers, keeping their LLM insights
+        strand_analysis = merge_strand_insights(
+            compute_strand_statistics(performances),
+            {strand["name"]: strand for strand in json.loads(class_perf.strand_analysis or "[]")})
+        flagged_sub_strands = merge_sub_strand_corr_insights(
+            compute_sub_strand_correlations(performances) or [],
+            json.loads(class_perf.flagged_sub_strands or "[]"))
+
+        with transaction.atomic():
+            for field, value in class_performance_data.items():
+                setattr(class_perf, field, value)
+            class_perf.strand_analysis = json.dumps(strand_analysis)
+            class_perf.flagged_sub_strands = json.dumps(flagged_sub_strands)
+            class_perf.insights_avg_score = insights_avg_score
+            class_perf.save()
+            sync_performance_scores("ClassExam", [class_perf])
+            update_class_avg_differences(class_perf, performances)
+
+        # 3. the students' clusters and the questions' performance
+        cluster_ids = performances.filter(session_id__in=session_ids).exclude(
+            cluster=None).values_list("cluster_id", flat=True).distinct()
+        for cluster in ExamPerformanceCluster.objects.filter(id__in=list(cluster_ids)):
+            for field, value in compute_cluster_statistics(list(cluster.performances.all())).items():
+                setattr(cluster, field, value)
+            cluster.save()
+            sync_performance_scores("Cluster", [cluster])
+
+        error_res = generate_exam_question_performance(
+            exam, questions=list(exam.questions.filter(id__in=question_ids)))
+        if error_res:
+            exam.status = "Failed"
+            exam.generation_error = error_res.get("error", "An error occurred")
+            exam.save()
+            return
+
+        # 4. aggregates touched by this exam and its students
+        error_res = update_class_aggregate_performance(exam.classroom)
+        if not error_res:
+            error_res = update_student_aggregates(list(
+                StudentExamSession.objects.filter(id__in=session_ids).values_list("student_id", flat=True)))
+        if error_res:
+            exam.status = "Failed"
+            exam.generation_error = error_res.get("error", "An error occurred")
+            exam.save()
+            return
+
+    except Exception as e:
+        exam.status = "Failed"
+        exam.generation_error = f"Unexpected error: {str(e)}"
+        exam.save()
+        print(f"Incremental analysis failed for Exam ID {exam.id}: {e}")
+
+
+# ------------------------------------------------------------------------ Student exam performance
+
+SESSION_PERFORMANCE_ANSWER_FIELDS = [
+    "id", "session_id", "description", "score",
+    "question__grade", "question__strand", "question__sub_strand", "question__bloom_skill",
+]
+SESSION_PERFORMANCE_COLUMNS = [
+    "answer_id", "session_id", "description", "score",
+    "grade", "strand", "sub_strand", "bloom_skill",
+]
+SESSION_PERFORMANCE_FIELDS = [
+    "avg_score", "avg_expectation_level", "bloom_skill_scores", "grade_scores",
+    "strand_scores", "questions_answered", "questions_unanswered",
+    "completion_rate", "best_5_answer_ids", "worst_5_answer_ids", "updated_at",
+]
+
+
+def generate_all_exam_session_performances(exam) -> Union[None, Dict[str, Any]]:
+    session_ids = list(StudentExamSession.objects.filter(
+        exam=exam).values_list("id", flat=True))
+
+    if not session_ids:
+        return {"error": f"No student sessions found for exam {exam.id}"}
+
+    try:
+        answers = StudentExamSessionAnswer.objects.filter(session__exam=exam)
+        performances, failed_updates = compute_session_performances(answers)
+        save_session_performances(performances)
+    except Exception as e:
+        return {"error": f"Failed generating student performances: {str(e)}"}
+
+    if failed_updates:
+        return {"error": "Some updates failed", "details": failed_updates}
+
+    return None
+
+
+def generate_student_exam_performance(session) -> Union[None, Dict[str, Any]]:
+    try:
+        performances, failed_updates = compute_session_performances(
+            session.answers.all())
+        save_session_performances(performances)
+        return failed_updates[0] if failed_updates else None
+
+    except Exception as e:
+        return {"session_id": session.id,  "reason": f"Error {str(e)}"}
+
+
+def _group_score_percentages(scored, keys: List[str]) -> Dict[Any, List[Tuple[Any, float]]]:
+    """
+    Percentage per (session, *keys) group, as {session_id: [(key, percentage)]}
+    in order of first appearance. Rounding happens in Python so values match
+    format_scores exactly.
+    """
+    grouped = scored.groupby(["session_id", *keys], sort=False)["score"].agg([
+        "sum", "count"])
+    percentages = grouped["sum"] / (grouped["count"] * 4) * 100
+
+    by_session = defaultdict(list)
+    for index, percentage in percentages.items():
+        session_id, *key = index
+        by_session[session_id].append(
+            (key[0] if len(key) == 1 else tuple(key), round(percentage, 2)))
+    return by_session
+
+
+def _sorted_scores(pairs) -> List[Dict[str, Any]]:
+    return sorted(
+        [{"name": str(name), "percentage": percentage} for name, percentage in pairs],
+        key=lambda item: item["percentage"],
+        reverse=True
+    )
+
+
+def compute_session_performances(answers_qs) -> Tuple[Dict[int, Dict[str, Any]], List[Dict[str, Any]]]:
+    """
+    Computes StudentExamSessionPerformance fields for every session in
+    answers_qs from a single query, using group-bys over one answers frame.
+
+    Returns ({session_id: performance fields}, failed session details).
+    Sessions without answers are skipped.
+    """
+    rows = answers_qs.order_by("session_id", "id").values_list(
+        *SESSION_PERFORMANCE_ANSWER_FIELDS)
+    df = pd.DataFrame.from_records(
+        list(rows), columns=SESSION_PERFORMANCE_COLUMNS)
+    if df.empty:
+        return {}, []
+
+    df["answered"] = df["description"].fillna("").str.strip() != ""
+    scored = df[df["score"].notna()]
+
+    counts = df.groupby("session_id", sort=False).agg(
+        total_questions=("answer_id", "size"),
+        answered_questions=("answered", "sum"),
+    )
+    totals = scored.groupby("session_id", sort=False)["score"].agg([
+        "sum", "count"])
+    # Grade shown next to a strand comes from its first answer, scored or not
+    strand_grades = df.groupby(["session_id", "strand"], sort=False)[
+        "grade"].first()
+
+    bloom_scores = _group_score_percentages(scored, ["bloom_skill"])
+    grade_scores = _group_score_percentages(scored, ["grade"])
+    strand_scores = _group_score_percentages(scored, ["strand"])
+    sub_strand_scores = _group_score_percentages(
+        scored, ["strand", "sub_strand"])
+    strand_bloom_scores = _group_score_percentages(
+        scored, ["strand", "bloom_skill"])
+
+    # Stable sort keeps answer order between equal scores
+    ranked = scored.sort_values(["session_id", "score"], kind="stable")
+    ranked_ids = ranked.groupby("session_id", sort=False)[
+        "answer_id"].agg(list)
+
+    performances = {}
+    failed_updates = []
+    for session_id, count_row in counts.iterrows():
+        if session_id not in totals.index:
+            failed_updates.append(
+                {"session_id": int(session_id),  "reason": "Missing total possible score"})
+            continue
+
+        total_score = totals.at[session_id, "sum"]
+        total_possible_score = totals.at[session_id, "count"] * 4
+        avg_score = round(float(total_score / total_possible_score) * 100, 2)
+
+        total_questions = int(count_row["total_questions"])
+        answered_questions = int(count_row["answered_questions"])
+        completion_rate = round(
+            (answered_questions / total_questions) * 100, 2) if total_questions > 0 else 0
+
+        answer_ids = [int(aid) for aid in ranked_ids[session_id]]
+        best_5 = answer_ids[-5:][::-1]
+        worst_5 = answer_ids[:5]
+
+        subs_by_strand = defaultdict(list)
+        for (strand, sub_strand), percentage in sub_strand_scores[session_id]:
+            subs_by_strand[strand].append((sub_strand, percentage))
+        blooms_by_strand = defaultdict(list)
+        for (strand, bloom_skill), percentage in strand_bloom_scores[session_id]:
+            blooms_by_strand[strand].append((bloom_skill, percentage))
+
+        formatted_strand_scores = []
+        for strand, percentage in strand_scores[session_id]:
+            strand_grade = int(strand_grades[(session_id, strand)])
+            strand_name_with_grade = f"{strand} (G{strand_grade})" if strand_grade else strand
+            formatted_strand_scores.append({
+                "name": strand_name_with_grade,
+                "grade": strand_grade,
+                "percentage": percentage,
+                "sub_strands": _sorted_scores(subs_by_strand[strand]),
+                "bloom_skills": _sorted_scores(blooms_by_strand[strand])
+            })
+
+        performances[int(session_id)] = {
+            "avg_score": avg_score,
+            "bloom_skill_scores": json.dumps(_sorted_scores(bloom_scores[session_id])),
+            "grade_scores": json.dumps(_sorted_scores(
+                (int(grade), percentage) for grade, percentage in grade_scores[session_id])),
+            "strand_scores": json.dumps(formatted_strand_scores),
+            "questions_answered": answered_questions,
+            "questions_unanswered": total_questions - answered_questions,
+            "completion_rate": completion_rate,
+            "best_5_answer_ids": json.dumps(best_5),
+            "worst_5_answer_ids": json.dumps(worst_5)
+        }
+
+    return performances, failed_updates
+
+
+def save_session_performances(performances: Dict[int, Dict[str, Any]]):
+    """Upserts StudentExamSessionPerformance rows with one bulk update and one bulk create."""
+    if not performances:
+        return
+
+    now = timezone.now()
+    existing = {
+        perf.session_id: perf
+        for perf in StudentExamSessionPerformance.objects.filter(session_id__in=performances.keys())
+    }
+
+    to_update = []
+    to_create = []
+    for session_id, fields in performances.items():
+        perf = existing.get(session_id) or StudentExamSessionPerformance(
+            session_id=session_id)
+        for field, value in fields.items():
+            setattr(perf, field, value)
+        # bulk writes skip save(), so set what it would
+        perf.avg_expectation_level = get_avg_expectation_level(perf.avg_score)
+        perf.updated_at = now
+        (to_update if perf.pk else to_create).append(perf)
+
+    with transaction.atomic():
+        StudentExamSessionPerformance.objects.bulk_update(
+            to_update, SESSION_PERFORMANCE_FIELDS, batch_size=BULK_UPDATE_BATCH_SIZE)
+        StudentExamSessionPerformance.objects.bulk_create(
+            to_create, batch_size=BULK_UPDATE_BATCH_SIZE)
+        sync_performance_scores(
+            "StudentExamSession",
+            StudentExamSessionPerformance.objects.filter(
+                session_id__in=performances.keys()).order_by("id"),
+        )
+
+
+# ------------------------------------------------------------------------ Performance score facts
+
+def sync_performance_scores(entity_type: str, entities) -> None:
+    """
+    Replaces the PerformanceScore rows of entities with rows built from their
+    JSON score fields. Call after every write to those fields.
+    """
+    entities = list(entities)
+    if not entities:
+        return
+
+    facts = [
+        PerformanceScore(entity_type=entity_type, entity_id=entity.id, **fact)
+        for entity in entities
+        for fact in extract_performance_score_facts(entity)
+    ]
+    with transaction.atomic():
+        delete_performance_scores(entity_type, [e.id for e in entities])
+        PerformanceScore.objects.bulk_create(
+            facts, batch_size=BULK_UPDATE_BATCH_SIZE)
+
+
+def delete_performance_scores(entity_type: str, entity_ids) -> None:
+    PerformanceScore.objects.filter(
+        entity_type=entity_type, entity_id__in=entity_ids).delete()
+
+
+def average_performance_scores(
+        entity_type: str, entity_ids, dimension_type: Optional[str] = None,
+        owner=None) -> List[Dict[str, Any]]:
+    """
+    Mean percentage per (strand, name) across the given entities as a single
+    GROUP BY, in the order they first appear walking the entities by id.
+    entity_ids may be a list or a values("id") queryset. Without a
+    dimension_type every dimension is returned; with an owner expression the
+    averages are also grouped per owner.
+    """
+    facts = PerformanceScore.objects.filter(
+        entity_type=entity_type, entity_id__in=entity_ids)
+    group_fields = ["dimension_type", "strand", "dimension_name"]
+    if dimension_type:
+        facts = facts.filter(dimension_type=dimension_type)
+    if owner is not None:
+        facts = facts.annotate(owner=owner)
+        group_fields.insert(0, "owner")
+
+    rows = list(
+        facts.values(*group_fields)
+        .annotate(
+            avg_percentage=Avg("percentage"),
+            grade=Max("grade"),
+            first_entity_id=Min("entity_id"),
+        )
+    )
+    # A row's place is its first entity, then its position within that entity
+    positions = {
+        (fact["entity_id"], fact["dimension_type"], fact["strand"], fact["dimension_name"]): fact["position"]
+        for fact in facts.filter(
+            entity_id__in={row["first_entity_id"] for row in rows}).values(
+            "entity_id", "dimension_type", "strand", "dimension_name", "position")
+    }
+    rows.sort(key=lambda row: (
+        row["first_entity_id"],
+        positions[(row["first_entity_id"], row["dimension_type"], row["strand"], row["dimension_name"])],
+    ))
+    return [
+        {
+            "owner": row.get("owner"),
+            "dimension_type": row["dimension_type"],
+            "name": row["dimension_name"],
+            "percentage": round(row["avg_percentage"], 2),
+            "strand": row["strand"],
+            "grade": row["grade"],
+        }
+        for row in rows
+    ]
+
+
+def _name_percentages(scores: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    return [{"name": s["name"], "percentage": s["percentage"]} for s in scores]
+
+
+def _group_by_strand(scores: List[Dict[str, Any]]) -> Dict[str, List[Dict[str, Any]]]:
+    by_strand = defaultdict(list)
+    for score in scores:
+        by_strand[score["strand"]].append(
+            {"name": score["name"], "percentage": score["percentage"]})
+    return by_strand
+
+
+# ------------------------------------------------------------------------ Classroom exam performance
+
+
+def save_class_exam_performance(
+        exam,
+        class_performance_data: Dict[str, Any],
+        general_insights: List[Dict[str, Any]],
+        strand_analysis: List[Dict[str, Any]],
+        flagged_sub_strands: List[Dict[str, Any]]):
+    with transaction.atomic():
+        class_perf, _ = ClassExamPerformance.objects.update_or_create(
+            exam=exam,
+            defaults={
+                **class_performance_data,
+                "insights_avg_score": class_performance_data["avg_score"],
+                "general_insights": json.dumps(general_insights),
+                "strand_analysis": json.dumps(strand_analysis),
+                "flagged_sub_strands": json.dumps(flagged_sub_strands)
+            }
+        )
+        sync_performance_scores("ClassExam", [class_perf])
+
+    return class_perf
+
+
+# Statistics sent to the class insights prompt
+CLASS_INSIGHTS_FIELDS = [
+    "avg_score", "avg_expectation_level", "expectation_level_distribution",
+    "score_distribution", "score_variance", "bloom_skill_scores",
+]
+
+
+def compute_class_exam_statistics(performances) -> Dict[str, Any]:
+    """The ClassExamPerformance fields that need no LLM call."""
+    class_scores = [p.avg_score for p in performances]
+    avg_score = round(mean(class_scores), 2)
+    std_dev = round(stdev(class_scores), 2) if len(
+        class_scores) > 1 else 0.0
+    expectation_counts = defaultdict(int)
+
+    for p in performances:
+        expectation_counts[p.avg_expectation_level] += 1
+
+    expectation_level_distribution = [
+        {"name": level, "count": count} for level, count in expectation_counts.items()
+    ]
+
+    # Score distribution in ranges of 10
+    distribution_bins = {f"{i}-{i+9}": 0 for i in range(0, 100, 10)}
+    distribution_bins["100"] = 0  # exact 100
+
+    for p in performances:
+        score = round(p.avg_score)
+        if score == 100:
+            distribution_bins["100"] += 1
+        else:
+            bucket = f"{(score // 10) * 10}-{((score // 10) * 10) + 9}"
+            distribution_bins[bucket] += 1
+
+    score_distribution = [
+        {"name": k, "count": v}
+        for k, v in distribution_bins.items()
+        if v > 0
+    ]
+
+    # Aggregate scores
+    performance_ids = performances.values("id")
+    bloom_scores = _name_percentages(average_performance_scores(
+        "StudentExamSession", performance_ids, "BloomSkill"))
+    grade_scores = _name_percentages(average_performance_scores(
+        "StudentExamSession", performance_ids, "Grade"))
+    strand_student_mastery = generate_strand_student_mastery(performances)
+
+    return {
+        "student_count": len(class_scores),
+        "avg_score": avg_score,
+        "avg_expectation_level": get_avg_expectation_level(avg_score),
+        "expectation_level_distribution": json.dumps(expectation_level_distribution),
+        "score_distribution": json.dumps(score_distribution),
+        "score_variance": json.dumps({
+            "min": round(min(class_scores), 2),
+            "max": round(max(class_scores), 2),
+            "std_dev": std_dev
+        }),
+        "bloom_skill_scores": json.dumps(bloom_scores),
+        "grade_scores": json.dumps(grade_scores),
+        "strand_student_mastery": json.dumps(strand_student_mastery),
+    }
+
+
+def update_class_avg_differences(class_perf, performances):
+    now = timezone.now()
+    diff_updates = []
+    for sp in performances:
+        diff = round(sp.avg_score - class_perf.avg_score, 2)
+        sp.class_avg_difference = diff
+        sp.updated_at = now
+        diff_updates.append(sp)
+    StudentExamSessionPerformance.objects.bulk_update(
+        diff_updates, ["class_avg_difference", "updated_at"],
+        batch_size=BULK_UPDATE_BATCH_SIZE)
+
+
+def generate_strand_analysis(
+    performances, percentile=0.10
+) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    analysis = compute_strand_statistics(performances, percentile)
+    strand_insights_res = generate_llm_strand_insights(analysis)
+
+    if not isinstance(strand_insights_res, list):
+        return {"error": strand_insights_res.get(
+                "error", "Unknown LLM error")}
+
+    insights_lookup = {
+        insight['strand']: insight
+        for insight in strand_insights_res
+    }
+    return merge_strand_insights(analysis, insights_lookup)
+
+
+def compute_strand_statistics(performances, percentile=0.10) -> List[Dict[str, Any]]:
+    """The strand_analysis fields that need no LLM call."""
+    # Aggregators
+    strand_scores_map = defaultdict(list)
+    strand_student_scores_map = defaultdict(list)  # For top/bottom students
+    strand_sub_strand_scores_map = defaultdict(lambda: defaultdict(list))
+    strand_bloom_skill_scores_map = defaultdict(lambda: defaultdict(list))
+    strand_grades = {}
+
+    # Gather all data
+    for perf in performances:
+        strand_scores = json.loads(perf.strand_scores or "[]")
+        student = perf.session.student
+        exam_id = perf.session.exam.id
+        student_id = student.id
+        avg_score = perf.avg_score
+        avg_expectation_level = perf.avg_expectation_level
+
+        for strand in strand_scores:
+            strand_name = strand["name"]
+            strand_grade = strand["grade"]
+            strand_percentage = strand["percentage"]
+            strand_scores_map[strand_name].append(strand_percentage)
+            strand_grades[strand_name] = strand_grade
+            # Collect student scores per strand
+            strand_student_scores_map[strand_name].append({
+                "student_name": student.name,
+                "avg_score": strand_percentage,
+                "avg_expectation_level": avg_expectation_level,
+                "exam_id": exam_id,
+                "student_id": student_id
+            })
+
+            # Sub-strand aggregation
+            for sub in strand.get("sub_strands", []):
+                strand_sub_strand_scores_map[strand_name][sub["name"]].append(
+                    sub["percentage"])
+
+            # Bloom skill aggregation
+            for skill in strand.get("bloom_skills", []):
+                strand_bloom_skill_scores_map[strand_name][skill["name"]].append(
+                    skill["percentage"])
+
+    analysis = []
+
+    for strand_name, strand_scores in strand_scores_map.items():
+        if not strand_scores:
+            continue
+
+        avg_score = round(mean(strand_scores), 2)
+        std_dev = round(stdev(strand_scores), 2) if len(
+            strand_scores) > 1 else 0.0
+        expectation_level = get_avg_expectation_level(avg_score)
+        strand_grade = strand_grades.get(strand_name)
+
+        # -- Top & Bottom Percentile Students --
+        students = sorted(
+            strand_student_scores_map[strand_name], key=lambda x: x["avg_score"], reverse=True)
+        n = len(students)
+        top_n_count = max(1, math.ceil(n * percentile))
+        bottom_n_count = max(1, math.ceil(n * percentile))
+        top_students = students[:top_n_count]
+        bottom_students = students[-bottom_n_count:] if bottom_n_count > 0 else []
+
+        # Sub-strand distribution
+        sub_strand_distribution = []
+        for sub_name, values in strand_sub_strand_scores_map[strand_name].items():
+            sub_strand_avg = round(mean(values), 2)
+            strand_difference = round(sub_strand_avg - avg_score, 2)
+            if strand_difference > 0:
+                diff_desc = "Above Strand Average"
+            elif strand_difference < 0:
+                diff_desc = "Below Strand Average"
+            else:
+                diff_desc = "Equal to Strand Average"
+
+            sub_strand_distribution.append({
+                "name": sub_name,
+                "percentage": sub_strand_avg,
+                "difference": strand_difference,
+                "difference_desc": diff_desc
+            })
+        sub_strand_distribution.sort(
+            key=lambda x: x["percentage"], reverse=True)
+
+        # Bloom skill distribution
+        bloom_distribution = []
+        for skill_name, values in strand_bloom_skill_scores_map[strand_name].items():
+            bloom_distribution.append({
+                "name": skill_name,
+                "percentage": round(mean(values), 2)
+            })
+        bloom_distribution.sort(key=lambda x: x["percentage"], reverse=True)
+
+        analysis.append({
+            "name": strand_name,
+            "grade": strand_grade,
+            "avg_score": avg_score,
+            "avg_expectation_level": expectation_level,
+            "bloom_skill_scores": bloom_distribution,
+            "score_variance": {
+                "min": round(min(strand_scores), 2),
+                "max": round(max(strand_scores), 2),
+                "std_dev": std_dev
+            },
+            "sub_strand_scores": sub_strand_distribution,
+            "top_students": top_students,
+            "bottom_students": bottom_students,
+        })
+
+    return analysis
+
+
+def merge_strand_insights(analysis, insights_lookup) -> List[Dict[str, Any]]:
+    """Adds the insights and suggestions in insights_lookup, by strand name, to analysis."""
+    for strand in analysis:
+        strand_name = strand['name']
+        llm_data = insights_lookup.get(strand_name)
+        if llm_data:
+            strand['insights'] = llm_data.get('insights', [])
+            strand['suggestions'] = llm_data.get('suggestions', [])
+        else:
+            strand['insights'] = []
+            strand['suggestions'] = []
+
+    return analysis
+# Output
+# [
+#   {
+#     "strand_name": "Mixtures (G7)",
+#     "strand_grade": 7,
+#     "avg_score": 74.5,
+#     "avg_expectation_level": "Meets",
+#     "bloom_skill_scores": [...],
+#     "score_variance": {...},
+#     "sub_strand_scores": [
+#       {
+#         "name": "Elements and Compounds",
+#         "percentage": 81.2,
+#         "difference": 6.7,
+#         "difference_desc": "Above Strand Average"
+#       },
+#       ...
+#     ],
+#     "top_students": [
+#       {"student_name": "Akinyi", "avg_score": 98.2, ...}
+#     ],
+#     "bottom_students": [
+#       {"student_name": "Wanjiru", "avg_score": 44.5, ...}
+#     ],
+#     "insights": [...],
+#     "suggestions": [...],
+#   }
+# ]
+
+
+def generate_strand_student_mastery(performances, percentile=0.10) -> Dict[str, Any]:
+    student_rows = []
+
+    for perf in performances:
+        student_name = perf.session.student.name
+        strand_scores = json.loads(perf.strand_scores or "[]")
+        strand_score_map = {s["name"]: s["percentage"] for s in strand_scores}
+        student_rows.append({
+            "name": student_name,
+            "avg": perf.avg_score,
+            "strand_scores": strand_score_map
+        })
+
+    sorted_students = sorted(
+        student_rows, key=lambda x: x["avg"], reverse=True
+    )
+
+    n = len(sorted_students)
+    top_n_count = max(1, math.ceil(n * percentile))
+    bottom_n_count = max(1, math.ceil(n * percentile))
+
+    top_n = sorted_students[:top_n_count]
+    bottom_n = sorted_students[-bottom_n_count:]
+
+    # Optionally, middle students (e.g., middle 10% for context)
+    middle_n = []
+    if n >= 3 * max(top_n_count, bottom_n_count):  # enough for a middle group
+        middle_start = (n - top_n_count - bottom_n_count) // 2
+        middle_n_count = max(1, math.ceil(n * percentile))
+        middle_n = sorted_students[middle_start:middle_start + middle_n_count]
+
+    selected_students = top_n + middle_n + bottom_n
+
+    # Get all unique strand names and preserve column order
+    strand_names = []
+    seen_strands = set()
+    for student in selected_students:
+        for strand in student["strand_scores"].keys():
+            if strand not in seen_strands:
+                seen_strands.add(strand)
+                strand_names.append(strand)
+
+    # Build final matrix
+    matrix = []
+    for student in selected_students:
+        row = {
+            "name": student["name"],
+            "scores": [
+                round(student["strand_scores"].get(strand, 0.0), 2)
+                for strand in strand_names
+            ]
+        }
+        matrix.append(row)
+
+    return {
+        "strands": strand_names,
+        "students": matrix
+    }
+# Output:
+# {
+#   "strands": ["Energy", "Forces", "Living Things"],
+#   "students": [
+#     {"name": "Akinyi", "scores": [88.0, 76.5, 92.1]},
+#     {"name": "Mwangi", "scores": [45.3, 55.2, 64.0]},
+#     ...
+#   ]
+# }
+
+
+def generate_flagged_sub_strands(
+        performances
+) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    sub_strand_correlations = compute_sub_strand_correlations(performances)
+    if sub_strand_correlations is None:
+        return []
+
+    corr_insights_res = generate_llm_sub_strand_corr_insights(
+        sub_strand_correlations)
+
+    if not isinstance(corr_insights_res, list):
+        return {"error": corr_insights_res.get(
+                "error", "Unknown LLM error")}
+
+    return merge_sub_strand_corr_insights(
+        sub_strand_correlations, corr_insights_res)
+
+
+def compute_sub_strand_correlations(performances) -> Optional[List[Dict[str, Any]]]:
+    """
+    Each sub strand's correlations with the others, the part of
+    flagged_sub_strands that needs no LLM call. None when the exam tests
+    fewer than two sub strands.
+    """
+    # Step 1: Prepare data
+    student_sub_scores = []
+    all_sub_strands = set()
+
+    for perf in performances:
+        strand_scores = json.loads(perf.strand_scores or "[]")
+        student_map = {}
+        for strand in strand_scores:
+            for sub in strand.get("sub_strands", []):
+                name = sub["name"]
+                student_map[name] = sub["percentage"]
+                all_sub_strands.add(name)
+        student_sub_scores.append(student_map)
+
+    all_sub_strands = sorted(list(all_sub_strands))
+    if len(all_sub_strands) < 2:
+        return None
+
+    data = np.array([
+        [row.get(name, None) for name in all_sub_strands]
+        for row in student_sub_scores
+    ], dtype=np.float64)
+
+    mask = ~np.isnan(data)
+
+    correlations_map = defaultdict(list)
+
+    for i, j in itertools.combinations(range(len(all_sub_strands)), 2):
+        col_i = data[:, i]
+        col_j = data[:, j]
+        valid = mask[:, i] & mask[:, j]
+
+        if np.sum(valid) < 3:
+            continue
+
+        # Skip if one or both columns are constant
+        if np.std(col_i[valid]) == 0 or np.std(col_j[valid]) == 0:
+            continue
+
+        corr, _ = pearsonr(col_i[valid], col_j[valid])
+        corr = round(corr, 2)
+
+        if abs(corr) < 0.3 or corr == 1.0:
+            continue
+
+        name_i, name_j = all_sub_strands[i], all_sub_strands[j]
+
+        correlations_map[name_i].append((name_j, corr))
+        correlations_map[name_j].append((name_i, corr))
+
+    result = []
+
+    for name, related in correlations_map.items():
+        avg_corr = round(np.mean([c for _, c in related]), 2)
+        strongest_pair = min(related, key=lambda x: x[1])  # most negative
+
+        result.append({
+            "name": name,
+            "average_correlation": avg_corr,
+            "strongest_negative_pair": strongest_pair[0],
+            "correlation": strongest_pair[1],
+        })
+
+    return sorted(result, key=lambda x: x["average_correlation"])
+
+
+def merge_sub_strand_corr_insights(
+        sub_strand_correlations, corr_insights
+) -> List[Dict[str, Any]]:
+    """
+    One flagged pair per sub strand, its strongest negative pair, with the
+    pair and correlation as computed and the insight and suggestion from
+    corr_insights, matched by pair in either order.
+    """
+    insights_lookup = {
+        frozenset(insight.get("pair") or []): insight
+        for insight in corr_insights
+    }
+
+    flagged = []
+    for item in sub_strand_correlations:
+        pair = [item["name"], item["strongest_negative_pair"]]
+        llm_data = insights_lookup.get(frozenset(pair), {})
+        flagged.append({
+            "pair": pair,
+            "correlation": item["correlation"],
+            "insight": llm_data.get("insight", ""),
+            "suggestion": llm_data.get("suggestion", ""),
+        })
+    return flagged
+
+
+# Output
+# [
+    # {
+    #     "pair": ["Elements and Compounds", "Acids, Bases and Indicators"],
+    #     "correlation": -0.67,
+    #     "insight": "Students who perform well in ...",
+    #     "suggestion": "Help students connect ...",
+    # }
+# ]
+
+# ------------------------------------------------------------------------ Exam performance clusters
+
+def extract_performance_feature_matrix(performances):
+    performances = list(performances)
+
+    # One query for every score of every performance, in JSON order
+    score_maps = defaultdict(lambda: defaultdict(dict))
+    facts = PerformanceScore.objects.filter(
+        entity_type="StudentExamSession",
+        entity_id__in=[perf.id for perf in performances],
+        dimension_type__in=["BloomSkill", "Grade", "Strand", "SubStrand"],
+    ).order_by("entity_id", "position").values_list("entity_id", "dimension_type", "dimension_name", "percentage")
+    for entity_id, dimension_type, name, percentage in facts:
+        score_maps[entity_id][dimension_type][name] = percentage
+
+    # Gather all possible feature names
+    all_bloom_skills = set()
+    all_grades = set()
+    all_strands = set()
+    all_sub_strands = set()
+
+    for perf in performances:
+        scores = score_maps[perf.id]
+        all_bloom_skills.update(scores["BloomSkill"])
+        all_grades.update(scores["Grade"])
+        all_strands.update(scores["Strand"])
+        all_sub_strands.update(scores["SubStrand"])
+
+    # Sorted list for consistent ordering
+    bloom_skills = sorted(all_bloom_skills)
+    grades = sorted(all_grades)
+    strands = sorted(all_strands)
+    sub_strands = sorted(all_sub_strands)
+
+    feature_columns = (
+        ["avg_score", "completion_rate", "class_avg_difference"]
+        + [f"Skill-{s}" for s in bloom_skills]
+        + [f"Grade-{g}" for g in grades]
+        + [f"Strand-{s}" for s in strands]
+        + [f"SubStrand-{s}" for s in sub_strands]
+    )
+
+    feature_matrix = []
+    id_list = []
+
+    for perf in performances:
+        scores = score_maps[perf.id]
+        row = [perf.avg_score, perf.completion_rate, perf.class_avg_difference]
+        row.extend(scores["BloomSkill"].get(s, 0.0) for s in bloom_skills)
+        row.extend(scores["Grade"].get(g, 0.0) for g in grades)
+        row.extend(scores["Strand"].get(s, 0.0) for s in strands)
+        row.extend(scores["SubStrand"].get(s, 0.0) for s in sub_strands)
+
+        feature_matrix.append(row)
+        id_list.append(perf.id)
+
+    return feature_matrix, feature_columns, id_list
+
+
+def cluster_exam_performance(performances) -> Tuple[List[int], int, Optional[np.ndarray], Optional[np.ndarray]]:
+    """
+    Clusters exam performances based on scores and expectation levels.
+
+    Args:
+        performances: A list of performance objects (each with avg_score and avg_expectation_level).
+
+    Returns:
+        Tuple of:
+        - labels: List[int] – cluster label for each performance
+        - optimal_k: int – number of clusters used
+        - reduced_data: Optional[np.ndarray] – PCA-reduced 2D data or raw data
+        - pca_components: Optional[np.ndarray] – PCA components (if used), else None
+    """
+    n_samples = len(performances)
+    if n_samples < 2:
+        # Not enough data to form clusters — assign all to one cluster
+        return [0] * n_samples, 1, None, None
+
+    # Build feature vectors from performances
+    feature_vectors = []
+    for perf in performances:
+        score = perf.avg_score or 0.0
+        level = perf.avg_expectation_level or 0.0
+        try:
+            level = float(level)
+        except ValueError:
+            level = 0.0
+        feature_vectors.append([score, level])
+
+    X = np.array(feature_vectors)
+    n_samples, n_features = X.shape
+
+    # Determine if PCA is possible
+    max_components = min(n_samples, n_features)
+    use_pca = n_features > 2 and max_components >= 2
+
+    if use_pca:
+        try:
+            pca = PCA(n_components=2)
+            reduced_data = pca.fit_transform(X)
+            pca_components = pca.components_
+        except Exception:
+            reduced_data = X
+            pca_components = None
+    else:
+        reduced_data = X
+        pca_components = None
+
+    # Determine cluster count safely
+    optimal_k = min(3, n_samples)  # Max 3 clusters or n_samples
+    if optimal_k < 1:
+        return [0] * n_samples, 1, reduced_data, pca_components
+
+    kmeans = KMeans(n_clusters=optimal_k, n_init='auto', random_state=42)
+    labels = kmeans.fit_predict(reduced_data)
+
+    return labels, optimal_k, reduced_data, pca_components
+
+
+def generate_exam_performance_clusters(exam, performances) -> Union[None, Dict[str, Any]]:
+    try:
+        # Delete past clusters and their follow-up exams
+        existing_clusters = ExamPerformanceCluster.objects.filter(
+            exam_id=exam.id)
+        cluster_ids = list(existing_clusters.values_list('id', flat=True))
+        if cluster_ids:
+            Exam.objects.filter(
+                performance_cluster_id__in=cluster_ids, type="FollowUp").delete()
+            delete_performance_scores("Cluster", cluster_ids)
+        existing_clusters.delete()
+
+        # Create clusters
+        labels, optimal_k, _, _ = cluster_exam_performance(
+            performances)
+        clusters = [[] for _ in range(optimal_k)]
+        for perf, label in zip(performances, labels):
+            clusters[label].append(perf)
+
+        for cluster_index, group in enumerate(clusters):
+            if not group:
+                continue
+
+            # Save to DB
+            cluster_obj = ExamPerformanceCluster.objects.create(
+                exam=exam,
+                cluster_label=f"Cluster {chr(65 + cluster_index)}",
+                **compute_cluster_statistics(group),
+            )
+
+            sync_performance_scores("Cluster", [cluster_obj])
+
+            # Assign this cluster to each StudentExamSessionPerformance
+            for perf in group:
+                perf.cluster = cluster_obj
+                perf.save(update_fields=["cluster"])
+
+        return None
+
+    except Exception as e:
+        return {"error": f"Cluster Generation Failed for examId {exam.id}: {e}"}
+
+
+def compute_cluster_statistics(group) -> Dict[str, Any]:
+    """The ExamPerformanceCluster fields derived from its members' performances."""
+    # Aggregate scores and expectation levels
+    all_scores = [perf.avg_score for perf in group]
+    all_expectation_levels = [
+        perf.avg_expectation_level for perf in group]
+
+    group_ids = [perf.id for perf in group]
+
+    # Aggregate Bloom skill distribution
+    bloom_skill_distribution = sorted(
+        _name_percentages(average_performance_scores(
+            "StudentExamSession", group_ids, "BloomSkill")),
+        key=lambda item: item["percentage"],
+        reverse=True
+    )
+
+    # Aggregate strand and sub-strand distribution
+    sub_strand_map = _group_by_strand(average_performance_scores(
+        "StudentExamSession", group_ids, "SubStrand"))
+    strand_distribution = []
+    for strand in average_performance_scores(
+            "StudentExamSession", group_ids, "Strand"):
+        strand_distribution.append({
+            "name": strand["name"],
+            "percentage": strand["percentage"],
+            "sub_strands": sorted(
+                sub_strand_map[strand["name"]],
+                key=lambda item: item["percentage"],
+                reverse=True
+            )
+        })
+
+    # Compute averages
+    avg_score = round(sum(all_scores) / len(all_scores),
+                      2) if all_scores else 0.0
+    # Use mode or most common expectation level
+    try:
+        avg_expectation_level = mode(all_expectation_levels)
+    except:
+        avg_expectation_level = Counter(all_expectation_levels).most_common(1)[
+            0][0] if all_expectation_levels else ""
+
+    best_question_counter = Counter()
+    worst_question_counter = Counter()
+    for perf in group:
+        best_question_counter.update(
+            json.loads(perf.best_5_answer_ids or "[]"))
+        worst_question_counter.update(
+            json.loads(perf.worst_5_answer_ids or "[]"))
+
+    # # Top N defining questions for this cluster
+    # top_best_questions = [qid for qid,
+    #                       _ in best_question_counter.most_common(5)]
+    # top_worst_questions = [qid for qid,
+    #                        _ in worst_question_counter.most_common(5)]
+
+    # Score variance
+    score_stddev = round(float(np.std(all_scores)),
+                         2) if all_scores else 0.0
+    score_range = [round(float(min(all_scores)), 2), round(
+        float(max(all_scores)), 2)] if all_scores else [0.0, 0.0]
+    score_variance = {
+        "min": score_range[0],
+        "max": score_range[1],
+        "std_dev": score_stddev,
+    }
+
+    return {
+        "avg_score": avg_score,
+        "avg_expectation_level": avg_expectation_level,
+        "bloom_skill_scores": json.dumps(bloom_skill_distribution),
+        "strand_scores": json.dumps(strand_distribution),
+        "cluster_size": len(group),
+        # "top_best_question_ids": json.dumps(top_best_questions),
+        # "top_worst_question_ids": json.dumps(top_worst_questions),
+        "score_variance": json.dumps(score_variance),
+    }
+
+
+def generate_all_cluster_follow_up_quizzes(
+        clusters, questions) -> List[Union[List[Any], Dict[str, Any]]]:
+    """One follow-up quiz LLM call per cluster, all clusters concurrently."""
+    exam_questions = [
+        {
+            "question": q.description,
+            "expected_answer": q.expected_answer,
+            "strand": q.strand,
+            "sub_strand": q.sub_strand,
+            "bloom_skill": q.bloom_skill,
+        }
+        for q in questions
+    ]
+    task_inputs = [
+        {
+            "exam_questions": exam_questions,
+            "cluster_performance": {
+                "cluster_label": cluster.cluster_label,
+                "avg_score": cluster.avg_score,
+                "cluster_size": cluster.cluster_size,
+                "avg_expectation_level": cluster.avg_expectation_level,
+                "score_variance": json.loads(cluster.score_variance or '{}'),
+                "bloom_skill_scores": json.loads(cluster.bloom_skill_scores or '[]'),
+                "strand_scores": json.loads(cluster.strand_scores or '[]'),
+                "top_best_question_ids": json.loads(cluster.top_best_question_ids or '[]'),
+                "top_worst_question_ids": json.loads(cluster.top_worst_question_ids or '[]'),
+            },
+        }
+        for cluster in clusters
+    ]
+    return run_llm_fan_out(
+        task_inputs,
+        lambda task_input: generate_llm_follow_up_quiz(**task_input),
+        fail_fast=False,
+    )
+
+
+def save_cluster_follow_up_quizzes(exam, clusters, follow_up_quiz_results) -> Union[None, Dict[str, Any]]:
+    failed_generations = []
+    for cluster, follow_up_quiz_res in zip(clusters, follow_up_quiz_results):
+        if not isinstance(follow_up_quiz_res, list):
+            failed_generations.append(
+                {"error": follow_up_quiz_res.get("error", "Unknown LLM error")})
+            continue
+        error_res = save_cluster_follow_up_quiz(
+            exam, cluster, follow_up_quiz_res)
+        if error_res:
+            failed_generations.append(error_res)
+
+    if failed_generations:
+        return {"error": "Some updates failed", "details": failed_generations}
+
+    return None
+
+
+def save_cluster_follow_up_quiz(exam, cluster, follow_up_quiz_res) -> Union[None, Dict[str, Any]]:
+    try:
+        with transaction.atomic():
+            # Create the Exam
+            follow_up_exam = Exam.objects.create(
+                start_date_time=exam.start_date_time,
+                end_date_time=exam.end_date_time,
+                status="Complete",
+                type="FollowUp",
+                source_exam=exam,
+                classroom=exam.classroom,
+                teacher=exam.teacher,
+                performance_cluster=cluster,
+            )
+
+            # create exam questions
+            ExamQuestion.objects.bulk_create([
+                ExamQuestion(
+                    number=idx+1,
+                    grade=int(item.get("grade")),
+                    strand=item.get("strand"),
+                    sub_strand=item.get("sub_strand"),
+                    bloom_skill=item.get("bloom_skill"),
+                    description=item.get("question"),
+                    expected_answer=item.get("expected_answer"),
+                    exam=follow_up_exam
+                )
+                for idx, item in enumerate(follow_up_quiz_res)
+            ])
+
+        return None
+
+    except Exception as e:
+        return {"cluster_id": cluster.id,  "reason": f"Error {str(e)}"}
+
+# ------------------------------------------------------------------------ Question exam performance
+
+
+def generate_exam_question_performance(exam, questions=None) -> Union[None, Dict[str, Any]]:
+    if questions is None:
+        questions = exam.questions.all()
+
+    if not questions:
+        return {"error": "No questions found for this exam."}
+
+    try:
+        for question in questions:
+            answers = StudentExamSessionAnswer.objects.filter(
+                question=question, session__exam=exam)
+
+            if not answers.exists():
+                continue  # No answers for this question, skip
+
+            # Compute average score
+            scored_answers = [a.score for a in answers if a.score is not None]
+            if not scored_answers:
+                avg_score = 0.0
+            else:
+                avg_score = round(sum(scored_answers) / len(scored_answers), 2)
+
+            # Score distribution per expectation level
+            level_counts = defaultdict(int)
+            level_answers_dict = defaultdict(list)
+
+            for answer in answers:
+                level = answer.expectation_level or "Unclassified"
+                level_counts[level] += 1
+                level_answers_dict[level].append(answer.id)
+
+            answers_by_level = [
+                {"name": level, "ids": ids}
+                for level, ids in level_answers_dict.items()
+                if ids
+            ]
+
+            # Filter out levels with count == 0
+            score_distribution = [
+                {"name": k, "count": v}
+                for k, v in level_counts.items()
+                if v > 0
+            ]
+
+            # Save or update ExamQuestionPerformance
+            avg_score = round(sum(scored_answers) / len(scored_answers), 2)
+            avg_expectation_level = get_answer_expectation_level(avg_score)
+            with transaction.atomic():
+                ExamQuestionPerformance.objects.update_or_create(
+                    question=question,
+                    defaults={
+                        "avg_score": avg_score,
+                        "avg_expectation_level": avg_expectation_level,
+                        "score_distribution": json.dumps(score_distribution),
+                        "answers_by_level": json.dumps(answers_by_level),
+                    }
+                )
+        return None
+
+    except Exception as e:
+        return {"error": f"Error while generating question performance: {str(e)}"}
+
+# ------------------------------------------------------------------------ Class Aggregate Performance
+
+
+def update_class_aggregate_performance(classroom) -> Union[None, Dict[str, Any]]:
+    try:
+        performances = ClassExamPerformance.objects.filter(
+            exam__classroom=classroom)
+
+        if not performances.exists():
+            return {"error": "Classroom performances not found"}
+
+        avg_score = mean([p.avg_score for p in performances])
+        performance_ids = performances.values("id")
+
+        # ==== Overall Bloom Skill Aggregation ====
+        bloom_skill_scores = _name_percentages(average_performance_scores(
+            "ClassExam", performance_ids, "BloomSkill"))
+
+        # ==== Strand-Level Aggregation ====
+        strand_scores_map = defaultdict(lambda: {
+            "avg_scores": [],
+            "score_min": [],
+            "score_max": [],
+            "score_std_dev": [],
+            "bloom_map": defaultdict(list),
+            "sub_strand_map": defaultdict(list),
+        })
+
+        for perf in performances:
+            strands = json.loads(perf.strand_analysis or "[]")
+            for strand in strands:
+                strand_name = strand["name"]
+                entry = strand_scores_map[strand_name]
+
+                entry["avg_scores"].append(strand.get("avg_score", 0))
+
+                variance = strand.get("score_variance", {})
+                entry["score_min"].append(variance.get("min", 0))
+                entry["score_max"].append(variance.get("max", 0))
+                entry["score_std_dev"].append(variance.get("std_dev", 0))
+
+                for b in strand.get("bloom_skill_scores", []):
+                    entry["bloom_map"][b["name"]].append(b["percentage"])
+
+                for sub in strand.get("sub_strand_scores", []):
+                    entry["sub_strand_map"][sub["name"]].append(
+                        sub["percentage"])
+
+        strand_scores = []
+        for strand_name, data in strand_scores_map.items():
+            strand_scores.append({
+                "name": strand_name,
+                "avg_score": round(mean(data["avg_scores"]), 2),
+                "score_variance": {
+                    "min": round(mean(data["score_min"]), 2),
+                    "max": round(mean(data["score_max"]), 2),
+                    "std_dev": round(mean(data["score_std_dev"]), 2),
+                },
+                "bloom_skill_scores": [
+                    {"name": name, "percentage": round(mean(vals), 2)}
+                    for name, vals in data["bloom_map"].items()
+                ],
+                "sub_strand_scores": [
+                    {"name": name, "percentage": round(mean(vals), 2)}
+                    for name, vals in data["sub_strand_map"].items()
+                ]
+            })
+
+        # ==== Grade-Level Aggregation ====
+        grade_scores = _name_percentages(average_performance_scores(
+            "ClassExam", performance_ids, "Grade"))
+
+        # Save or update the aggregate object
+        class_aggregate, _ = ClassAggregatePerformance.objects.update_or_create(
+            classroom=classroom,
+            defaults={
+                "exam_count": len(performances),
+                "avg_score": avg_score,
+                "bloom_skill_scores": json.dumps(bloom_skill_scores),
+                "strand_analysis": json.dumps(strand_scores),
+                "grade_scores": json.dumps(grade_scores),
+            },
+        )
+        sync_performance_scores("ClassAggregate", [class_aggregate])
+        set_classroom_mtihani_score(classroom.id, avg_score)
+
+        return None
+
+    except Exception as e:
+        return {"error": f"Error while generating class id: {classroom.id} aggregate performance: {str(e)}"}
+
+
+# ------------------------------------------------------------------------ Student Aggregate Performance
+
+STUDENT_AGGREGATE_FIELDS = [
+    "exam_count", "avg_score", "bloom_skill_scores", "grade_scores", "strand_scores",
+]
+
+
+def update_all_student_aggregates(performances) -> Union[None, Dict[str, Any]]:
+    try:
+        student_ids = performances.values_list(
+            'session__student', flat=True).distinct()
+        return update_student_aggregates(list(student_ids))
+
+    except Exception as e:
+        return {"error": f"Unexpected error during aggregate generation: {str(e)}"}
+
+
+def update_student_aggregate_performance(student) -> Union[None, Dict[str, Any]]:
+    error_res = update_student_aggregates([student.id])
+    if error_res and "details" in error_res:
+        return {"error": error_res["details"][0]["error"]}
+    return error_res
+
+
+def update_student_aggregates(student_ids: List[int]) -> Union[None, Dict[str, Any]]:
+    """
+    Rebuilds StudentAggregatePerformance for the given students from their
+    exam performances, with every student's scores averaged in one GROUP BY.
+    """
+    try:
+        performances = StudentExamSessionPerformance.objects.filter(
+            session__student_id__in=student_ids)
+
+        avg_scores = defaultdict(list)
+        for student_id, score in performances.order_by("id").values_list("session__student_id", "avg_score"):
+            avg_scores[student_id].append(score)
+
+        errors = [
+            {"student_id": student_id,
+                "error": "Classroom performances not found"}
+            for student_id in student_ids if student_id not in avg_scores
+        ]
+
+        student_of_performance = StudentExamSessionPerformance.objects.filter(
+            id=OuterRef("entity_id")).values("session__student_id")
+        scores_by_student = defaultdict(lambda: defaultdict(list))
+        for score in average_performance_scores(
+                "StudentExamSession", performances.values("id"),
+                owner=Subquery(student_of_performance)):
+            scores_by_student[score["owner"]][score["dimension_type"]].append(
+                score)
+
+        aggregate_data = {}
+        for student_id, scores in avg_scores.items():
+            student_scores = scores_by_student[student_id]
+            strand_blooms = _group_by_strand(
+                student_scores["StrandBloomSkill"])
+            strand_subs = _group_by_strand(student_scores["SubStrand"])
+
+            strand_scores = []
+            for strand in student_scores["Strand"]:
+                strand_scores.append({
+                    "name": strand["name"],
+                    "grade": strand["grade"],
+                    "percentage": strand["percentage"],
+                    "bloom_skills": strand_blooms[strand["name"]],
+                    "sub_strands": strand_subs[strand["name"]]
+                })
+
+            aggregate_data[student_id] = {
+                "exam_count": len(scores),
+                "avg_score": mean(scores),
+                "bloom_skill_scores": json.dumps(_name_percentages(student_scores["BloomSkill"])),
+                "grade_scores": json.dumps(_name_percentages(student_scores["Grade"])),
+                "strand_scores": json.dumps(strand_scores),
+            }
+
+        save_student_aggregates(aggregate_data)
+
+        if errors:
+            return {"error": "Some aggregates failed", "details": errors}
+        return None
+
+    except Exception as e:
+        return {"error": f"Error while generating student aggregate performances: {str(e)}"}
+
+
+def save_student_aggregates(aggregate_data: Dict[int, Dict[str, Any]]):
+    if not aggregate_data:
+        return
+
+    now = timezone.now()
+    existing = {
+        aggregate.student_id: aggregate
+        for aggregate in StudentAggregatePerformance.objects.filter(student_id__in=aggregate_data.keys())
+    }
+
+    to_update = []
+    to_create = []
+    for student_id, fields in aggregate_data.items():
+        aggregate = existing.get(student_id) or StudentAggregatePerformance(
+            student_id=student_id)
+        for field, value in fields.items():
+            setattr(aggregate, field, value)
+        # bulk writes skip save(), so set what it would
+        aggregate.avg_expectation_level = get_avg_expectation_level(
+            aggregate.avg_score)
+        aggregate.updated_at = now
+        (to_update if aggregate.pk else to_create).append(aggregate)
+
+    with transaction.atomic():
+        StudentAggregatePerformance.objects.bulk_update(
+            to_update, [*STUDENT_AGGREGATE_FIELDS, "avg_expectation_level", "updated_at"],
+            batch_size=BULK_UPDATE_BATCH_SIZE)
+        StudentAggregatePerformance.objects.bulk_create(
+            to_create, batch_size=BULK_UPDATE_BATCH_SIZE)
+        sync_performance_scores(
+            "StudentAggregate",
+            StudentAggregatePerformance.objects.filter(
+                student_id__in=aggregate_data.keys()).order_by("id"),
+        )
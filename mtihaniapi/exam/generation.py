@@ -0,0 +1,165 @@
+from celery import shared_task
+from django.db import transaction
+from exam.models import *
+from exam.utils import *
+from exam.views import generate_exam_question_analysis
+from gen.curriculum import get_cbc_grouped_questions
+from gen.utils import *
+from rag.models import SubStrandReference
+from rag.utils import chunk_text
+from typing import Callable, Dict, Any, List, Optional, Union
+import json
+
+# Exam generation task. Like exam.grading and exam.analysis this module is
+# only imported by Celery workers (through exam.tasks.EXAM_TASKS), so the LLM
+# clients stay out of the web processes.
+
+
+# ==================================================================== GENERATING EXAMS
+
+# =============================================
+# ==========ANY CHANGE TO THIS=================
+# =======!!!!RESTART CELERY!!!=================
+# =============================================
+@shared_task
+def generate_exam_content(exam_id, generation_config):
+    # Questions are saved as drafts as they stream in so the exam preview
+    # fills up while the rest are still being generated. Only the final
+    # swap, in one transaction, makes the exam's questions real.
+    streamed_questions = {}
+    try:
+        exam = Exam.objects.get(id=exam_id)
+
+        def save_streamed_question(item):
+            question = get_exam_question_object(exam, item)
+            question.is_draft = True
+            existing = streamed_questions.get(question.number)
+            if existing:
+                question.id = existing.id
+            question.save()
+            streamed_questions[question.number] = question
+
+        exam_res = get_llm_generated_exam(
+            strand_ids=generation_config['strand_ids'],
+            question_count=generation_config['question_count'],
+            bloom_skill_count=generation_config['bloom_skill_count'],
+            llm=generation_config.get('llm', DEFAULT_LLM),
+            on_question=save_streamed_question,
+        )
+
+        if not isinstance(exam_res, list):
+            delete_streamed_questions(exam)
+            exam.status = "Failed"
+            exam.generation_error = exam_res.get("error", "Unknown LLM error")
+            exam.save()
+            return
+
+        # The final list is authoritative: publish what streamed in, add the
+        # rest and drop every other draft, including any left behind by a
+        # generation that never finished
+        questions = [get_exam_question_object(exam, item) for item in exam_res]
+        for question in questions:
+            if question.number in streamed_questions:
+                question.id = streamed_questions[question.number].id
+
+        with transaction.atomic():
+            ExamQuestion.all_objects.filter(exam=exam, is_draft=True).exclude(
+                id__in=[q.id for q in questions if q.id]).delete()
+            ExamQuestion.all_objects.bulk_update(
+                [q for q in questions if q.id], EXAM_QUESTION_CONTENT_FIELDS,
+                batch_size=BULK_UPDATE_BATCH_SIZE)
+            ExamQuestion.objects.bulk_create([q for q in questions if not q.id])
+            generate_exam_question_analysis(exam, questions)
+
+            exam.status = "Upcoming"
+            exam.save()
+    except Exception as e:
+        # All or nothing: a failure must not leave half an exam behind
+        delete_streamed_questions(exam)
+        exam.status = "Failed"
+        exam.generation_error = f"Unexpected error: {str(e)}"
+        exam.save()
+        print(f"Background generation failed for Exam ID {exam.id}: {e}")
+
+
+EXAM_QUESTION_CONTENT_FIELDS = [
+    "number", "grade", "strand", "sub_strand", "bloom_skill", "description",
+    "expected_answer", "bloom_skill_options", "question_options", "answer_options",
+    "is_draft",
+]
+
+
+def delete_streamed_questions(exam):
+    ExamQuestion.all_objects.filter(exam=exam, is_draft=True).delete()
+
+
+def get_exam_question_object(exam, item: Dict[str, Any]) -> ExamQuestion:
+    return ExamQuestion(
+        number=item.get("number"),
+        grade=item.get("grade"),
+        strand=item.get("strand"),
+        sub_strand=item.get("sub_strand"),
+        bloom_skill=item.get("bloom_skill"),
+        description=item.get("description"),
+        expected_answer=item.get("expected_answer"),
+        bloom_skill_options=json.dumps(item.get("bloom_skills", [])),
+        question_options=json.dumps(item.get("questions", [])),
+        answer_options=json.dumps(item.get("expected_answers", [])),
+        exam=exam
+    )
+
+
+def get_llm_generated_exam(
+        strand_ids: List[int],
+        llm: Any,
+        question_count: Optional[int] = None,
+        bloom_skill_count: Optional[int] = None,
+        on_question: Optional[Callable[[Dict[str, Any]], None]] = None) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    if not strand_ids:
+        return []
+
+    try:
+        kwargs = {"strand_ids": strand_ids}
+        if question_count is not None:
+            kwargs["question_count"] = question_count
+        if bloom_skill_count is not None:
+            kwargs["bloom_skill_count"] = bloom_skill_count
+
+        grouped_questions = get_cbc_grouped_questions(**kwargs)
+        new_grouped_questions = []
+        for group in grouped_questions:
+            sample_questions = get_reference_for_sub_strand(group['sub_strand'])
+            group["sample_questions"] = sample_questions
+            
+            new_grouped_questions.append(group)
+
+        all_question_list = generate_llm_question_list(
+            grouped_question_data=new_grouped_questions,
+            llm=llm,
+            on_question=on_question,
+        )
+
+        if not isinstance(all_question_list, list):
+            return {"error": all_question_list["error"], "raw": all_question_list}
+
+        exam_questions = get_db_question_objects(
+            all_question_list=all_question_list,
+        )
+
+        return exam_questions
+
+    except Exception as e:
+        return {"error": f"LLM generation failed: {str(e)}"}
+
+
+def get_reference_for_sub_strand(sub_strand: str, chunk_size: int = 500) -> str:
+    try:
+        ref = SubStrandReference.objects.get(sub_strand=sub_strand)
+        text = ref.reference_text or ""
+        if not text:
+            return ""
+        chunks = chunk_text(text, chunk_size=chunk_size)
+        # Pick a random chunk each time
+        return random.choice(chunks)
+    except SubStrandReference.DoesNotExist:
+        return ""
@@ -0,0 +1,149 @@
+from celery import shared_task
+from collections import defaultdict
+from django.db import transaction
+from exam.models import *
+from exam.tasks import schedule_exam_task
+from exam.utils import *
+from gen.curriculum import get_rubric_prompt_text
+from gen.utils import *
+from typing import Dict, Any, List
+import json
+
+# Exam grading task, imported by Celery workers only (see exam.generation).
+
+
+# ==================================================================== GRADING EXAMS
+
+# =============================================
+# ==========ANY CHANGE TO THIS=================
+# =======!!!!RESTART CELERY!!!=================
+# =============================================
+@shared_task
+def generate_exam_grades(exam_id):
+    try:
+        exam = Exam.objects.get(id=exam_id)
+        exam.update_to_grading()
+
+        questions = exam.questions.all()
+
+        # Answers graded by an earlier (partially failed) run are kept
+        answers_by_question = defaultdict(list)
+        for ans in StudentExamSessionAnswer.objects.filter(
+                question__exam=exam, ai_score__isnull=True).only(
+                "id", "question_id", "description").order_by("id"):
+            answers_by_question[ans.question_id].append({
+                "answer_id": ans.id,
+                "answer": ans.description
+            })
+
+        grouped_answers_data = []
+        for question in questions:
+            student_answers = answers_by_question.get(question.id)
+            if not student_answers:
+                continue
+
+            grouped_answers_data.append({
+                "question_id": question.id,
+                "question": question.description,
+                "expected_answer": question.expected_answer,
+                "sub_strand": question.sub_strand,
+                "rubrics": get_rubric_prompt_text(question.sub_strand),
+                "student_answers": student_answers
+            })
+
+        # update answer scores as each question is graded
+        failed_grading_updates = []
+
+        def save_question_grades(answer_group, grades):
+            failed_grading_updates.extend(apply_answer_grades(grades))
+
+        grades_res = generate_llm_answer_grades_list(
+            grouped_answers_data=grouped_answers_data,
+            fail_fast=False,
+            on_question_graded=save_question_grades,
+        )
+
+        if not isinstance(grades_res, list):
+            exam.status = "Failed"
+            exam.generation_error = grades_res.get(
+                "error", "Unknown LLM error")
+            if "details" in grades_res:
+                exam.generation_error += f" | Questions: {json.dumps(grades_res['details'])}"
+            exam.save()
+            return
+
+        if failed_grading_updates:
+            exam.status = "Failed"
+            exam.generation_error = f"Some updates failed: {json.dumps(failed_grading_updates)}"
+            exam.save()
+            return
+
+        graded_session_ids = StudentExamSessionAnswer.objects.filter(
+            session__exam=exam, ai_score__isnull=False).values("session_id")
+        StudentExamSession.objects.filter(
+            exam=exam, id__in=graded_session_ids).update(status="Complete")
+
+        exam.status = "Analysing"
+        exam.is_grading = False
+        exam.save()
+
+    except Exception as e:
+        exam.status = "Failed"
+        exam.generation_error = f"Unexpected error: {str(e)}"
+        exam.save()
+        print(f"Background grading failed for Exam ID {exam.id}: {e}")
+
+    else:
+        # Grades are saved either way; if this fails the lifecycle task requeues it
+        try:
+            schedule_exam_task(exam.id, "analysis")
+        except Exception as e:
+            print(f"Could not queue analysis for Exam ID {exam.id}: {e}")
+
+
+def apply_answer_grades(grades: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    failed_grading_updates = []
+    scores_by_id = {}
+    for item in grades:
+        answer_id = item.get("answer_id")
+        ai_score = item.get("score")
+
+        if answer_id is None or ai_score is None:
+            failed_grading_updates.append(
+                {"answer_id": answer_id, "reason": "Missing answer_id or score"})
+            continue
+        try:
+            scores_by_id[int(answer_id)] = float(ai_score)
+        except (TypeError, ValueError):
+            failed_grading_updates.append(
+                {"answer_id": answer_id, "reason": "Invalid score"})
+
+    answers = StudentExamSessionAnswer.objects.in_bulk(list(scores_by_id))
+    now = timezone.now()
+    updated_answers = []
+    for answer_id, ai_score in scores_by_id.items():
+        answer = answers.get(answer_id)
+        if answer is None:
+            failed_grading_updates.append(
+                {"answer_id": answer_id, "reason": "Answer not found"})
+            continue
+
+        # If answer is blank, override score to 0
+        if not answer.description.strip():
+            ai_score = 0
+
+        # bulk_update skips save(), so set what it would have set
+        answer.ai_score = ai_score
+        answer.score = ai_score
+        answer.expectation_level = get_answer_expectation_level(ai_score)
+        answer.updated_at = now
+        updated_answers.append(answer)
+
+    with transaction.atomic():
+        StudentExamSessionAnswer.objects.bulk_update(
+            updated_answers,
+            ["score", "ai_score", "expectation_level", "updated_at"],
+            batch_size=BULK_UPDATE_BATCH_SIZE,
+        )
+
+    return failed_grading_updates
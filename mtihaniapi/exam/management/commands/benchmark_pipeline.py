@@ -0,0 +1,404 @@
+import json
+import os
+import platform
+import random
+import time
+import tracemalloc
+from datetime import timedelta
+from unittest import mock
+from django.contrib.auth.models import Group, User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+import exam.analysis as exam_analysis
+import exam.generation as exam_generation
+import exam.grading as exam_grading
+import exam.views as exam_views
+import learner.views as learner_views
+from exam.models import Exam, StudentExamSession, StudentExamSessionAnswer
+from gen.constants import FAKE_LLM, JSS_SCIENCE_STRANDS, APP_BLOOM_SKILL_COUNT
+from gen.metrics import PipelineMetrics, track_pipeline_metrics
+from gen.providers import FakeLLMProvider, override_llm_provider
+from learner.models import Classroom, LessonTime, Student, Teacher, TermScore, update_classroom_summary
+from learner.utils import get_avg_expectation_level
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+GEN_DATA_DIR = os.path.join(os.path.dirname(
+    os.path.dirname(os.path.dirname(BASE_DIR))), "gen", "data")
+BASELINE_FILE = os.path.join(
+    BASE_DIR, "output", "benchmark_pipeline_baseline.json")
+
+# Timing differences below these are noise, whatever the tolerance
+MIN_SECONDS_REGRESSION = 0.25
+MIN_PEAK_MB_REGRESSION = 1.0
+
+
+class Command(BaseCommand):
+    help = ("Benchmark exam generation, grading, analysis and the exam read endpoints "
+            "on seeded classrooms with the fake LLM, and compare against a stored baseline.")
+
+    def add_arguments(self, parser):
+        parser.add_argument("--classrooms", type=int, default=2)
+        parser.add_argument("--students", type=int, default=30,
+                            help="Students per classroom")
+        parser.add_argument("--questions", type=int, default=10,
+                            help="Questions per exam")
+        parser.add_argument("--bloom-skill-count", type=int,
+                            default=APP_BLOOM_SKILL_COUNT)
+        parser.add_argument("--llm-latency", type=float, default=0.0,
+                            help="Seconds per fake LLM call")
+        parser.add_argument("--repeat", type=int, default=3,
+                            help="Calls per endpoint and classroom")
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument("--baseline", type=str, default=BASELINE_FILE)
+        parser.add_argument("--tolerance", type=float, default=0.5,
+                            help="Allowed slowdown / memory growth over the baseline (0.5 = 50%%)")
+        parser.add_argument("--save-baseline", action="store_true",
+                            help="Store this run as the new baseline")
+        parser.add_argument("--check", action="store_true",
+                            help="Exit with an error when a metric regressed")
+        parser.add_argument("--output", type=str,
+                            help="Also write the results as JSON to this file")
+
+    def handle(self, *args, **options):
+        scenario = {
+            "classrooms": options["classrooms"],
+            "students": options["students"],
+            "questions": options["questions"],
+            "bloom_skill_count": options["bloom_skill_count"],
+            "llm_latency": options["llm_latency"],
+            "repeat": options["repeat"],
+            "seed": options["seed"],
+        }
+        self.rng = random.Random(options["seed"])
+        # The curriculum sampling behind generation uses the global generator
+        random.seed(options["seed"])
+
+        # A throwaway database: the benchmark never touches real data
+        old_db_name = connection.settings_dict["NAME"]
+        connection.creation.create_test_db(
+            verbosity=0, autoclobber=True, serialize=False)
+        tracemalloc.start()
+        try:
+            fake_llm = FakeLLMProvider(
+                latency_seconds=options["llm_latency"], jitter_seconds=0)
+            # The benchmark runs every stage itself rather than via Celery
+            with override_llm_provider(fake_llm), \
+                    mock.patch.object(exam_grading, "schedule_exam_task"):
+                results = self.run_benchmark(scenario)
+        finally:
+            tracemalloc.stop()
+            connection.creation.destroy_test_db(old_db_name, verbosity=0)
+
+        report = {
+            "scenario": scenario,
+            "created_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "stages": results,
+        }
+
+        baseline = self.load_baseline(options["baseline"], scenario)
+        regressions = self.print_report(
+            results, baseline, options["tolerance"])
+
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+
+        if options["save_baseline"]:
+            os.makedirs(os.path.dirname(options["baseline"]), exist_ok=True)
+            with open(options["baseline"], "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+            self.stdout.write(self.style.SUCCESS(
+                f"Baseline written to {options['baseline']}"))
+
+        if regressions and options["check"]:
+            raise CommandError(
+                f"{len(regressions)} metric(s) regressed: {', '.join(regressions)}")
+
+    # ------------------------------------------------------------------ seeding
+
+    def load_seed_data(self):
+        def load(name):
+            with open(os.path.join(GEN_DATA_DIR, name), encoding="utf-8") as f:
+                return json.load(f)
+        # Student averages and answer texts from the sample class and exam
+        return load("classroom.json"), load("exam.json")
+
+    def seed_classrooms(self, scenario):
+        students_data, exam_data = self.load_seed_data()
+        teacher_group, _ = Group.objects.get_or_create(name="teacher")
+        student_group, _ = Group.objects.get_or_create(name="student")
+
+        teacher_user = User.objects.create(username="benchmark-teacher")
+        teacher_user.groups.add(teacher_group)
+        teacher = Teacher.objects.create(
+            name="Benchmark Teacher", phone_no="0700000000", user=teacher_user)
+
+        now = timezone.now()
+        grade_7_strand_ids = [strand["id"]
+                              for strand in JSS_SCIENCE_STRANDS if strand["grade"] == 7]
+        classrooms = []
+        for classroom_idx in range(scenario["classrooms"]):
+            classroom = Classroom.objects.create(
+                name=f"Benchmark {classroom_idx + 1}", subject="Integrated Science",
+                school_name="Benchmark School", school_address="Nairobi",
+                grade=7, teacher=teacher)
+            LessonTime.objects.create(
+                classroom=classroom, day="Monday", time="09:00")
+
+            users = User.objects.bulk_create([
+                User(username=f"benchmark-{classroom_idx}-{idx}",
+                     first_name=f"Student {idx + 1}")
+                for idx in range(scenario["students"])
+            ])
+            student_group.user_set.add(*users)
+
+            students = []
+            for idx, user in enumerate(users):
+                avg_score = students_data[idx % len(
+                    students_data)]["avg_score"]
+                students.append(Student(
+                    name=user.first_name, classroom=classroom, user=user, status="Active",
+                    avg_score=avg_score, avg_expectation_level=get_avg_expectation_level(avg_score)))
+            students = Student.objects.bulk_create(students)
+            TermScore.objects.bulk_create([
+                TermScore(student=student, grade=7, term=1, score=student.avg_score,
+                          expectation_level=get_avg_expectation_level(student.avg_score))
+                for student in students
+            ])
+            # As create_classroom does
+            update_classroom_summary(classroom.id)
+
+            generation_config = {
+                "strand_ids": grade_7_strand_ids,
+                "question_count": scenario["questions"],
+                "bloom_skill_count": scenario["bloom_skill_count"],
+                "llm": FAKE_LLM,
+            }
+            exam = Exam.objects.create(
+                start_date_time=now - timedelta(hours=2),
+                end_date_time=now - timedelta(hours=1),
+                classroom=classroom,
+                teacher=teacher,
+                generation_config=json.dumps(generation_config),
+            )
+            StudentExamSession.objects.bulk_create([
+                StudentExamSession(student=student, exam=exam) for student in students
+            ])
+            classrooms.append({
+                "classroom": classroom,
+                "exam": exam,
+                "students": students,
+                "generation_config": generation_config,
+            })
+
+        return teacher_user, classrooms, exam_data
+
+    def submit_answers(self, exam, students, exam_data):
+        """Answers every question for every student, more often right the higher their average."""
+        # By number: streamed questions are saved in whatever order they finish
+        questions = list(exam.questions.order_by("number"))
+        sessions = {
+            session.student_id: session
+            for session in StudentExamSession.objects.filter(exam=exam)
+        }
+        answers = []
+        for student in students:
+            session = sessions[student.id]
+            for question in questions:
+                roll = self.rng.random() * 100
+                if roll < student.avg_score:
+                    description = question.expected_answer
+                elif roll < student.avg_score + 10:
+                    description = ""
+                else:
+                    description = self.rng.choice(exam_data)["expected_answer"]
+                answers.append(StudentExamSessionAnswer(
+                    session=session, question=question, description=description))
+        StudentExamSessionAnswer.objects.bulk_create(answers)
+        StudentExamSession.objects.filter(exam=exam).update(
+            status="Grading", end_date_time=exam.end_date_time)
+
+    # ------------------------------------------------------------------ measuring
+
+    def measure(self, results, stage, func, calls=1):
+        metrics = PipelineMetrics(default_stage=stage)
+        tracemalloc.reset_peak()
+        memory_before = tracemalloc.get_traced_memory()[0]
+        start = time.perf_counter()
+        with track_pipeline_metrics(metrics):
+            res = func()
+        seconds = time.perf_counter() - start
+        peak_mb = (tracemalloc.get_traced_memory()[1] - memory_before) / 2**20
+
+        totals = metrics.totals()
+        stats = results.setdefault(stage, {
+            "calls": 0, "seconds": 0.0, "queries": 0, "llm_calls": 0, "peak_mb": 0.0})
+        stats["calls"] += calls
+        stats["seconds"] += seconds
+        stats["queries"] += totals["db_queries"]
+        stats["llm_calls"] += totals["llm_calls"]
+        stats["peak_mb"] = max(stats["peak_mb"], peak_mb)
+        return res
+
+    def get_endpoint(self, path, view, user, params):
+        factory = APIRequestFactory(SERVER_NAME="localhost")
+
+        def call():
+            request = factory.get(path, params)
+            force_authenticate(request, user=user)
+            response = view(request)
+            if response.status_code != 200:
+                raise CommandError(
+                    f"{path} returned {response.status_code}: {response.data}")
+            # Encoding the body is part of the cost
+            if hasattr(response, "render"):
+                response.render()
+            return response
+        return call
+
+    def run_benchmark(self, scenario):
+        teacher_user, classrooms, exam_data = self.seed_classrooms(scenario)
+        results = {}
+
+        for entry in classrooms:
+            exam = entry["exam"]
+            self.measure(results, "generation", lambda: exam_generation.generate_exam_content(
+                exam.id, entry["generation_config"]))
+            self.check_exam_status(exam, "Upcoming")
+
+            self.submit_answers(exam, entry["students"], exam_data)
+            Exam.objects.filter(id=exam.id).update(status="Grading")
+            self.measure(results, "grading",
+                         lambda: exam_grading.generate_exam_grades(exam.id))
+            self.check_exam_status(exam, "Analysing")
+
+            self.measure(results, "analysis",
+                         lambda: exam_analysis.generate_exam_analysis(exam.id))
+            self.check_exam_status(exam, "Complete")
+            Exam.objects.filter(id=exam.id).update(is_published=True)
+
+        for entry in classrooms:
+            exam = entry["exam"]
+            student = entry["students"][0]
+            session = StudentExamSession.objects.get(
+                exam=exam, student=student)
+            endpoints = {
+                "get_user_exams (teacher)": self.get_endpoint(
+                    "/api/exam/get-user-exams", exam_views.get_user_exams, teacher_user,
+                    {"classroom_id": entry["classroom"].id}),
+                "get_user_exams (student)": self.get_endpoint(
+                    "/api/exam/get-user-exams", exam_views.get_user_exams, student.user, {}),
+                "get_user_classrooms (teacher)": self.get_endpoint(
+                    "/api/learner/get-user-classrooms", learner_views.get_user_classrooms,
+                    teacher_user, {}),
+                "get_user_classrooms (student)": self.get_endpoint(
+                    "/api/learner/get-user-classrooms", learner_views.get_user_classrooms,
+                    student.user, {}),
+                "get_class_exam_performance": self.get_endpoint(
+                    "/api/exam/get-class-exam-performance", exam_views.get_class_exam_performance,
+                    teacher_user, {"exam_id": exam.id}),
+                "get_percentile_performances": self.get_endpoint(
+                    "/api/exam/get-percentile-performances", exam_views.get_percentile_performances,
+                    teacher_user, {"exam_id": exam.id}),
+                "get_student_exam_performance": self.get_endpoint(
+                    "/api/exam/get-student-exam-performance", exam_views.get_student_exam_performance,
+                    teacher_user, {"student_session_id": session.id}),
+                "get_class_performance_aggregate": self.get_endpoint(
+                    "/api/exam/get-class-performance-aggregate",
+                    exam_views.get_class_performance_aggregate,
+                    teacher_user, {"classroom_id": entry["classroom"].id}),
+                "get_student_performance_aggregate": self.get_endpoint(
+                    "/api/exam/get-student-performance-aggregate",
+                    exam_views.get_student_performance_aggregate,
+                    teacher_user, {"student_id": student.id}),
+            }
+            for name, call in endpoints.items():
+                def repeated(call=call):
+                    for _ in range(scenario["repeat"]):
+                        call()
+                self.measure(results, name, repeated, calls=scenario["repeat"])
+
+        for stats in results.values():
+            stats["seconds_per_call"] = round(
+                stats["seconds"] / stats["calls"], 4)
+            stats["queries_per_call"] = round(
+                stats["queries"] / stats["calls"], 2)
+            stats["seconds"] = round(stats["seconds"], 4)
+            stats["peak_mb"] = round(stats["peak_mb"], 2)
+        return results
+
+    def check_exam_status(self, exam, expected_status):
+        exam.refresh_from_db()
+        if exam.status != expected_status:
+            raise CommandError(
+                f"Exam {exam.id} ended up {exam.status} instead of {expected_status}: "
+                f"{exam.generation_error}")
+
+    # ------------------------------------------------------------------ reporting
+
+    def load_baseline(self, baseline_file, scenario):
+        if not os.path.exists(baseline_file):
+            self.stdout.write(self.style.WARNING(
+                f"No baseline at {baseline_file}; run with --save-baseline to store one."))
+            return None
+        with open(baseline_file, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("scenario") != scenario:
+            self.stdout.write(self.style.WARNING(
+                f"Baseline scenario {baseline.get('scenario')} differs from this run; not comparing."))
+            return None
+        return baseline
+
+    def print_report(self, results, baseline, tolerance):
+        """Prints the results next to the baseline and returns the regressed metrics."""
+        regressions = []
+        header = (f"{'stage':<36}{'calls':>6}{'s/call':>10}{'queries/call':>14}"
+                  f"{'llm calls':>11}{'peak MB':>10}  vs baseline")
+        self.stdout.write(header)
+        self.stdout.write("-" * len(header))
+
+        for stage, stats in results.items():
+            base = (baseline or {}).get("stages", {}).get(stage)
+            comparison = ""
+            if base:
+                changes = []
+                stage_regressions = []
+                if base["seconds_per_call"]:
+                    ratio = stats["seconds_per_call"] / \
+                        base["seconds_per_call"]
+                    changes.append(f"time x{ratio:.2f}")
+                if (stats["seconds_per_call"] > base["seconds_per_call"] * (1 + tolerance)
+                        and stats["seconds"] - base["seconds"] > MIN_SECONDS_REGRESSION):
+                    stage_regressions.append(f"{stage} time")
+                if stats["queries_per_call"] != base["queries_per_call"]:
+                    changes.append(
+                        f"queries {base['queries_per_call']} -> {stats['queries_per_call']}")
+                if stats["queries_per_call"] > base["queries_per_call"]:
+                    stage_regressions.append(f"{stage} queries")
+                if (stats["peak_mb"] > base["peak_mb"] * (1 + tolerance)
+                        and stats["peak_mb"] - base["peak_mb"] > MIN_PEAK_MB_REGRESSION):
+                    changes.append(
+                        f"peak {base['peak_mb']} -> {stats['peak_mb']} MB")
+                    stage_regressions.append(f"{stage} memory")
+                comparison = ", ".join(changes)
+                if stage_regressions:
+                    comparison = self.style.ERROR(
+                        f"{comparison} REGRESSED")
+                regressions.extend(stage_regressions)
+
+            self.stdout.write(
+                f"{stage:<36}{stats['calls']:>6}{stats['seconds_per_call']:>10.4f}"
+                f"{stats['queries_per_call']:>14}{stats['llm_calls']:>11}"
+                f"{stats['peak_mb']:>10.2f}  {comparison}")
+
+        if baseline:
+            if regressions:
+                self.stdout.write(self.style.ERROR(
+                    f"Regressions: {', '.join(regressions)}"))
+            else:
+                self.stdout.write(self.style.SUCCESS(
+                    "No regressions against the baseline."))
+        return regressions
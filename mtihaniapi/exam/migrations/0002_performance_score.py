@@ -0,0 +1,57 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:24
+
+from django.db import migrations, models
+from exam.utils import extract_performance_score_facts
+
+PERFORMANCE_SCORE_SOURCES = [
+    ("StudentExamSession", "StudentExamSessionPerformance"),
+    ("StudentAggregate", "StudentAggregatePerformance"),
+    ("ClassExam", "ClassExamPerformance"),
+    ("ClassAggregate", "ClassAggregatePerformance"),
+    ("Cluster", "ExamPerformanceCluster"),
+]
+
+
+def backfill_performance_scores(apps, schema_editor):
+    PerformanceScore = apps.get_model("exam", "PerformanceScore")
+    # Later migrations add fields; only fill the ones this model has
+    field_names = {field.name for field in PerformanceScore._meta.fields}
+    PerformanceScore.objects.all().delete()
+    for entity_type, model_name in PERFORMANCE_SCORE_SOURCES:
+        model = apps.get_model("exam", model_name)
+        facts = [
+            PerformanceScore(
+                entity_type=entity_type, entity_id=entity.id,
+                **{key: value for key, value in fact.items() if key in field_names})
+            for entity in model.objects.order_by("id").iterator()
+            for fact in extract_performance_score_facts(entity)
+        ]
+        PerformanceScore.objects.bulk_create(facts, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PerformanceScore',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('entity_type', models.CharField(choices=[('StudentExamSession', 'StudentExamSession'), ('StudentAggregate', 'StudentAggregate'), ('ClassExam', 'ClassExam'), ('ClassAggregate', 'ClassAggregate'), ('Cluster', 'Cluster')], max_length=25)),
+                ('entity_id', models.BigIntegerField()),
+                ('dimension_type', models.CharField(choices=[('BloomSkill', 'BloomSkill'), ('Grade', 'Grade'), ('Strand', 'Strand'), ('SubStrand', 'SubStrand'), ('StrandBloomSkill', 'StrandBloomSkill')], max_length=25)),
+                ('dimension_name', models.CharField(max_length=255)),
+                ('strand', models.CharField(blank=True, max_length=255)),
+                ('grade', models.IntegerField(blank=True, null=True)),
+                ('percentage', models.FloatField()),
+            ],
+            options={
+                'indexes': [models.Index(fields=['entity_type', 'entity_id'], name='exam_perfor_entity__57c9c5_idx'), models.Index(fields=['entity_type', 'dimension_type', 'strand', 'dimension_name'], name='exam_perfor_entity__2107b1_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_performance_scores,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:31
+
+from django.db import migrations, models
+import importlib
+
+# Rebuild the score rows so they get their positions
+backfill_performance_scores = importlib.import_module(
+    "exam.migrations.0002_performance_score").backfill_performance_scores
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0002_performance_score'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='classexamperformance',
+            name='insights_avg_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='performancescore',
+            name='position',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_performance_scores,
+                             migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:35
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0003_incremental_analysis'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='running_task',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='running_task_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='scheduled_task',
+            field=models.CharField(blank=True, max_length=50, null=True),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='scheduled_task_args',
+            field=models.TextField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='exam',
+            name='scheduled_task_run_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0004_exam_task_scheduling'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='exam',
+            name='analysis_stages',
+            field=models.TextField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.1.7 on 2026-10-18 16:45
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0005_exam_analysis_stages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('task', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('Running', 'Running'), ('Complete', 'Complete'), ('Failed', 'Failed')], default='Running', max_length=25)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('started_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('duration_seconds', models.FloatField(blank=True, null=True)),
+                ('llm_calls', models.IntegerField(default=0)),
+                ('llm_seconds', models.FloatField(default=0)),
+                ('llm_errors', models.IntegerField(default=0)),
+                ('cache_hits', models.IntegerField(default=0)),
+                ('input_tokens', models.IntegerField(default=0)),
+                ('output_tokens', models.IntegerField(default=0)),
+                ('db_queries', models.IntegerField(default=0)),
+                ('db_seconds', models.FloatField(default=0)),
+                ('rows_written', models.IntegerField(default=0)),
+                ('stages', models.TextField(blank=True, null=True)),
+                ('llm_call_log', models.TextField(blank=True, null=True)),
+                ('exam', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pipeline_runs', to='exam.exam')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['exam', '-started_at'], name='exam_pipeli_exam_id_dad8e8_idx'), models.Index(fields=['task', '-started_at'], name='exam_pipeli_task_f01719_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('exam', '0006_pipeline_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='examquestion',
+            name='is_draft',
+            field=models.BooleanField(default=False),
+        ),
+    ]
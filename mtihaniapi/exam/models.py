@@ -1,5 +1,5 @@
 from django.db import models
-from exam.utils import EXAM_STATUSES, EXPECTATION_LEVELS, EXAM_TYPES, generate_unique_code, get_answer_expectation_level, get_avg_expectation_level
+from exam.utils import EXAM_STATUSES, EXPECTATION_LEVELS, EXAM_TYPES, PERFORMANCE_SCORE_ENTITIES, PIPELINE_RUN_STATUSES, SCORE_DIMENSIONS, generate_unique_code, get_answer_expectation_level, get_avg_expectation_level
 from learner.models import Classroom, Student, Teacher
 from django.utils import timezone
 
@@ -36,10 +36,32 @@ class Exam(models.Model):
         related_name="follow_up_exams"
     )
 
+    # Per-exam task scheduling, owned by exam.tasks
+    scheduled_task = models.CharField(max_length=50, blank=True, null=True)
+    scheduled_task_args = models.TextField(blank=True, null=True)
+    scheduled_task_run_at = models.DateTimeField(blank=True, null=True)
+    running_task = models.CharField(max_length=50, blank=True, null=True)
+    running_task_started_at = models.DateTimeField(blank=True, null=True)
+
+    # Per-stage status and timing of the last analysis run (JSON)
+    analysis_stages = models.TextField(blank=True, null=True)
+
+    SCHEDULING_FIELDS = {
+        "scheduled_task", "scheduled_task_args", "scheduled_task_run_at",
+        "running_task", "running_task_started_at",
+    }
+
     def save(self, *args, **kwargs):
         if self.start_date_time and self.end_date_time:
             delta = self.end_date_time - self.start_date_time
             self.duration_min = int(delta.total_seconds() // 60)
+        # A plain save() from a long running task must not overwrite requests
+        # scheduled since the exam was loaded
+        if not self._state.adding and not kwargs.get("update_fields") and not args:
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name not in self.SCHEDULING_FIELDS
+            ]
         super().save(*args, **kwargs)
 
     def refresh_status(self):
@@ -64,6 +86,13 @@ class Exam(models.Model):
         self.save(update_fields=["status", "is_analysing"])
 
 
+class ExamQuestionManager(models.Manager):
+    # Drafts are questions streamed in during generation, only the preview
+    # (ExamQuestion.all_objects) sees them until the exam is saved for real
+    def get_queryset(self):
+        return super().get_queryset().filter(is_draft=False)
+
+
 class ExamQuestion(models.Model):
     number = models.IntegerField()
     grade = models.IntegerField()
@@ -79,6 +108,10 @@ class ExamQuestion(models.Model):
     tr_expected_answer = models.TextField(blank=True, null=True)
     exam = models.ForeignKey(
         Exam, on_delete=models.CASCADE, related_name='questions')
+    is_draft = models.BooleanField(default=False)
+
+    objects = ExamQuestionManager()
+    all_objects = models.Manager()
 
 
 class ExamQuestionAnalysis(models.Model):
@@ -208,6 +241,8 @@ class ClassExamPerformance(models.Model):
     strand_analysis = models.TextField(blank=True)
     strand_student_mastery = models.TextField(blank=True)
     flagged_sub_strands = models.TextField(blank=True)
+    # Class average the LLM insights were generated from
+    insights_avg_score = models.FloatField(null=True, blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -276,3 +311,74 @@ class ClassAggregatePerformance(models.Model):
     def save(self, *args, **kwargs):
         self.avg_expectation_level = get_avg_expectation_level(self.avg_score)
         super().save(*args, **kwargs)
+
+
+class PerformanceScore(models.Model):
+    """
+    One percentage from a performance record's score breakdown, kept in sync
+    with the record's JSON fields so aggregations can run as SQL GROUP BYs.
+    entity_id is the id of the record named by entity_type.
+    """
+    entity_type = models.CharField(
+        max_length=25, choices=PERFORMANCE_SCORE_ENTITIES)
+    entity_id = models.BigIntegerField()
+    dimension_type = models.CharField(max_length=25, choices=SCORE_DIMENSIONS)
+    dimension_name = models.CharField(max_length=255)
+    # Parent strand of SubStrand and StrandBloomSkill rows
+    strand = models.CharField(max_length=255, blank=True)
+    grade = models.IntegerField(null=True, blank=True)
+    percentage = models.FloatField()
+    # Order within the entity's JSON, per dimension type
+    position = models.IntegerField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["entity_type", "entity_id"]),
+            models.Index(fields=["entity_type", "dimension_type",
+                         "strand", "dimension_name"]),
+        ]
+
+    def __str__(self):
+        return f"{self.entity_type} {self.entity_id} {self.dimension_type}: {self.dimension_name} ({self.percentage})"
+
+
+class PipelineRun(models.Model):
+    """
+    Instrumentation of one background task run on an exam (exam.tasks):
+    wall time, LLM calls and tokens, cache hits, queries and rows written,
+    in total and per stage (gen.metrics).
+    """
+    exam = models.ForeignKey(
+        Exam, on_delete=models.CASCADE, related_name="pipeline_runs")
+    task = models.CharField(max_length=50)
+    status = models.CharField(
+        max_length=25, choices=PIPELINE_RUN_STATUSES, default="Running")
+    error = models.TextField(null=True, blank=True)
+    started_at = models.DateTimeField(default=timezone.now)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration_seconds = models.FloatField(null=True, blank=True)
+
+    llm_calls = models.IntegerField(default=0)
+    llm_seconds = models.FloatField(default=0)
+    llm_errors = models.IntegerField(default=0)
+    cache_hits = models.IntegerField(default=0)
+    input_tokens = models.IntegerField(default=0)
+    output_tokens = models.IntegerField(default=0)
+    db_queries = models.IntegerField(default=0)
+    db_seconds = models.FloatField(default=0)
+    rows_written = models.IntegerField(default=0)
+
+    # JSON: {stage: {status, started_at, duration_seconds, <counters>}}
+    stages = models.TextField(blank=True, null=True)
+    # JSON: [{stage, model, seconds, input_tokens, output_tokens, cached, error}]
+    llm_call_log = models.TextField(blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["exam", "-started_at"]),
+            models.Index(fields=["task", "-started_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.task} on exam {self.exam_id} ({self.status})"
+
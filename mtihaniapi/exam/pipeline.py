@@ -0,0 +1,160 @@
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+from django.db import connections
+from django.utils import timezone
+from gen.metrics import get_current_metrics, submit_in_context, track_database_queries, track_stage
+
+# A small in-process DAG runner for multi-stage background tasks (exam
+# analysis). Worker stages run on a thread pool and must not write to the
+# database, they are meant for LLM calls and number crunching on data their
+# dependencies loaded. All other stages run one at a time on the calling
+# thread, interleaved with the worker stages in flight.
+
+
+class PipelineStage:
+    def __init__(self, name: str, func: Callable[[Dict[str, Any]], Any],
+                 depends_on: Iterable[str] = (), in_worker: bool = False):
+        """
+        func(inputs) gets the outputs of depends_on by stage name. A stage
+        fails by returning an error dict ({"error": ...}) or raising.
+        """
+        self.name = name
+        self.func = func
+        self.depends_on = list(depends_on)
+        self.in_worker = in_worker
+
+
+def is_stage_error(res: Any) -> bool:
+    return isinstance(res, dict) and "error" in res
+
+
+def _run_stage(stage: PipelineStage, inputs: Dict[str, Any]) -> Tuple[Any, str, float]:
+    started_at = timezone.now().isoformat()
+    start = time.perf_counter()
+    try:
+        with track_stage(stage.name):
+            res = stage.func(inputs)
+    except Exception as e:
+        res = {"error": f"Error in {stage.name}: {str(e)}"}
+    return res, started_at, round(time.perf_counter() - start, 3)
+
+
+def _run_worker_stage(stage: PipelineStage, inputs: Dict[str, Any]) -> Tuple[Any, str, float]:
+    try:
+        with track_database_queries():
+            return _run_stage(stage, inputs)
+    finally:
+        # Connections are per thread; don't leave any open in the pool
+        connections.close_all()
+
+
+def run_pipeline(
+        stages: List[PipelineStage],
+        max_workers: int = 4,
+        on_progress: Optional[Callable[[Dict[str, Dict[str, Any]]], None]] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Dict[str, Any]]]:
+    """
+    Runs stages as soon as their dependencies are Complete. After the first
+    failure no new stage starts; running ones finish and the rest are
+    Skipped. Returns (outputs, reports) keyed by stage name, where a report
+    holds the stage's status, start time, duration and error, plus its
+    query and LLM counts when gen.metrics is tracking the run.
+    on_progress(reports) is called on the calling thread after every change.
+    """
+    names = {stage.name for stage in stages}
+    for stage in stages:
+        unknown = set(stage.depends_on) - names
+        if unknown:
+            raise ValueError(
+                f"Stage {stage.name} depends on unknown stages: {sorted(unknown)}")
+
+    reports = {
+        stage.name: {
+            "status": "Pending",
+            "depends_on": stage.depends_on,
+            "in_worker": stage.in_worker,
+            "started_at": None,
+            "duration_seconds": None,
+            "error": None,
+        }
+        for stage in stages
+    }
+    outputs = {}
+    pending = list(stages)
+    running = {}
+    failed = False
+
+    def progress():
+        if on_progress:
+            on_progress(reports)
+
+    def finish(stage, res, started_at, duration):
+        nonlocal failed
+        report = reports[stage.name]
+        report["started_at"] = started_at
+        report["duration_seconds"] = duration
+        if is_stage_error(res):
+            report["status"] = "Failed"
+            report["error"] = res
+            failed = True
+        else:
+            report["status"] = "Complete"
+            outputs[stage.name] = res
+        metrics = get_current_metrics()
+        if metrics:
+            metrics.record_stage_run(
+                stage.name, report["status"], started_at, duration)
+            report.update(metrics.stage_stats(stage.name))
+        print(f"Pipeline stage {stage.name}: {report['status']} in {duration}s")
+        progress()
+
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        while True:
+            ready = [] if failed else [
+                stage for stage in pending
+                if all(reports[dep]["status"] == "Complete" for dep in stage.depends_on)
+            ]
+
+            # Start every ready worker stage before running anything inline
+            for stage in [s for s in ready if s.in_worker]:
+                pending.remove(stage)
+                reports[stage.name]["status"] = "Running"
+                inputs = {dep: outputs[dep] for dep in stage.depends_on}
+                running[submit_in_context(
+                    executor, _run_worker_stage, stage, inputs)] = stage
+            if any(s.in_worker for s in ready):
+                progress()
+
+            inline = [s for s in ready if not s.in_worker]
+            if inline:
+                stage = inline[0]
+                pending.remove(stage)
+                reports[stage.name]["status"] = "Running"
+                progress()
+                inputs = {dep: outputs[dep] for dep in stage.depends_on}
+                finish(stage, *_run_stage(stage, inputs))
+                continue
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                stage = running.pop(future)
+                try:
+                    res, started_at, duration = future.result()
+                except Exception as e:
+                    res, started_at, duration = {
+                        "error": f"Error in {stage.name}: {str(e)}"}, None, None
+                finish(stage, res, started_at, duration)
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+    if pending:
+        for stage in pending:
+            reports[stage.name]["status"] = "Skipped"
+        progress()
+
+    return outputs, reports
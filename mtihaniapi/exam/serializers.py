@@ -1,7 +1,11 @@
 # exam/serializers.py
 import json
+from typing import Dict, Optional
 
+from django.core.cache import cache
+from django.db import models
 from rest_framework import serializers
+from rest_framework.renderers import JSONRenderer
 from .models import *
 
 
@@ -51,6 +55,8 @@ class ExamSerializer(serializers.ModelSerializer):
     classroom_name = serializers.CharField(source='classroom.name')
     analysis = ExamQuestionAnalysisSerializer()
     student_id = serializers.SerializerMethodField()
+    session_id = serializers.SerializerMethodField()
+    session_status = serializers.SerializerMethodField()
 
     class Meta:
         model = Exam
@@ -58,12 +64,18 @@ class ExamSerializer(serializers.ModelSerializer):
             'id', 'start_date_time', 'end_date_time', 'status', 'is_published',
             'code', 'duration_min', 'generation_error',
             'classroom_id', 'classroom_name', 'analysis', 'created_at',
-            'student_id'  # << shows only when relevant
+            # << show only when relevant (annotated by get_user_exams)
+            'student_id', 'session_id', 'session_status'
         ]
 
     def get_student_id(self, exam):
-        student_map = self.context.get("student_exam_sessions", {})
-        return student_map.get(exam.id)
+        return getattr(exam, "session_student_id", None)
+
+    def get_session_id(self, exam):
+        return getattr(exam, "session_id", None)
+
+    def get_session_status(self, exam):
+        return getattr(exam, "session_status", None)
 
 
 class ExamQuestionSerializer(serializers.ModelSerializer):
@@ -172,6 +184,8 @@ JSON_FILED_DEFAULTS = {
     "strand_scores": [],
     "best_5_answer_ids": [],
     "worst_5_answer_ids": [],
+    "stages": {},
+    "llm_call_log": [],
 }
 
 
@@ -247,6 +261,30 @@ class ClassExamPerformanceSerializer(serializers.ModelSerializer):
         return parse_json_field(obj, "flagged_sub_strands")
 
 
+def get_performance_answers(performances) -> Dict[int, StudentExamSessionAnswer]:
+    """
+    Fetches the best and worst answers of all the performances in one query,
+    keyed by answer id, for the "performance_answers" serializer context.
+    """
+    answer_ids = set()
+    for performance in performances:
+        answer_ids.update(parse_json_field(performance, "best_5_answer_ids"))
+        answer_ids.update(parse_json_field(performance, "worst_5_answer_ids"))
+    if not answer_ids:
+        return {}
+    return StudentExamSessionAnswer.objects.select_related('question').in_bulk(answer_ids)
+
+
+class StudentExamSessionPerformanceListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        performances = data.all() if isinstance(data, models.manager.BaseManager) else data
+        if "performance_answers" not in self.context:
+            performances = list(performances)
+            self.context["performance_answers"] = get_performance_answers(
+                performances)
+        return super().to_representation(performances)
+
+
 class StudentExamSessionPerformanceSerializer(serializers.ModelSerializer):
     exam_id = serializers.SerializerMethodField()
     student_id = serializers.SerializerMethodField()
@@ -280,13 +318,15 @@ class StudentExamSessionPerformanceSerializer(serializers.ModelSerializer):
             'created_at',
             'updated_at',
         ]
+        # Lists fetch every performance's best and worst answers at once
+        list_serializer_class = StudentExamSessionPerformanceListSerializer
 
     # Related fields
     def get_exam_id(self, obj):
-        return obj.session.exam.id if obj.session and obj.session.exam else None
+        return obj.session.exam_id if obj.session else None
 
     def get_student_id(self, obj):
-        return obj.session.student.id if obj.session and obj.session.student else None
+        return obj.session.student_id if obj.session else None
 
     def get_student_name(self, obj):
         return obj.session.student.name if obj.session and obj.session.student else None
@@ -301,17 +341,21 @@ class StudentExamSessionPerformanceSerializer(serializers.ModelSerializer):
         return parse_json_field(obj, "strand_scores")
 
     def get_best_5_answers(self, obj):
-        ids = parse_json_field(obj, "best_5_answer_ids")
-        answers = StudentExamSessionAnswer.objects.filter(id__in=ids)
-        # Maintain original order
-        answers_dict = {a.id: a for a in answers}
-        ordered_answers = [answers_dict[i] for i in ids if i in answers_dict]
-        return FullStudentExamSessionAnswerSerializer(ordered_answers, many=True).data
+        return self._get_ordered_answers(obj, "best_5_answer_ids")
 
     def get_worst_5_answers(self, obj):
-        ids = parse_json_field(obj, "worst_5_answer_ids")
-        answers = StudentExamSessionAnswer.objects.filter(id__in=ids)
-        answers_dict = {a.id: a for a in answers}
+        return self._get_ordered_answers(obj, "worst_5_answer_ids")
+
+    def _get_ordered_answers(self, obj, field):
+        answers_dict = self.context.get("performance_answers")
+        if answers_dict is None:
+            # Single performance: one query covers both best and worst
+            if getattr(self, "_answers_performance_id", None) != obj.pk:
+                self._answers_performance_id = obj.pk
+                self._answers = get_performance_answers([obj])
+            answers_dict = self._answers
+        ids = parse_json_field(obj, field)
+        # Maintain original order
         ordered_answers = [answers_dict[i] for i in ids if i in answers_dict]
         return FullStudentExamSessionAnswerSerializer(ordered_answers, many=True).data
 
@@ -484,3 +528,56 @@ class StudentAggregatePerformanceSerializer(serializers.ModelSerializer):
 
     def get_strand_scores(self, obj):
         return parse_json_field(obj, "strand_scores")
+
+
+class PipelineRunSerializer(serializers.ModelSerializer):
+    exam_code = serializers.ReadOnlyField(source='exam.code')
+    classroom_id = serializers.ReadOnlyField(source='exam.classroom_id')
+    stages = serializers.SerializerMethodField()
+    llm_call_log = serializers.SerializerMethodField()
+
+    class Meta:
+        model = PipelineRun
+        fields = [
+            "id", "exam_id", "exam_code", "classroom_id", "task", "status", "error",
+            "started_at", "finished_at", "duration_seconds",
+            "llm_calls", "llm_seconds", "llm_errors", "cache_hits",
+            "input_tokens", "output_tokens", "db_queries", "db_seconds", "rows_written",
+            "stages", "llm_call_log",
+        ]
+
+    def get_stages(self, obj):
+        return parse_json_field(obj, "stages")
+
+    def get_llm_call_log(self, obj):
+        return parse_json_field(obj, "llm_call_log")
+
+
+# Renderings are immutable per (object, updated_at), the TTL only bounds
+# how long superseded ones linger in the cache
+RENDERED_PERFORMANCE_CACHE_SECONDS = 60 * 60 * 24
+
+
+def render_performance(serializer_class, queryset) -> Optional[bytes]:
+    """
+    JSON bytes of serializer_class for the one object in queryset, or None
+    when there is none. Renderings are cached by object and updated_at, so a
+    hit reads only those two columns and skips decoding and re-encoding the
+    JSON fields. Every save moves updated_at, which is a miss. Only for
+    serializers whose output depends on nothing but the object's own row.
+    Uses the default cache, which is per process unless CACHE_REDIS_URL
+    is set (see settings.CACHES): renderings are never stale either way,
+    but a local-memory cache is warmed separately by every web worker.
+    """
+    row = queryset.values_list("pk", "updated_at").first()
+    if row is None:
+        return None
+
+    pk, updated_at = row
+    key = f"rendered:{serializer_class.__name__}:{pk}:{updated_at.isoformat()}"
+    rendered = cache.get(key)
+    if rendered is None:
+        rendered = JSONRenderer().render(
+            serializer_class(queryset.get(pk=pk)).data)
+        cache.set(key, rendered, RENDERED_PERFORMANCE_CACHE_SECONDS)
+    return rendered
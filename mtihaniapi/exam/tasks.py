@@ -0,0 +1,214 @@
+import json
+from datetime import timedelta
+from typing import Any, List, Optional
+from celery import shared_task
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from mtihaniapi import settings
+from exam.models import Exam, PipelineRun
+from gen.metrics import PipelineMetrics, track_pipeline_metrics
+
+# Per-exam task scheduling. Each exam runs at most one of these at a time.
+# Requests are written to the exam row (scheduled_task*) and a delayed
+# run_scheduled_exam_task picks them up once the debounce window has passed;
+# requests arriving while one is waiting or running are coalesced into it.
+
+EXAM_TASKS = {
+    "generation": "exam.generation.generate_exam_content",
+    "grading": "exam.grading.generate_exam_grades",
+    "analysis": "exam.analysis.generate_exam_analysis",
+    "incremental_analysis": "exam.analysis.generate_exam_incremental_analysis",
+}
+
+# A waiting request of a later kind is replaced by an earlier kind's request,
+# e.g. a full analysis covers any pending incremental analysis
+EXAM_TASK_PRECEDENCE = ["generation", "grading",
+                        "analysis", "incremental_analysis"]
+
+# Asking for these while the same task is running is a no-op: the running
+# task already covers the request. Analyses re-run, since scores changed.
+EXAM_TASKS_COALESCED_INTO_RUN = {"generation", "grading"}
+
+
+def _merge_task_args(task_name: str, pending_args: List[Any], new_args: List[Any]) -> List[Any]:
+    if task_name == "incremental_analysis":
+        # args: [answer_ids]
+        answer_ids = list(dict.fromkeys(
+            (pending_args[0] if pending_args else []) + new_args[0]))
+        return [answer_ids]
+    return new_args
+
+
+def schedule_exam_task(exam_id: int, task_name: str, args: Optional[List[Any]] = None,
+                       debounce_seconds: Optional[float] = None) -> None:
+    """
+    Requests task_name for an exam. The task runs debounce_seconds after the
+    last request for the exam (trailing edge), and never alongside another
+    scheduled task of the same exam.
+    """
+    if task_name not in EXAM_TASKS:
+        raise ValueError(f"Unknown exam task: {task_name}")
+
+    args = list(args or [])
+    if debounce_seconds is None:
+        debounce_seconds = settings.EXAM_TASK_DEBOUNCE_SECONDS.get(
+            task_name, 0)
+
+    with transaction.atomic():
+        exam = Exam.objects.select_for_update().get(id=exam_id)
+        now = timezone.now()
+
+        if (task_name in EXAM_TASKS_COALESCED_INTO_RUN
+                and exam.running_task == task_name and not _is_stale(exam, now)):
+            return
+
+        pending = exam.scheduled_task
+        if pending == task_name:
+            args = _merge_task_args(
+                task_name, json.loads(exam.scheduled_task_args or "[]"), args)
+        elif pending and EXAM_TASK_PRECEDENCE.index(pending) < EXAM_TASK_PRECEDENCE.index(task_name):
+            task_name = pending
+            args = json.loads(exam.scheduled_task_args or "[]")
+
+        exam.scheduled_task = task_name
+        exam.scheduled_task_args = json.dumps(args)
+        exam.scheduled_task_run_at = now + timedelta(seconds=debounce_seconds)
+        exam.save(update_fields=[
+            "scheduled_task", "scheduled_task_args", "scheduled_task_run_at"])
+
+        transaction.on_commit(lambda: run_scheduled_exam_task.apply_async(
+            (exam_id,), countdown=debounce_seconds))
+
+
+def _is_stale(exam, now) -> bool:
+    started_at = exam.running_task_started_at
+    return started_at is None or now - started_at > timedelta(
+        seconds=settings.EXAM_TASK_STALE_AFTER_SECONDS)
+
+
+@shared_task
+def run_scheduled_exam_task(exam_id: int):
+    with transaction.atomic():
+        try:
+            exam = Exam.objects.select_for_update().get(id=exam_id)
+        except Exam.DoesNotExist:
+            return
+        now = timezone.now()
+
+        if not exam.scheduled_task:
+            # Already picked up by an earlier message
+            return
+        if exam.scheduled_task_run_at and exam.scheduled_task_run_at > now:
+            # A later request moved the deadline; its own message runs it
+            return
+        if exam.running_task and not _is_stale(exam, now):
+            # One in-flight run per exam: check back once it is likely done
+            transaction.on_commit(lambda: run_scheduled_exam_task.apply_async(
+                (exam_id,), countdown=settings.EXAM_TASK_RETRY_SECONDS))
+            return
+
+        task_name = exam.scheduled_task
+        args = json.loads(exam.scheduled_task_args or "[]")
+        exam.running_task = task_name
+        exam.running_task_started_at = now
+        exam.scheduled_task = None
+        exam.scheduled_task_args = None
+        exam.scheduled_task_run_at = None
+        exam.save(update_fields=[
+            "running_task", "running_task_started_at", "scheduled_task",
+            "scheduled_task_args", "scheduled_task_run_at"])
+
+    run = PipelineRun.objects.create(exam_id=exam_id, task=task_name)
+    metrics = PipelineMetrics(default_stage=task_name)
+    error = None
+    try:
+        with track_pipeline_metrics(metrics):
+            import_string(EXAM_TASKS[task_name])(exam_id, *args)
+    except Exception as e:
+        error = str(e)
+        raise
+    finally:
+        finish_pipeline_run(run, metrics, error)
+
+        Exam.objects.filter(id=exam_id, running_task=task_name).update(
+            running_task=None, running_task_started_at=None)
+
+        # Anything requested during the run goes next
+        next_run_at = Exam.objects.filter(id=exam_id).exclude(
+            scheduled_task=None).values_list("scheduled_task_run_at", flat=True).first()
+        if next_run_at:
+            countdown = max((next_run_at - timezone.now()).total_seconds(), 0)
+            run_scheduled_exam_task.apply_async(
+                (exam_id,), countdown=countdown)
+
+
+def finish_pipeline_run(run: PipelineRun, metrics: PipelineMetrics, error: Optional[str] = None) -> None:
+    # The exam tasks report failure on the exam rather than by raising
+    if error is None:
+        exam_status, exam_error = Exam.objects.filter(id=run.exam_id).values_list(
+            "status", "generation_error").first() or (None, None)
+        if exam_status == "Failed":
+            error = exam_error or "Failed"
+
+    run.finished_at = timezone.now()
+    run.duration_seconds = round(
+        (run.finished_at - run.started_at).total_seconds(), 3)
+    run.status = "Failed" if error else "Complete"
+    run.error = error
+    for field, value in metrics.totals().items():
+        setattr(run, field, value)
+    run.stages = json.dumps(metrics.stages())
+    run.llm_call_log = json.dumps(metrics.llm_calls)
+    run.save()
+
+
+# The task that moves an exam on from each waiting status
+STRANDED_EXAM_TASKS = {
+    "Generating": "generation",
+    "Grading": "grading",
+    "Analysing": "analysis",
+}
+
+
+@shared_task
+def advance_exam_lifecycle():
+    """
+    Periodic (Celery beat) exam lifecycle: moves standard exams
+    Upcoming -> Ongoing -> Grading with set-based updates and queues grading
+    once for every exam that just closed.
+    """
+    now = timezone.now()
+    standard_exams = Exam.objects.filter(type="Standard")
+
+    with transaction.atomic():
+        closed_ids = list(
+            standard_exams.select_for_update(skip_locked=True)
+            .filter(status__in=["Upcoming", "Ongoing"], end_date_time__lt=now)
+            .values_list("id", flat=True))
+        Exam.objects.filter(id__in=closed_ids, status__in=["Upcoming", "Ongoing"]).update(
+            status="Grading", updated_at=now)
+        started_count = standard_exams.filter(
+            status="Upcoming", start_date_time__lte=now, end_date_time__gte=now,
+        ).update(status="Ongoing", updated_at=now)
+
+    for exam_id in closed_ids:
+        schedule_exam_task(exam_id, "grading")
+
+    # Exams left waiting with nothing queued and nothing running, or only a
+    # run that died (e.g. a killed worker), from before this scheduler or
+    # after a lost broker message
+    stale_before = now - timedelta(seconds=settings.EXAM_TASK_STALE_AFTER_SECONDS)
+    stranded = standard_exams.filter(
+        status__in=STRANDED_EXAM_TASKS, scheduled_task=None).filter(
+        Q(running_task=None) | Q(running_task_started_at=None) |
+        Q(running_task_started_at__lt=stale_before))
+    stranded_count = 0
+    for exam_id, status, generation_config in stranded.values_list("id", "status", "generation_config"):
+        task_name = STRANDED_EXAM_TASKS[status]
+        args = [json.loads(generation_config or "{}")] if task_name == "generation" else []
+        schedule_exam_task(exam_id, task_name, args)
+        stranded_count += 1
+
+    return {"started": started_count, "closed": len(closed_ids), "requeued": stranded_count}
@@ -1,3 +1,1172 @@
-from django.test import TestCase
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from datetime import timedelta
+from django.contrib.auth.models import Group, User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from mtihaniapi import settings
+from unittest.mock import patch
+from rest_framework.test import APIClient
+from exam.analysis import *
+from exam.generation import generate_exam_content
+from exam.grading import apply_answer_grades, generate_exam_grades
+from exam.models import *
+from exam.pipeline import PipelineStage, run_pipeline
+from exam.tasks import *
+from exam.serializers import (
+    ClassAggregatePerformanceSerializer, ClassExamPerformanceSerializer,
+    StudentExamSessionPerformanceSerializer)
+from gen.providers import FakeLLMProvider, override_llm_provider
+import gen.utils
+from learner.models import Classroom, Student, Teacher
 
-# Create your tests here.
+USER_EXAMS_URL = "/api/exam/get-user-exams"
+CLASS_EXAM_PERFORMANCE_URL = "/api/exam/get-class-exam-performance"
+CLASS_PERFORMANCE_AGGREGATE_URL = "/api/exam/get-class-performance-aggregate"
+
+
+class StudentExamSessionPerformanceSerializerQueryTests(TestCase):
+    """Best and worst answers are fetched once per list, not per performance."""
+
+    @classmethod
+    def setUpTestData(cls):
+        classroom = Classroom.objects.create(
+            name="Class", subject="Integrated Science", school_name="School",
+            school_address="Nairobi", grade=7)
+        now = timezone.now()
+        exam = Exam.objects.create(
+            start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+            classroom=classroom)
+        questions = [
+            ExamQuestion.objects.create(
+                exam=exam, number=number, grade=7, strand="Strand", sub_strand="Sub Strand",
+                bloom_skill="Remembering", description=f"Question {number}", expected_answer="Answer")
+            for number in range(1, 7)
+        ]
+
+        for idx in range(6):
+            student = Student.objects.create(
+                name=f"Student {idx}", classroom=classroom)
+            session = StudentExamSession.objects.create(
+                student=student, exam=exam)
+            answer_ids = [
+                StudentExamSessionAnswer.objects.create(
+                    session=session, question=question, description="Answer", score=question.number % 4).id
+                for question in questions
+            ]
+            StudentExamSessionPerformance.objects.create(
+                session=session, avg_score=50,
+                best_5_answer_ids=json.dumps(answer_ids[:5][::-1]),
+                worst_5_answer_ids=json.dumps(answer_ids[1:]))
+
+    def serialize(self, count):
+        performances = StudentExamSessionPerformance.objects.select_related(
+            "session__student").order_by("id")[:count]
+        with CaptureQueriesContext(connection) as ctx:
+            data = StudentExamSessionPerformanceSerializer(
+                performances, many=True).data
+        return len(ctx.captured_queries), data
+
+    def test_list_queries_do_not_grow_with_performances(self):
+        two_count, _ = self.serialize(2)
+        six_count, data = self.serialize(6)
+
+        # performances, then every best and worst answer with its question
+        self.assertEqual(two_count, 2)
+        self.assertEqual(six_count, 2)
+
+        performance = StudentExamSessionPerformance.objects.order_by(
+            "id").first()
+        self.assertEqual(
+            [answer["id"] for answer in data[0]["best_5_answers"]],
+            json.loads(performance.best_5_answer_ids))
+        self.assertEqual(
+            [answer["id"] for answer in data[0]["worst_5_answers"]],
+            json.loads(performance.worst_5_answer_ids))
+        self.assertEqual(
+            data[0]["best_5_answers"][0]["question_description"], "Question 5")
+
+    def test_single_performance_fetches_answers_once(self):
+        performance = StudentExamSessionPerformance.objects.select_related(
+            "session__student").first()
+        with self.assertNumQueries(1):
+            data = StudentExamSessionPerformanceSerializer(performance).data
+        self.assertEqual(len(data["best_5_answers"]), 5)
+        self.assertEqual(len(data["worst_5_answers"]), 5)
+
+
+def create_graded_exam(student_count=12, strands=2, sub_strands=3):
+    """A closed exam whose every answer is scored, ready for analysis."""
+    teacher = Teacher.objects.create(
+        name="Teacher", phone_no="0700000000", user=User.objects.create(username="teacher"))
+    classroom = Classroom.objects.create(
+        name="Class", subject="Integrated Science", school_name="School",
+        school_address="Nairobi", grade=7, teacher=teacher)
+    now = timezone.now()
+    exam = Exam.objects.create(
+        start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+        classroom=classroom, teacher=teacher, status="Grading")
+    questions = []
+    for strand in range(strands):
+        for sub_strand in range(sub_strands):
+            for skill in ("Remembering", "Applying"):
+                questions.append(ExamQuestion.objects.create(
+                    exam=exam, number=len(questions) + 1, grade=7,
+                    strand=f"Strand {strand}", sub_strand=f"Sub Strand {strand}.{sub_strand}",
+                    bloom_skill=skill, description=f"Question {len(questions) + 1}",
+                    expected_answer="Answer"))
+
+    for idx in range(student_count):
+        student = Student.objects.create(
+            name=f"Student {idx}", classroom=classroom)
+        session = StudentExamSession.objects.create(
+            student=student, exam=exam, status="Complete")
+        for question in questions:
+            StudentExamSessionAnswer.objects.create(
+                session=session, question=question, description="Answer",
+                score=(idx * 7 + question.number * 3 + idx * question.number) % 4 + 1)
+    return exam
+
+
+class IncrementalAnalysisParityTests(TestCase):
+    """Re-analysing one edited answer matches a full analysis, LLM text aside."""
+
+    def setUp(self):
+        self.exam = create_graded_exam()
+        self.provider = override_llm_provider(
+            FakeLLMProvider(latency_seconds=0, jitter_seconds=0))
+        self.provider.__enter__()
+        self.addCleanup(self.provider.__exit__, None, None, None)
+
+    def snapshot(self):
+        class_perf = ClassExamPerformance.objects.get(exam=self.exam)
+        aggregate = ClassAggregatePerformance.objects.get(
+            classroom=self.exam.classroom)
+
+        strand_analysis = json.loads(class_perf.strand_analysis)
+        for strand in strand_analysis:
+            strand.pop("insights")
+            strand.pop("suggestions")
+        flagged_sub_strands = [
+            (item["pair"], item["correlation"])
+            for item in json.loads(class_perf.flagged_sub_strands)
+        ]
+        return {
+            "class_exam": {
+                field: getattr(class_perf, field) for field in [
+                    "avg_score", "avg_expectation_level", "student_count",
+                    "expectation_level_distribution", "score_distribution",
+                    "score_variance", "bloom_skill_scores", "grade_scores",
+                    "strand_student_mastery",
+                ]
+            },
+            "strand_analysis": strand_analysis,
+            "flagged_sub_strands": flagged_sub_strands,
+            "class_aggregate": {
+                field: getattr(aggregate, field) for field in [
+                    "exam_count", "avg_score", "avg_expectation_level",
+                    "grade_scores", "bloom_skill_scores", "strand_analysis",
+                ]
+            },
+        }
+
+    def test_incremental_analysis_matches_full_analysis(self):
+        generate_exam_analysis(self.exam.id)
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.status, "Complete", self.exam.generation_error)
+        before = self.snapshot()
+        class_perf = ClassExamPerformance.objects.get(exam=self.exam)
+        insights = {
+            strand["name"]: (strand["insights"], strand["suggestions"])
+            for strand in json.loads(class_perf.strand_analysis)
+        }
+        pair_insights = {
+            frozenset(item["pair"]): item["insight"]
+            for item in json.loads(class_perf.flagged_sub_strands)
+        }
+
+        answer = StudentExamSessionAnswer.objects.filter(
+            session__exam=self.exam, score=1).order_by("id").first()
+        answer.score = answer.tr_score = 4
+        answer.save()
+
+        generate_exam_incremental_analysis(self.exam.id, [answer.id])
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.status, "Complete", self.exam.generation_error)
+        incremental = self.snapshot()
+        class_perf = ClassExamPerformance.objects.get(exam=self.exam)
+        # Below the drift threshold, so no full re-analysis
+        self.assertEqual(class_perf.insights_avg_score, before["class_exam"]["avg_score"])
+        self.assertEqual({
+            strand["name"]: (strand["insights"], strand["suggestions"])
+            for strand in json.loads(class_perf.strand_analysis)
+        }, insights)
+        # Pairs still flagged keep their insight, newly flagged ones have none yet
+        for item in json.loads(class_perf.flagged_sub_strands):
+            self.assertEqual(
+                item["insight"], pair_insights.get(frozenset(item["pair"]), ""))
+
+        generate_exam_analysis(self.exam.id)
+        full = self.snapshot()
+
+        self.assertNotEqual(incremental["strand_analysis"], before["strand_analysis"])
+        self.assertNotEqual(incremental["class_aggregate"], before["class_aggregate"])
+        for key in full:
+            self.assertEqual(incremental[key], full[key], key)
+
+
+
+class SingleSubStrandAnalysisTests(TestCase):
+    """An exam on one sub strand has no correlations to flag, in either analysis."""
+
+    def setUp(self):
+        provider = override_llm_provider(
+            FakeLLMProvider(latency_seconds=0, jitter_seconds=0))
+        provider.__enter__()
+        self.addCleanup(provider.__exit__, None, None, None)
+
+    def test_no_sub_strands_are_flagged(self):
+        exam = create_graded_exam(strands=1, sub_strands=1)
+
+        generate_exam_analysis(exam.id)
+        exam.refresh_from_db()
+        self.assertEqual(exam.status, "Complete", exam.generation_error)
+        class_perf = ClassExamPerformance.objects.get(exam=exam)
+        self.assertEqual(json.loads(class_perf.flagged_sub_strands), [])
+
+        answer = StudentExamSessionAnswer.objects.filter(
+            session__exam=exam, score=1).order_by("id").first()
+        answer.score = answer.tr_score = 4
+        answer.save()
+
+        generate_exam_incremental_analysis(exam.id, [answer.id])
+        exam.refresh_from_db()
+        self.assertEqual(exam.status, "Complete", exam.generation_error)
+        class_perf.refresh_from_db()
+        self.assertEqual(json.loads(class_perf.flagged_sub_strands), [])
+
+def get_question_item(number):
+    return {
+        "number": number, "grade": 7, "strand": "Strand", "sub_strand": "Sub Strand",
+        "bloom_skill": "Remembering", "description": f"Question {number}",
+        "expected_answer": "Answer",
+    }
+
+
+class WorkerKilled(BaseException):
+    """What a killed worker looks like to the task: nothing it can handle."""
+
+
+class GenerateExamContentTests(TestCase):
+    """Streamed questions stay drafts until the whole exam is saved."""
+
+    def setUp(self):
+        classroom = Classroom.objects.create(
+            name="Class", subject="Integrated Science", school_name="School",
+            school_address="Nairobi", grade=7)
+        now = timezone.now()
+        self.exam = Exam.objects.create(
+            start_date_time=now + timedelta(hours=1), end_date_time=now + timedelta(hours=2),
+            classroom=classroom)
+        self.config = {"strand_ids": [1], "question_count": 3, "bloom_skill_count": 1}
+
+    def generate(self, llm_generated_exam):
+        with patch("exam.generation.get_llm_generated_exam", llm_generated_exam):
+            generate_exam_content(self.exam.id, self.config)
+        self.exam.refresh_from_db()
+
+    def test_killed_generation_leaves_only_drafts(self):
+        def killed_mid_stream(on_question, **kwargs):
+            on_question(get_question_item(1))
+            on_question(get_question_item(2))
+            raise WorkerKilled()
+
+        with self.assertRaises(WorkerKilled):
+            self.generate(killed_mid_stream)
+
+        self.assertEqual(self.exam.status, "Generating")
+        self.assertFalse(self.exam.questions.exists())
+        self.assertEqual(
+            ExamQuestion.all_objects.filter(exam=self.exam, is_draft=True).count(), 2)
+
+        # The rerun replaces the drafts with the final questions
+        def streamed(on_question, **kwargs):
+            items = [get_question_item(number) for number in (1, 2, 3)]
+            for item in items:
+                on_question(item)
+            return items
+
+        self.generate(streamed)
+        self.assertEqual(self.exam.status, "Upcoming")
+        self.assertEqual(
+            list(self.exam.questions.order_by("number").values_list("number", flat=True)), [1, 2, 3])
+        self.assertFalse(ExamQuestion.all_objects.filter(is_draft=True).exists())
+
+    def test_failed_generation_deletes_drafts(self):
+        def failed_mid_stream(on_question, **kwargs):
+            on_question(get_question_item(1))
+            return {"error": "LLM unavailable"}
+
+        self.generate(failed_mid_stream)
+        self.assertEqual(self.exam.status, "Failed")
+        self.assertFalse(ExamQuestion.all_objects.filter(exam=self.exam).exists())
+
+
+class RunPipelineTests(SimpleTestCase):
+    """Independent stages overlap, and a failure stops what depends on it."""
+
+    def test_worker_stages_run_concurrently(self):
+        barrier = threading.Barrier(2, timeout=5)
+
+        def worker(value):
+            def func(inputs):
+                # Both workers must be running at once to get past the barrier
+                barrier.wait()
+                return inputs["load"] + value
+            return func
+
+        outputs, reports = run_pipeline([
+            PipelineStage("load", lambda inputs: 1),
+            PipelineStage("left", worker(10), ["load"], in_worker=True),
+            PipelineStage("right", worker(20), ["load"], in_worker=True),
+            PipelineStage("save", lambda inputs: inputs["left"] + inputs["right"],
+                          ["left", "right"]),
+        ], max_workers=2)
+
+        self.assertEqual(outputs["save"], 32)
+        self.assertEqual({r["status"] for r in reports.values()}, {"Complete"})
+
+    def test_failure_skips_the_stages_not_yet_started(self):
+        progress = []
+
+        def fail(inputs):
+            raise ValueError("No performances")
+
+        outputs, reports = run_pipeline([
+            PipelineStage("load", lambda inputs: 1),
+            PipelineStage("insights", lambda inputs: ["insight"], ["load"], in_worker=True),
+            PipelineStage("statistics", fail, ["load"]),
+            PipelineStage("save", lambda inputs: None, ["statistics"]),
+            PipelineStage("clusters", lambda inputs: [], ["load"]),
+        ], on_progress=lambda reports: progress.append(
+            {name: report["status"] for name, report in reports.items()}))
+
+        statuses = {name: report["status"] for name, report in reports.items()}
+        self.assertEqual(statuses, {
+            "load": "Complete", "insights": "Complete", "statistics": "Failed",
+            "save": "Skipped", "clusters": "Skipped",
+        })
+        self.assertEqual(
+            reports["statistics"]["error"], {"error": "Error in statistics: No performances"})
+        self.assertNotIn("save", outputs)
+        self.assertEqual(progress[-1], statuses)
+
+    def test_unknown_dependency_is_rejected(self):
+        with self.assertRaises(ValueError):
+            run_pipeline([PipelineStage("save", lambda inputs: None, ["load"])])
+
+
+class ComputeSessionPerformancesTests(TestCase):
+    """Every session's performance comes out of one pass over the exam's answers."""
+
+    @classmethod
+    def setUpTestData(cls):
+        classroom = Classroom.objects.create(
+            name="Class", subject="Integrated Science", school_name="School",
+            school_address="Nairobi", grade=7)
+        now = timezone.now()
+        cls.exam = Exam.objects.create(
+            start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+            classroom=classroom, status="Analysing")
+        questions = [
+            ExamQuestion.objects.create(
+                exam=cls.exam, number=number, grade=grade, strand=strand, sub_strand=sub_strand,
+                bloom_skill=bloom_skill, description=f"Question {number}", expected_answer="Answer")
+            for number, grade, strand, sub_strand, bloom_skill in [
+                (1, 7, "Strand A", "Sub A1", "Remembering"),
+                (2, 7, "Strand A", "Sub A2", "Applying"),
+                (3, 8, "Strand B", "Sub B1", "Remembering"),
+                (4, 8, "Strand B", "Sub B1", "Understanding"),
+            ]
+        ]
+
+        cls.sessions = []
+        cls.answer_ids = []
+        for idx, scores in enumerate([(4, 2, 1, 0), (None, None, None, None)]):
+            student = Student.objects.create(
+                name=f"Student {idx}", classroom=classroom)
+            session = StudentExamSession.objects.create(
+                student=student, exam=cls.exam)
+            cls.sessions.append(session)
+            cls.answer_ids.append([
+                StudentExamSessionAnswer.objects.create(
+                    session=session, question=question, score=score,
+                    description="" if question.number == 4 else "Answer").id
+                for question, score in zip(questions, scores)
+            ])
+
+    def test_performance_fields(self):
+        with self.assertNumQueries(1):
+            performances, failed = compute_session_performances(
+                StudentExamSessionAnswer.objects.filter(session__exam=self.exam))
+
+        graded, ungraded = self.sessions
+        self.assertEqual(failed, [
+            {"session_id": ungraded.id, "reason": "Missing total possible score"}])
+        self.assertEqual(list(performances), [graded.id])
+
+        performance = performances[graded.id]
+        self.assertEqual(performance["avg_score"], 43.75)
+        self.assertEqual(performance["completion_rate"], 75.0)
+        self.assertEqual(
+            (performance["questions_answered"], performance["questions_unanswered"]), (3, 1))
+        self.assertEqual(json.loads(performance["grade_scores"]), [
+            {"name": "7", "percentage": 75.0}, {"name": "8", "percentage": 12.5}])
+        self.assertEqual(json.loads(performance["bloom_skill_scores"]), [
+            {"name": "Remembering", "percentage": 62.5},
+            {"name": "Applying", "percentage": 50.0},
+            {"name": "Understanding", "percentage": 0.0},
+        ])
+        self.assertEqual(json.loads(performance["strand_scores"]), [
+            {
+                "name": "Strand A (G7)", "grade": 7, "percentage": 75.0,
+                "sub_strands": [{"name": "Sub A1", "percentage": 100.0},
+                                {"name": "Sub A2", "percentage": 50.0}],
+                "bloom_skills": [{"name": "Remembering", "percentage": 100.0},
+                                 {"name": "Applying", "percentage": 50.0}],
+            },
+            {
+                "name": "Strand B (G8)", "grade": 8, "percentage": 12.5,
+                "sub_strands": [{"name": "Sub B1", "percentage": 12.5}],
+                "bloom_skills": [{"name": "Remembering", "percentage": 25.0},
+                                 {"name": "Understanding", "percentage": 0.0}],
+            },
+        ])
+        answer_ids = self.answer_ids[0]
+        self.assertEqual(json.loads(performance["best_5_answer_ids"]), answer_ids)
+        self.assertEqual(json.loads(performance["worst_5_answer_ids"]), answer_ids[::-1])
+
+    def test_sessions_are_computed_independently(self):
+        performances, _ = compute_session_performances(
+            StudentExamSessionAnswer.objects.filter(session__exam=self.exam))
+        alone, _ = compute_session_performances(
+            StudentExamSessionAnswer.objects.filter(session=self.sessions[0]))
+        self.assertEqual(alone, performances)
+
+
+class PerformanceScoreTests(TestCase):
+    """Score facts mirror the JSON score fields and average like them in SQL."""
+
+    def setUp(self):
+        self.exam = create_graded_exam(student_count=4)
+        self.assertIsNone(generate_all_exam_session_performances(self.exam))
+        self.performances = StudentExamSessionPerformance.objects.filter(
+            session__exam=self.exam).order_by("id")
+
+    def test_facts_follow_the_json_fields(self):
+        performance = self.performances.first()
+        facts = PerformanceScore.objects.filter(
+            entity_type="StudentExamSession", entity_id=performance.id)
+        self.assertEqual(
+            list(facts.filter(dimension_type="Strand").order_by("position").values_list(
+                "dimension_name", "grade", "percentage")),
+            [(s["name"], s["grade"], s["percentage"]) for s in json.loads(performance.strand_scores)])
+
+        # Rewriting a performance replaces its facts
+        fact_count = facts.count()
+        answer = performance.session.answers.filter(score__lt=4).first()
+        answer.score = 4
+        answer.save()
+        self.assertIsNone(generate_student_exam_performance(performance.session))
+        performance.refresh_from_db()
+        self.assertEqual(facts.count(), fact_count)
+        self.assertEqual(
+            list(facts.filter(dimension_type="BloomSkill").order_by("position").values_list(
+                "dimension_name", "percentage")),
+            [(s["name"], s["percentage"]) for s in json.loads(performance.bloom_skill_scores)])
+
+    def test_averages_match_the_json_fields(self):
+        expected = defaultdict(list)
+        for performance in self.performances:
+            for score in json.loads(performance.bloom_skill_scores):
+                expected[score["name"]].append(score["percentage"])
+
+        averages = average_performance_scores(
+            "StudentExamSession", self.performances.values("id"), "BloomSkill")
+        self.assertEqual(
+            {score["name"]: score["percentage"] for score in averages},
+            {name: round(mean(values), 2) for name, values in expected.items()})
+        self.assertEqual(
+            [score["name"] for score in averages],
+            [score["name"] for score in json.loads(self.performances.first().bloom_skill_scores)])
+
+
+    def test_averages_follow_the_first_entity_then_position(self):
+        facts = {1: ["Applying", "Creating", "Remembering"], 2: ["Analysing", "Creating"]}
+        PerformanceScore.objects.bulk_create([
+            PerformanceScore(
+                entity_type="Cluster", entity_id=entity_id, dimension_type="BloomSkill",
+                dimension_name=name, percentage=50, position=position * 100000)
+            for entity_id, names in facts.items()
+            for position, name in enumerate(names)
+        ])
+
+        averages = average_performance_scores("Cluster", [1, 2], "BloomSkill")
+        self.assertEqual(
+            [score["name"] for score in averages],
+            ["Applying", "Creating", "Remembering", "Analysing"])
+
+@patch("gen.utils.get_token_count_from_str", lambda text, llm_model: len(text) // 4)
+class BulkQuestionPersistenceTests(TestCase):
+    """Generated and follow-up questions are saved all at once or not at all."""
+
+    def setUp(self):
+        self.exam = create_graded_exam(student_count=3)
+        provider = override_llm_provider(
+            FakeLLMProvider(latency_seconds=0, jitter_seconds=0))
+        provider.__enter__()
+        self.addCleanup(provider.__exit__, None, None, None)
+
+    def test_generated_exam_is_saved_with_its_analysis(self):
+        now = timezone.now()
+        exam = Exam.objects.create(
+            start_date_time=now + timedelta(hours=1), end_date_time=now + timedelta(hours=2),
+            classroom=self.exam.classroom)
+
+        generate_exam_content(
+            exam.id, {"strand_ids": [1, 2, 3], "question_count": 10, "bloom_skill_count": 3})
+        exam.refresh_from_db()
+
+        self.assertEqual(exam.status, "Upcoming", exam.generation_error)
+        self.assertEqual(
+            list(exam.questions.order_by("number").values_list("number", flat=True)),
+            list(range(1, 11)))
+        self.assertEqual(exam.analysis.question_count, 10)
+
+    def test_follow_up_quiz_is_saved_atomically(self):
+        cluster = ExamPerformanceCluster.objects.create(
+            exam=self.exam, cluster_label="A", avg_score=50)
+        item = {
+            "question": "Follow up question", "expected_answer": "Answer", "grade": "7",
+            "strand": "Strand 0", "sub_strand": "Sub Strand 0.0", "bloom_skill": "Applying",
+        }
+
+        res = save_cluster_follow_up_quiz(
+            self.exam, cluster, [item, {**item, "grade": "Grade 7"}])
+        self.assertEqual(res["cluster_id"], cluster.id)
+        self.assertFalse(Exam.objects.filter(source_exam=self.exam).exists())
+
+        self.assertIsNone(save_cluster_follow_up_quiz(self.exam, cluster, [item, item]))
+        follow_up = Exam.objects.get(source_exam=self.exam)
+        self.assertEqual((follow_up.type, follow_up.performance_cluster_id), ("FollowUp", cluster.id))
+        self.assertEqual(
+            list(follow_up.questions.values_list("number", flat=True)), [1, 2])
+
+
+SCHEDULED_TASK_CALLS = []
+
+
+def record_scheduled_task(exam_id, *args):
+    SCHEDULED_TASK_CALLS.append((exam_id, *args))
+
+
+@patch.dict("exam.tasks.EXAM_TASKS", {name: "exam.tests.record_scheduled_task" for name in EXAM_TASKS})
+@patch("exam.tasks.run_scheduled_exam_task.apply_async")
+class ScheduleExamTaskTests(TestCase):
+    """One debounced task per exam, with later requests folded into the waiting one."""
+
+    def setUp(self):
+        classroom = Classroom.objects.create(
+            name="Class", subject="Integrated Science", school_name="School",
+            school_address="Nairobi", grade=7)
+        now = timezone.now()
+        self.exam = Exam.objects.create(
+            start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+            classroom=classroom, status="Complete")
+        SCHEDULED_TASK_CALLS.clear()
+
+    def schedule(self, task_name, args=None, debounce_seconds=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_exam_task(self.exam.id, task_name, args, debounce_seconds)
+        self.exam.refresh_from_db()
+
+    def run_due_task(self):
+        Exam.objects.filter(id=self.exam.id).update(scheduled_task_run_at=timezone.now())
+        with self.captureOnCommitCallbacks(execute=True):
+            run_scheduled_exam_task(self.exam.id)
+        self.exam.refresh_from_db()
+
+    def test_requests_are_debounced_and_merged(self, apply_async):
+        self.schedule("incremental_analysis", [[1, 2]], debounce_seconds=15)
+        first_run_at = self.exam.scheduled_task_run_at
+        self.schedule("incremental_analysis", [[2, 3]], debounce_seconds=15)
+
+        self.assertEqual(self.exam.scheduled_task, "incremental_analysis")
+        self.assertEqual(json.loads(self.exam.scheduled_task_args), [[1, 2, 3]])
+        self.assertGreater(self.exam.scheduled_task_run_at, first_run_at)
+        self.assertEqual(apply_async.call_count, 2)
+        self.assertEqual(apply_async.call_args.kwargs["countdown"], 15)
+
+        # The first message finds the deadline moved and leaves it to the second
+        with self.captureOnCommitCallbacks(execute=True):
+            run_scheduled_exam_task(self.exam.id)
+        self.assertEqual(SCHEDULED_TASK_CALLS, [])
+
+        self.run_due_task()
+        self.assertEqual(SCHEDULED_TASK_CALLS, [(self.exam.id, [1, 2, 3])])
+        self.assertIsNone(self.exam.scheduled_task)
+        self.assertIsNone(self.exam.running_task)
+        self.assertEqual(PipelineRun.objects.get(exam=self.exam).status, "Complete")
+
+    def test_earlier_kinds_take_precedence(self, apply_async):
+        self.schedule("analysis")
+        self.schedule("incremental_analysis", [[1]])
+        self.assertEqual(
+            (self.exam.scheduled_task, json.loads(self.exam.scheduled_task_args)), ("analysis", []))
+
+        self.exam.scheduled_task = None
+        self.exam.save()
+        self.schedule("incremental_analysis", [[1]])
+        self.schedule("grading")
+        self.assertEqual(
+            (self.exam.scheduled_task, json.loads(self.exam.scheduled_task_args)), ("grading", []))
+
+    def test_requests_coalesce_into_a_live_run(self, apply_async):
+        Exam.objects.filter(id=self.exam.id).update(
+            running_task="grading", running_task_started_at=timezone.now())
+        self.schedule("grading")
+        self.assertIsNone(self.exam.scheduled_task)
+        apply_async.assert_not_called()
+
+        # Analyses re-run since scores changed; they wait for the run to end
+        self.schedule("analysis")
+        self.assertEqual(self.exam.scheduled_task, "analysis")
+        self.run_due_task()
+        self.assertEqual(SCHEDULED_TASK_CALLS, [])
+        self.assertEqual(self.exam.scheduled_task, "analysis")
+        self.assertEqual(
+            apply_async.call_args.kwargs["countdown"], settings.EXAM_TASK_RETRY_SECONDS)
+
+        # A run that went stale no longer blocks the exam
+        Exam.objects.filter(id=self.exam.id).update(
+            running_task_started_at=timezone.now() - timedelta(
+                seconds=settings.EXAM_TASK_STALE_AFTER_SECONDS + 1))
+        self.schedule("grading")
+        self.assertEqual(self.exam.scheduled_task, "grading")
+        self.run_due_task()
+        self.assertEqual(SCHEDULED_TASK_CALLS, [(self.exam.id,)])
+
+
+class AdvanceExamLifecycleTests(TestCase):
+    """Waiting exams whose run is missing or dead are queued again."""
+
+    def setUp(self):
+        self.classroom = Classroom.objects.create(
+            name="Class", subject="Integrated Science", school_name="School",
+            school_address="Nairobi", grade=7)
+
+    def create_exam(self, status, **kwargs):
+        now = timezone.now()
+        return Exam.objects.create(
+            start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+            classroom=self.classroom, status=status, **kwargs)
+
+    def test_moves_exams_through_their_lifecycle(self):
+        now = timezone.now()
+        upcoming = Exam.objects.create(
+            start_date_time=now + timedelta(hours=1), end_date_time=now + timedelta(hours=2),
+            classroom=self.classroom, status="Upcoming")
+        started = Exam.objects.create(
+            start_date_time=now - timedelta(minutes=5), end_date_time=now + timedelta(hours=1),
+            classroom=self.classroom, status="Upcoming")
+        closed = self.create_exam("Ongoing")
+        follow_up = self.create_exam("Upcoming", type="FollowUp")
+
+        res = advance_exam_lifecycle()
+        self.assertEqual(res, {"started": 1, "closed": 1, "requeued": 0})
+
+        statuses = dict(Exam.objects.values_list("id", "status"))
+        self.assertEqual(
+            [statuses[e.id] for e in (upcoming, started, closed, follow_up)],
+            ["Upcoming", "Ongoing", "Grading", "Upcoming"])
+        closed.refresh_from_db()
+        self.assertEqual(closed.scheduled_task, "grading")
+
+        # Grading is queued once, not on every beat
+        self.assertEqual(advance_exam_lifecycle()["requeued"], 0)
+
+    def test_requeues_exams_without_a_live_run(self):
+        now = timezone.now()
+        stale = now - timedelta(seconds=settings.EXAM_TASK_STALE_AFTER_SECONDS + 60)
+        idle = self.create_exam("Grading", is_grading=True)
+        dead = self.create_exam(
+            "Analysing", is_analysing=True, running_task="analysis", running_task_started_at=stale)
+        generating = self.create_exam(
+            "Generating", generation_config=json.dumps({"strand_ids": [1]}),
+            running_task="generation", running_task_started_at=stale)
+        running = self.create_exam(
+            "Grading", running_task="grading", running_task_started_at=now)
+
+        res = advance_exam_lifecycle()
+
+        self.assertEqual(res["requeued"], 3)
+        for exam, task_name in [(idle, "grading"), (dead, "analysis"), (generating, "generation")]:
+            exam.refresh_from_db()
+            self.assertEqual(exam.scheduled_task, task_name)
+        self.assertEqual(
+            json.loads(generating.scheduled_task_args), [{"strand_ids": [1]}])
+        running.refresh_from_db()
+        self.assertIsNone(running.scheduled_task)
+
+
+class GetUserExamsTests(TestCase):
+    """A student sees the published exams of their classrooms with their own session."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.student_group = Group.objects.create(name="student")
+        cls.user = User.objects.create(username="student")
+        cls.user.groups.add(cls.student_group)
+
+        now = timezone.now()
+        cls.sessions = []
+        for idx in range(2):
+            classroom = Classroom.objects.create(
+                name=f"Class {idx}", subject="Integrated Science", school_name="School",
+                school_address="Nairobi", grade=7)
+            student = Student.objects.create(
+                name="Amani", classroom=classroom, user=cls.user)
+            for is_published in (True, False):
+                exam = Exam.objects.create(
+                    start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+                    classroom=classroom, status="Complete", is_published=is_published)
+                cls.sessions.append(StudentExamSession.objects.create(
+                    student=student, exam=exam, status="Complete"))
+
+    def get_exams(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        return client.get(USER_EXAMS_URL)
+
+    def test_student_exams_carry_their_session(self):
+        response = self.get_exams(self.user)
+        self.assertEqual(response.status_code, 200)
+        exams = response.json()["results"]
+
+        published = {s.exam_id: s for s in self.sessions if s.exam.is_published}
+        self.assertEqual({exam["id"] for exam in exams}, set(published))
+        for exam in exams:
+            session = published[exam["id"]]
+            self.assertEqual(exam["session_id"], session.id)
+            self.assertEqual(exam["student_id"], session.student_id)
+            self.assertEqual(exam["session_status"], "Complete")
+            # Task bookkeeping stays internal
+            self.assertNotIn("running_task", exam)
+            self.assertNotIn("scheduled_task", exam)
+
+    def test_student_without_a_student_record_is_not_found(self):
+        user = User.objects.create(username="unassigned")
+        user.groups.add(self.student_group)
+
+        response = self.get_exams(user)
+        self.assertEqual(response.status_code, 404)
+
+    def test_student_without_published_exams_gets_an_empty_page(self):
+        user = User.objects.create(username="new")
+        user.groups.add(self.student_group)
+        classroom = Classroom.objects.create(
+            name="New class", subject="Integrated Science", school_name="School",
+            school_address="Nairobi", grade=7)
+        Student.objects.create(name="Baraka", classroom=classroom, user=user)
+
+        response = self.get_exams(user)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["results"], [])
+
+
+def create_sat_exam(answers):
+    """A closed, ungraded exam; answers holds each student's answer descriptions."""
+    classroom = Classroom.objects.create(
+        name="Class", subject="Integrated Science", school_name="School",
+        school_address="Nairobi", grade=7)
+    now = timezone.now()
+    exam = Exam.objects.create(
+        start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+        classroom=classroom, status="Grading")
+    questions = [
+        ExamQuestion.objects.create(
+            exam=exam, number=number, grade=7, strand="Mixtures, Elements and Compounds",
+            sub_strand="Mixtures", bloom_skill="Remembering",
+            description=f"Question {number}", expected_answer="Answer")
+        for number in range(1, len(answers[0]) + 1)
+    ]
+    for idx, descriptions in enumerate(answers):
+        student = Student.objects.create(
+            name=f"Student {idx}", classroom=classroom)
+        session = StudentExamSession.objects.create(
+            student=student, exam=exam, status="Grading")
+        for question, description in zip(questions, descriptions):
+            StudentExamSessionAnswer.objects.create(
+                session=session, question=question, description=description)
+    return exam
+
+
+@patch("gen.utils.get_token_count_from_str", lambda text, llm_model: len(text) // 4)
+class GenerateExamGradesTests(TestCase):
+    """Questions are graded concurrently and each question's grades are saved as it finishes."""
+
+    def setUp(self):
+        self.exam = create_sat_exam([
+            ["Solid", "", "Filtration"],
+            ["Solid", "Gas", "Evaporation"],
+            ["  Solid ", "Gas", ""],
+        ])
+        provider = override_llm_provider(
+            FakeLLMProvider(latency_seconds=0, jitter_seconds=0))
+        provider.__enter__()
+        self.addCleanup(provider.__exit__, None, None, None)
+
+    def answers(self):
+        return StudentExamSessionAnswer.objects.filter(
+            session__exam=self.exam).select_related("question").order_by("id")
+
+    def test_every_answer_is_graded(self):
+        generate_exam_grades(self.exam.id)
+        self.exam.refresh_from_db()
+
+        self.assertEqual(self.exam.status, "Analysing", self.exam.generation_error)
+        self.assertEqual(self.exam.scheduled_task, "analysis")
+        self.assertFalse(StudentExamSession.objects.filter(
+            exam=self.exam).exclude(status="Complete").exists())
+
+        scores = {}
+        for answer in self.answers():
+            self.assertIsNotNone(answer.ai_score)
+            self.assertEqual(answer.score, answer.ai_score)
+            if not answer.description.strip():
+                self.assertEqual(answer.score, 0)
+            else:
+                self.assertIn(answer.score, [1, 2, 3, 4])
+            scores.setdefault(
+                (answer.question_id, " ".join(answer.description.split())), set()).add(answer.score)
+        # Identical answers to a question share one grade
+        self.assertTrue(all(len(shared) == 1 for shared in scores.values()))
+
+    def test_answers_are_fetched_in_one_query(self):
+        answer_table = StudentExamSessionAnswer._meta.db_table
+        grouped = []
+
+        def grade_nothing(grouped_answers_data, **kwargs):
+            grouped.extend(grouped_answers_data)
+            return {"error": "stop"}
+
+        with CaptureQueriesContext(connection) as ctx, \
+                patch("exam.grading.generate_llm_answer_grades_list", grade_nothing):
+            generate_exam_grades(self.exam.id)
+
+        answer_selects = [
+            q["sql"] for q in ctx.captured_queries
+            if q["sql"].startswith("SELECT") and f'FROM "{answer_table}"' in q["sql"]]
+        self.assertEqual(len(answer_selects), 1)
+        self.assertEqual(
+            [(g["question"], len(g["student_answers"])) for g in grouped],
+            [("Question 1", 3), ("Question 2", 3), ("Question 3", 3)])
+
+    def test_failed_question_keeps_the_others_grades_for_the_retry(self):
+        run_llm_qa_grades = gen.utils._run_llm_qa_grades
+
+        def failing_question_2(answers_data, **kwargs):
+            if answers_data["question"] == "Question 2":
+                return {"error": "LLM unavailable"}
+            return run_llm_qa_grades(answers_data, **kwargs)
+
+        with patch("gen.utils._run_llm_qa_grades", failing_question_2):
+            generate_exam_grades(self.exam.id)
+        self.exam.refresh_from_db()
+
+        self.assertEqual(self.exam.status, "Failed")
+        self.assertIn("LLM unavailable", self.exam.generation_error)
+        # Questions 1 and 3 are saved, question 2 only has its blank answer scored
+        for answer in self.answers():
+            is_graded = answer.question.number != 2 or not answer.description
+            self.assertEqual(answer.ai_score is not None, is_graded)
+
+        # The retry only sends the answers still ungraded
+        graded_questions = []
+
+        def recording(answers_data, **kwargs):
+            graded_questions.append(answers_data["question"])
+            return run_llm_qa_grades(answers_data, **kwargs)
+
+        with patch("gen.utils._run_llm_qa_grades", recording):
+            generate_exam_grades(self.exam.id)
+        self.exam.refresh_from_db()
+
+        self.assertEqual(self.exam.status, "Analysing", self.exam.generation_error)
+        self.assertEqual(graded_questions, ["Question 2"])
+        self.assertFalse(self.answers().filter(ai_score=None).exists())
+
+
+@patch("gen.utils.get_token_count_from_str", lambda text, llm_model: len(text) // 4)
+@patch("exam.tasks.run_scheduled_exam_task.apply_async")
+class PipelineRunTests(TestCase):
+    """Each scheduled task run is saved with its LLM and database counters."""
+
+    def setUp(self):
+        self.exam = create_sat_exam([
+            ["Solid", "", "Filtration"],
+            ["Solid", "Gas", "Evaporation"],
+        ])
+        provider = override_llm_provider(
+            FakeLLMProvider(latency_seconds=0, jitter_seconds=0))
+        provider.__enter__()
+        self.addCleanup(provider.__exit__, None, None, None)
+
+    def run_grading(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            schedule_exam_task(self.exam.id, "grading", debounce_seconds=0)
+        with self.captureOnCommitCallbacks(execute=True):
+            run_scheduled_exam_task(self.exam.id)
+        return PipelineRun.objects.filter(exam=self.exam).latest("id")
+
+    def test_run_records_llm_calls_and_queries(self, apply_async):
+        run = self.run_grading()
+
+        self.assertEqual(run.task, "grading")
+        self.assertEqual(run.status, "Complete")
+        self.assertIsNone(run.error)
+        self.assertIsNotNone(run.finished_at)
+        # One grading call per question with a written answer
+        self.assertEqual(run.llm_calls, 3)
+        self.assertEqual(run.llm_errors, 0)
+        self.assertGreater(run.input_tokens, 0)
+        self.assertGreater(run.output_tokens, 0)
+        self.assertGreater(run.db_queries, 0)
+        self.assertGreater(run.rows_written, 0)
+
+        llm_call_log = json.loads(run.llm_call_log)
+        self.assertEqual(len(llm_call_log), run.llm_calls)
+        self.assertEqual(
+            sum(call["input_tokens"] for call in llm_call_log), run.input_tokens)
+
+        stages = json.loads(run.stages)
+        self.assertEqual(
+            sum(stage["db_queries"] for stage in stages.values()), run.db_queries)
+        self.assertEqual(
+            sum(stage["llm_calls"] for stage in stages.values()), run.llm_calls)
+
+    def test_exam_failure_fails_the_run(self, apply_async):
+        with patch("gen.utils._run_llm_qa_grades", lambda answers_data, **kwargs: {"error": "LLM unavailable"}):
+            run = self.run_grading()
+
+        self.exam.refresh_from_db()
+        self.assertEqual(self.exam.status, "Failed")
+        self.assertEqual(run.status, "Failed")
+        self.assertIn("LLM unavailable", run.error)
+
+
+class ApplyAnswerGradesTests(TestCase):
+    """Grades are written in bulk, and the ones that cannot be written are reported."""
+
+    def setUp(self):
+        self.exam = create_sat_exam([["Solid", ""]] * 6)
+
+    def test_grades_are_written_in_constant_queries(self):
+        answers = list(StudentExamSessionAnswer.objects.filter(
+            session__exam=self.exam).order_by("id"))
+        counts = []
+        for batch in (answers[:2], answers[2:]):
+            with CaptureQueriesContext(connection) as ctx:
+                failed = apply_answer_grades([
+                    {"answer_id": answer.id, "score": 3} for answer in batch])
+            self.assertEqual(failed, [])
+            counts.append(len(ctx.captured_queries))
+        self.assertEqual(counts[0], counts[1])
+
+        for answer in StudentExamSessionAnswer.objects.filter(session__exam=self.exam):
+            expected = 3 if answer.description else 0
+            self.assertEqual((answer.score, answer.ai_score), (expected, expected))
+            self.assertEqual(
+                answer.expectation_level, get_answer_expectation_level(expected))
+
+    def test_unwritable_grades_are_reported(self):
+        answer = StudentExamSessionAnswer.objects.filter(
+            session__exam=self.exam).exclude(description="").first()
+
+        failed = apply_answer_grades([
+            {"answer_id": answer.id, "score": "4"},
+            {"answer_id": None, "score": 2},
+            {"answer_id": answer.id + 1000, "score": 2},
+            {"answer_id": answer.id, "score": "high"},
+        ])
+
+        self.assertEqual(failed, [
+            {"answer_id": None, "reason": "Missing answer_id or score"},
+            {"answer_id": answer.id, "reason": "Invalid score"},
+            {"answer_id": answer.id + 1000, "reason": "Answer not found"},
+        ])
+        answer.refresh_from_db()
+        self.assertEqual(answer.score, 4)
+
+
+class RenderedPerformanceCacheTests(TestCase):
+    """Class performances are served from their cached rendering until they are saved again."""
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+        teacher_group = Group.objects.create(name="teacher")
+        user = User.objects.create(username="teacher")
+        user.groups.add(teacher_group)
+        teacher = Teacher.objects.create(name="Teacher", phone_no="0700000000", user=user)
+        self.classroom = Classroom.objects.create(
+            name="Class", subject="Integrated Science", school_name="School",
+            school_address="Nairobi", grade=7, teacher=teacher)
+        now = timezone.now()
+        self.exam = Exam.objects.create(
+            start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+            classroom=self.classroom, teacher=teacher, status="Complete")
+
+        self.client = APIClient()
+        self.client.force_authenticate(user=user)
+
+    def get(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content)
+
+    def assert_cached_until_saved(self, url, performance, serializer_class):
+        first = self.get(url)
+        self.assertEqual(first, json.loads(json.dumps(
+            serializer_class(performance).data, default=str)))
+        self.assertEqual(first["strand_analysis"], [{"strand": "Mixtures"}])
+
+        # A write that skips save() leaves updated_at, and the rendering, as they were
+        type(performance).objects.filter(id=performance.id).update(
+            strand_analysis=json.dumps([{"strand": "Matter"}]))
+        self.assertEqual(self.get(url), first)
+
+        performance.refresh_from_db()
+        performance.avg_score = 75
+        performance.save()
+        fresh = self.get(url)
+        self.assertEqual(fresh["strand_analysis"], [{"strand": "Matter"}])
+        self.assertEqual(fresh["avg_score"], 75)
+        self.assertNotEqual(fresh["updated_at"], first["updated_at"])
+
+    def test_class_exam_performance(self):
+        performance = ClassExamPerformance.objects.create(
+            exam=self.exam, avg_score=60, strand_analysis=json.dumps([{"strand": "Mixtures"}]))
+        self.assert_cached_until_saved(
+            f"{CLASS_EXAM_PERFORMANCE_URL}?exam_id={self.exam.id}",
+            performance, ClassExamPerformanceSerializer)
+
+    def test_class_performance_aggregate(self):
+        performance = ClassAggregatePerformance.objects.create(
+            classroom=self.classroom, exam_count=1, avg_score=60,
+            strand_analysis=json.dumps([{"strand": "Mixtures"}]))
+        self.assert_cached_until_saved(
+            f"{CLASS_PERFORMANCE_AGGREGATE_URL}?classroom_id={self.classroom.id}",
+            performance, ClassAggregatePerformanceSerializer)
+
+    def test_missing_performance_is_not_found(self):
+        response = self.client.get(f"{CLASS_EXAM_PERFORMANCE_URL}?exam_id={self.exam.id}")
+        self.assertEqual(response.status_code, 404)
+
+    def test_cached_renderings_have_the_headers_of_rendered_responses(self):
+        ClassExamPerformance.objects.create(exam=self.exam, avg_score=60)
+        ClassAggregatePerformance.objects.create(
+            classroom=self.classroom, exam_count=1, avg_score=60)
+        # The 404s are rendered by DRF, the 200s are the cached bytes
+        not_found = self.client.get(
+            f"{CLASS_EXAM_PERFORMANCE_URL}?exam_id={self.exam.id + 1}", HTTP_ACCEPT="application/json")
+        self.assertEqual(not_found.status_code, 404)
+
+        for url in (f"{CLASS_EXAM_PERFORMANCE_URL}?exam_id={self.exam.id}",
+                    f"{CLASS_PERFORMANCE_AGGREGATE_URL}?classroom_id={self.classroom.id}"):
+            response = self.client.get(url, HTTP_ACCEPT="application/json")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response["Content-Type"], "application/json")
+            self.assertEqual(response["Content-Type"], not_found["Content-Type"])
+            self.assertEqual(response["Vary"], not_found["Vary"])
+            self.assertIn("Accept", response["Vary"])
+
+
+# Only the Celery workers need these (exam.generation, exam.grading, exam.analysis)
+WORKER_ONLY_MODULES = [
+    "anthropic", "fitz", "langchain", "langchain_openai", "numpy", "pandas",
+    "reportlab", "scipy", "sklearn", "tiktoken",
+]
+
+
+class WebStartupImportTests(SimpleTestCase):
+    """The web process starts without loading the LLM and ML libraries."""
+
+    def test_url_conf_does_not_import_worker_libraries(self):
+        script = (
+            "import sys, django\n"
+            "django.setup()\n"
+            "from django.urls import get_resolver\n"
+            "get_resolver().url_patterns\n"
+            "print(' '.join(sorted({name.split('.')[0] for name in sys.modules})))\n"
+        )
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "mtihaniapi.settings"}
+        res = subprocess.run(
+            [sys.executable, "-c", script], cwd=settings.BASE_DIR, env=env,
+            capture_output=True, text=True, timeout=120)
+
+        self.assertEqual(res.returncode, 0, res.stderr)
+        loaded = set(res.stdout.split())
+        self.assertEqual(sorted(loaded.intersection(WORKER_ONLY_MODULES)), [])
+        self.assertIn("django", loaded)
+
+    def test_constants_import_has_no_side_effects(self):
+        # The .env file is loaded by the settings, not by importing gen.constants
+        res = subprocess.run(
+            [sys.executable, "-c", "import sys, gen.constants; print('dotenv' in sys.modules)"],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=120)
+
+        self.assertEqual(res.returncode, 0, res.stderr)
+        self.assertEqual(res.stdout.strip(), "False")
+
+
+class BenchmarkPipelineCommandTests(SimpleTestCase):
+    """benchmark_pipeline --check passes against its own baseline and fails on a regression."""
+
+    def benchmark(self, *args):
+        env = {**os.environ, "DJANGO_SETTINGS_MODULE": "mtihaniapi.settings"}
+        return subprocess.run(
+            [sys.executable, "manage.py", "benchmark_pipeline", "--classrooms", "1",
+             "--students", "3", "--questions", "3", "--repeat", "1", *args],
+            cwd=settings.BASE_DIR, env=env, capture_output=True, text=True, timeout=300)
+
+    def test_check_against_a_baseline(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        baseline_file = os.path.join(tmp_dir.name, "baseline.json")
+
+        res = self.benchmark("--baseline", baseline_file, "--save-baseline")
+        self.assertEqual(res.returncode, 0, res.stderr)
+
+        res = self.benchmark("--baseline", baseline_file, "--check")
+        self.assertEqual(res.returncode, 0, res.stderr)
+        self.assertIn("No regressions against the baseline.", res.stdout)
+
+        # A baseline that needed fewer queries makes the same run a regression
+        with open(baseline_file, encoding="utf-8") as f:
+            baseline = json.load(f)
+        baseline["stages"]["grading"]["queries_per_call"] -= 1
+        with open(baseline_file, "w", encoding="utf-8") as f:
+            json.dump(baseline, f)
+
+        res = self.benchmark("--baseline", baseline_file, "--check")
+        self.assertNotEqual(res.returncode, 0)
+        self.assertIn("grading queries", res.stderr)
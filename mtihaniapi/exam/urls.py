@@ -30,4 +30,6 @@ urlpatterns = [
     path('get-student-exam-performance', get_student_exam_performance),
     path('get-class-performance-aggregate', get_class_performance_aggregate),
     path('get-student-performance-aggregate', get_student_performance_aggregate),
+    # instrumentation
+    path('get-pipeline-runs', get_pipeline_runs),
 ]
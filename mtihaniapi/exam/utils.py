@@ -5,8 +5,6 @@ from statistics import mean
 from typing import Dict, Any, List
 import string
 import random
-import numpy as np
-from sklearn.cluster import KMeans
 from rest_framework.pagination import PageNumberPagination
 
 # ================================================== CONSTANTS
@@ -18,6 +16,7 @@ class GlobalPagination(PageNumberPagination):
     max_page_size = 100
 
 
+BULK_UPDATE_BATCH_SIZE = 500
 
 EXPECTATION_LEVELS = [
     ("Below", "Below"),
@@ -42,6 +41,28 @@ EXAM_TYPES = [
     ("FollowUp", "FollowUp"),
 ]
 
+PIPELINE_RUN_STATUSES = [
+    ("Running", "Running"),
+    ("Complete", "Complete"),
+    ("Failed", "Failed"),
+]
+
+PERFORMANCE_SCORE_ENTITIES = [
+    ("StudentExamSession", "StudentExamSession"),
+    ("StudentAggregate", "StudentAggregate"),
+    ("ClassExam", "ClassExam"),
+    ("ClassAggregate", "ClassAggregate"),
+    ("Cluster", "Cluster"),
+]
+
+SCORE_DIMENSIONS = [
+    ("BloomSkill", "BloomSkill"),
+    ("Grade", "Grade"),
+    ("Strand", "Strand"),
+    ("SubStrand", "SubStrand"),
+    ("StrandBloomSkill", "StrandBloomSkill"),
+]
+
 # ================================================== FUNCTIONS
 # ============================================================
 
@@ -60,15 +81,50 @@ def format_scores(score_dict) -> List[Dict[str, Any]]:
     )
 
 
-def merge_and_average_score_lists(score_lists):
-    combined = defaultdict(list)
-    for score_json in score_lists:
-        for item in json.loads(score_json):
-            combined[item["name"]].append(item["percentage"])
-    return [
-        {"name": name, "percentage": round(mean(vals), 2)}
-        for name, vals in combined.items()
-    ]
+def extract_performance_score_facts(entity) -> List[Dict[str, Any]]:
+    """
+    Flattens a performance record's JSON score fields into score-fact rows
+    (dimension_type, dimension_name, strand, grade, percentage, position).
+    position counts each dimension type's rows in JSON order.
+    """
+    facts = []
+    positions = defaultdict(int)
+
+    def add(dimension_type, name, percentage, strand="", grade=None):
+        if percentage is None:
+            return
+        facts.append({
+            "dimension_type": dimension_type,
+            "dimension_name": str(name),
+            "strand": strand,
+            "grade": grade,
+            "percentage": percentage,
+            "position": positions[dimension_type],
+        })
+        positions[dimension_type] += 1
+
+    for entry in json.loads(getattr(entity, "bloom_skill_scores", None) or "[]"):
+        add("BloomSkill", entry["name"], entry.get("percentage"))
+    for entry in json.loads(getattr(entity, "grade_scores", None) or "[]"):
+        add("Grade", entry["name"], entry.get("percentage"))
+
+    # Session, cluster and student records use strand_scores; class records
+    # use strand_analysis with avg_score and *_scores keys
+    strands = json.loads(
+        getattr(entity, "strand_scores", None)
+        or getattr(entity, "strand_analysis", None)
+        or "[]")
+    for strand in strands:
+        name = strand["name"]
+        add("Strand", name, strand.get("percentage", strand.get("avg_score")),
+            grade=strand.get("grade"))
+        for sub in strand.get("sub_strands", strand.get("sub_strand_scores", [])):
+            add("SubStrand", sub["name"], sub.get("percentage"), strand=name)
+        for skill in strand.get("bloom_skills", strand.get("bloom_skill_scores", [])):
+            add("StrandBloomSkill", skill["name"],
+                skill.get("percentage"), strand=name)
+
+    return facts
 
 
 def classify_scores(score_list, weak_thresh=50, strong_thresh=75):
@@ -78,6 +134,10 @@ def classify_scores(score_list, weak_thresh=50, strong_thresh=75):
 
 
 def find_elbow(X, min_k=2, max_k=6):
+    # Imported here: only the analysis worker clusters
+    import numpy as np
+    from sklearn.cluster import KMeans
+
     inertias = []
     possible_ks = range(min_k, max_k+1)
     for k in possible_ks:
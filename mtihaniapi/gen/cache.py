@@ -0,0 +1,200 @@
+# cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import closing
+from typing import Any, Dict, Optional
+from gen.constants import *
+
+
+def get_llm_cache_key(llm_model: str, temperature: Any, prompt: str) -> str:
+    """Content address of an LLM call: same model, temperature and prompt give the same key."""
+    payload = json.dumps(
+        {"model": llm_model, "temperature": temperature, "prompt": prompt},
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Base cache: stores nothing, only counts. Backends override _get/_set."""
+
+    def __init__(self, ttl_seconds: int = LLM_CACHE_TTL_SECONDS,
+                 max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._stats_lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "errors": 0}
+
+    def _count(self, name: str):
+        with self._stats_lock:
+            self._stats[name] += 1
+
+    def get(self, key: str) -> Optional[str]:
+        try:
+            value = self._get(key)
+        except Exception as e:
+            self._count("errors")
+            print(f"LLM cache read failed: {e}")
+            value = None
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def set(self, key: str, value: str):
+        try:
+            self._set(key, value)
+            self._count("sets")
+        except Exception as e:
+            self._count("errors")
+            print(f"LLM cache write failed: {e}")
+
+    def stats(self) -> Dict[str, int]:
+        with self._stats_lock:
+            return dict(self._stats)
+
+    def _get(self, key: str) -> Optional[str]:
+        return None
+
+    def _set(self, key: str, value: str):
+        pass
+
+
+class SQLiteLLMResponseCache(LLMResponseCache):
+    """On-disk cache for a single machine. Evicts expired, then least recently used entries."""
+
+    def __init__(self, file_path: str = LLM_CACHE_SQLITE_FILE, **kwargs):
+        super().__init__(**kwargs)
+        self.file_path = file_path
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS llm_response_cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, "
+                "expires_at REAL, last_accessed REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS llm_response_cache_last_accessed "
+                "ON llm_response_cache (last_accessed)"
+            )
+
+    def _connect(self) -> sqlite3.Connection:
+        # One short-lived connection per call keeps this safe across threads.
+        # Callers close it: the connection's own context manager only commits.
+        return sqlite3.connect(self.file_path, timeout=10)
+
+    def _get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with closing(self._connect()) as conn, conn:
+            row = conn.execute(
+                "SELECT value, expires_at FROM llm_response_cache WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, expires_at = row
+            if expires_at is not None and expires_at < now:
+                conn.execute(
+                    "DELETE FROM llm_response_cache WHERE key = ?", (key,))
+                return None
+            conn.execute(
+                "UPDATE llm_response_cache SET last_accessed = ? WHERE key = ?", (now, key))
+            return value
+
+    def _set(self, key: str, value: str):
+        now = time.time()
+        expires_at = now + self.ttl_seconds if self.ttl_seconds else None
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO llm_response_cache (key, value, expires_at, last_accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, now),
+            )
+            conn.execute(
+                "DELETE FROM llm_response_cache WHERE expires_at IS NOT NULL AND expires_at < ?", (now,))
+            if self.max_entries:
+                conn.execute(
+                    "DELETE FROM llm_response_cache WHERE key IN ("
+                    "SELECT key FROM llm_response_cache ORDER BY last_accessed DESC "
+                    "LIMIT -1 OFFSET ?)",
+                    (self.max_entries,),
+                )
+
+
+class RedisLLMResponseCache(LLMResponseCache):
+    """Shared cache for every worker. Redis expires entries; a sorted set tracks LRU order."""
+
+    KEY_PREFIX = "mtihani:llm_cache:"
+    INDEX_KEY = "mtihani:llm_cache_index"
+    STATS_KEY = "mtihani:llm_cache_stats"
+
+    def __init__(self, url: str = LLM_CACHE_REDIS_URL, **kwargs):
+        super().__init__(**kwargs)
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+
+    def _count(self, name: str):
+        super()._count(name)
+        try:
+            self.redis.hincrby(self.STATS_KEY, name, 1)
+        except Exception:
+            pass
+
+    def _get(self, key: str) -> Optional[str]:
+        value = self.redis.get(self.KEY_PREFIX + key)
+        if value is None:
+            self.redis.zrem(self.INDEX_KEY, key)
+            return None
+        self.redis.zadd(self.INDEX_KEY, {key: time.time()})
+        return value
+
+    def _set(self, key: str, value: str):
+        pipe = self.redis.pipeline()
+        if self.ttl_seconds:
+            pipe.set(self.KEY_PREFIX + key, value, ex=self.ttl_seconds)
+        else:
+            pipe.set(self.KEY_PREFIX + key, value)
+        pipe.zadd(self.INDEX_KEY, {key: time.time()})
+        pipe.execute()
+
+        if self.max_entries:
+            overflow = self.redis.zcard(self.INDEX_KEY) - self.max_entries
+            if overflow > 0:
+                evicted = [k for k, _ in self.redis.zpopmin(
+                    self.INDEX_KEY, overflow)]
+                if evicted:
+                    self.redis.delete(
+                        *[self.KEY_PREFIX + k for k in evicted])
+
+    def stats(self) -> Dict[str, int]:
+        try:
+            shared = self.redis.hgetall(self.STATS_KEY)
+            return {name: int(shared.get(name, 0)) for name in self._stats}
+        except Exception:
+            return super().stats()
+
+
+_llm_response_cache = None
+_llm_response_cache_lock = threading.Lock()
+
+
+def get_llm_response_cache() -> LLMResponseCache:
+    """Process-wide cache picked by LLM_CACHE_BACKEND ("sqlite", "redis" or "none")."""
+    global _llm_response_cache
+    if _llm_response_cache is None:
+        with _llm_response_cache_lock:
+            if _llm_response_cache is None:
+                try:
+                    if LLM_CACHE_BACKEND == "redis":
+                        _llm_response_cache = RedisLLMResponseCache()
+                    elif LLM_CACHE_BACKEND == "sqlite":
+                        _llm_response_cache = SQLiteLLMResponseCache()
+                    else:
+                        _llm_response_cache = LLMResponseCache()
+                except Exception as e:
+                    print(f"LLM cache unavailable, running uncached: {e}")
+                    _llm_response_cache = LLMResponseCache()
+    return _llm_response_cache
@@ -1,8 +1,4 @@
-from langchain_openai import ChatOpenAI
 import os
-import dotenv
-dotenv.load_dotenv()
-from anthropic import Client
 
 APP_QUESTION_COUNT = 25
 APP_BLOOM_SKILL_COUNT = 3
@@ -11,20 +7,68 @@ BLOOM_SKILLS = [
 ]
 
 OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
-OPENAI_LLM_4O = ChatOpenAI(
-    model_name="gpt-4o",
-    temperature=0.1,
-    max_tokens=10240,
-    openai_api_key=OPENAI_API_KEY,
-)
+ANTHROPIC_API_KEY = os.getenv("ANTHROPIC_API_KEY")
 
-client = Client(api_key=os.getenv("ANTHROPIC_API_KEY"))
+# LLMs are picked by model name; gen.providers maps each one to its provider
+OPENAI_GPT_4O = "gpt-4o"
+CLAUDE_SONNET_4 = "claude-sonnet-4-20250514"
+CLAUDE_OPUS_4 = "claude-opus-4-20250514"
+# Deterministic local stand-in for load tests and offline benchmarks
+FAKE_LLM = "fake"
+DEFAULT_LLM = os.getenv("LLM_MODEL", OPENAI_GPT_4O)
+LLM_TEMPERATURE = 0.1
+LLM_MAX_TOKENS = 10240
+
+# Concurrency for fanned-out LLM calls (one call per sub-strand group, etc.)
+LLM_MAX_WORKERS = int(os.getenv("LLM_MAX_WORKERS", 8))
+# Per provider limits, shared by every call made through the provider
+LLM_PROVIDER_CONCURRENCY = {
+    "openai": int(os.getenv("OPENAI_MAX_CONCURRENCY", 4)),
+    "anthropic": int(os.getenv("ANTHROPIC_MAX_CONCURRENCY", 4)),
+    "fake": int(os.getenv("FAKE_LLM_MAX_CONCURRENCY", 16)),
+}
+# 0 means no request rate limit
+LLM_PROVIDER_REQUESTS_PER_MINUTE = {
+    "openai": int(os.getenv("OPENAI_REQUESTS_PER_MINUTE", 0)),
+    "anthropic": int(os.getenv("ANTHROPIC_REQUESTS_PER_MINUTE", 0)),
+    "fake": int(os.getenv("FAKE_LLM_REQUESTS_PER_MINUTE", 0)),
+}
+FAKE_LLM_LATENCY_SECONDS = float(os.getenv("FAKE_LLM_LATENCY_SECONDS", 0.5))
+FAKE_LLM_LATENCY_JITTER_SECONDS = float(
+    os.getenv("FAKE_LLM_LATENCY_JITTER_SECONDS", 0.1))
+LLM_TASK_RETRIES = int(os.getenv("LLM_TASK_RETRIES", 1))
+# Stream completions and parse JSON array items as they arrive
+LLM_STREAMING = os.getenv("LLM_STREAMING", "true").lower() == "true"
+LLM_GRADING_MAX_WORKERS = int(
+    os.getenv("LLM_GRADING_MAX_WORKERS", LLM_MAX_WORKERS))
+
+# Grading prompts are split into chunks of student answers so that large
+# classes neither bloat the prompt nor get their JSON output truncated
+GRADING_PROMPT_TOKEN_BUDGET = int(
+    os.getenv("GRADING_PROMPT_TOKEN_BUDGET", 6000))
+GRADING_MAX_ANSWERS_PER_CHUNK = int(
+    os.getenv("GRADING_MAX_ANSWERS_PER_CHUNK", 40))
+GRADING_MISSING_ANSWER_RETRIES = int(
+    os.getenv("GRADING_MISSING_ANSWER_RETRIES", 2))
 
 FLOWISE_API_URL = "https://cloud.flowiseai.com/api/v1/prediction/68022f7f-b4f3-431b-a64e-0c4d61734800"
 FLOWISE_API_KEY = os.getenv("FLOWISE_MTIHANI_API_KEY")
 FLOWISE_HEADERS = {"Authorization": f"Bearer {FLOWISE_API_KEY}"}
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Content-addressed LLM response cache: "sqlite", "redis" or "none"
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "sqlite")
+LLM_CACHE_TTL_SECONDS = int(
+    os.getenv("LLM_CACHE_TTL_SECONDS", 7 * 24 * 60 * 60))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 20000))
+# Kept out of the source tree, in the user's cache directory
+LLM_CACHE_SQLITE_FILE = os.getenv(
+    "LLM_CACHE_SQLITE_FILE", os.path.join(
+        os.getenv("XDG_CACHE_HOME", os.path.join(os.path.expanduser("~"), ".cache")),
+        "mtihaniapi", "llm_cache.sqlite3"))
+LLM_CACHE_REDIS_URL = os.getenv(
+    "LLM_CACHE_REDIS_URL", "redis://localhost:6379/1")
 CURRICULUM_FILE = os.path.join(BASE_DIR, "data", "cbc_data.json")
 QUESTION_LIST_OUTPUT_FILE = os.path.join(
     BASE_DIR, "output", "question_list.json")
@@ -2,9 +2,12 @@
 
 from collections import defaultdict
 from operator import itemgetter
+import os
 import random
 import json
-from typing import List, Dict, Any
+import threading
+from types import MappingProxyType
+from typing import List, Dict, Any, Optional, Tuple
 import json
 from itertools import cycle, groupby, islice
 from gen.constants import *
@@ -17,7 +20,142 @@ def load_curriculum(file_path: str) -> List[Dict[str, Any]]:
         return cbc_data
 
 
-def get_strand_id_grade_pairs(cbc_data: List[Dict[str, Any]]) -> List[Dict[str, any]]:
+class CurriculumIndex:
+    """
+    Read-only lookups over one load of the CBC curriculum. Built once per
+    file version by get_curriculum_index; treat everything on it as frozen.
+    """
+
+    def __init__(self, cbc_data: List[Dict[str, Any]]):
+        self.cbc_data = cbc_data
+
+        grades = {}
+        strands_by_id = {}
+        strand_positions = {}
+        sub_strands_by_name = {}
+        rubrics_by_sub_strand = {}
+        strand_id_grade_pairs = []
+        strand_sub_strand_pairs = []
+        all_sub_strand_names = []
+        strand_names_by_grade = defaultdict(list)
+
+        for grade_obj in cbc_data:
+            grade = grade_obj.get("grade")
+            grades[grade] = grade_obj
+            for strand in grade_obj.get("strands", []):
+                strand_positions[strand.get("id")] = len(strand_positions)
+                strands_by_id[strand.get("id")] = MappingProxyType({
+                    "grade": grade,
+                    "strand_name": strand["name"],
+                    "sub_strands": strand.get("sub_strands", []),
+                })
+                strand_id_grade_pairs.append({
+                    "id": strand.get("id"),
+                    "grade": grade,
+                    "strand": strand.get("name")
+                })
+                strand_names_by_grade[grade].append(
+                    f"{strand['name']} (G{grade})")
+
+                all_sub_strand_names.append(strand['name'])
+                for sub_strand in strand.get("sub_strands", []):
+                    name = sub_strand.get("name")
+                    all_sub_strand_names.append(name)
+                    strand_sub_strand_pairs.append((
+                        strand['name'],
+                        name,
+                        ". ".join(sub_strand.get('descriptions', [])),
+                    ))
+
+                    # First match wins, as with the old linear scan
+                    if name in sub_strands_by_name:
+                        continue
+                    sub_strands_by_name[name] = sub_strand
+                    rubrics_by_sub_strand[name] = tuple(
+                        {
+                            "skill": skill.get("skill"),
+                            "rubrics": skill.get("rubrics", [])
+                        }
+                        for skill in sub_strand.get("skills", [])
+                    )
+
+        self.grades = MappingProxyType(grades)
+        self.strands_by_id = MappingProxyType(strands_by_id)
+        self.strand_positions = MappingProxyType(strand_positions)
+        self.sub_strands_by_name = MappingProxyType(sub_strands_by_name)
+        self.rubrics_by_sub_strand = MappingProxyType(rubrics_by_sub_strand)
+        # Rubrics exactly as they appear in grading prompts
+        self.rubric_prompt_texts = MappingProxyType({
+            name: str(list(rubrics))
+            for name, rubrics in rubrics_by_sub_strand.items()
+        })
+        self._rubric_token_counts = {}
+        self._rubric_token_counts_lock = threading.Lock()
+        self.strand_id_grade_pairs = tuple(strand_id_grade_pairs)
+        self.strand_sub_strand_pairs = tuple(strand_sub_strand_pairs)
+        self.all_sub_strand_names = tuple(all_sub_strand_names)
+
+        # Every strand from grade 7 up to each grade, for coverage checks
+        strands_up_to_grade = {}
+        covered = []
+        for grade in sorted(g for g in grades if g is not None):
+            if grade >= 7:
+                covered = covered + strand_names_by_grade[grade]
+            strands_up_to_grade[grade] = tuple(covered)
+        self.strands_up_to_grade = MappingProxyType(strands_up_to_grade)
+
+    def get_selected_strands(self, strand_ids: List[int]) -> List[Dict[str, Any]]:
+        """Strands for the given ids, in curriculum order."""
+        known_ids = [sid for sid in set(strand_ids)
+                     if sid in self.strands_by_id]
+        known_ids.sort(key=self.strand_positions.get)
+        return [dict(self.strands_by_id[sid]) for sid in known_ids]
+
+    def get_rubric_prompt_text(self, sub_strand_name: str) -> str:
+        return self.rubric_prompt_texts.get(sub_strand_name, str([]))
+
+    def get_rubric_token_count(self, sub_strand_name: str, llm_model: str) -> int:
+        """Token count of a sub-strand's rubric text, encoded once per model."""
+        key = (sub_strand_name, llm_model)
+        if key not in self._rubric_token_counts:
+            from gen.utils import get_token_count_from_str
+            token_count = get_token_count_from_str(
+                self.get_rubric_prompt_text(sub_strand_name), llm_model)
+            with self._rubric_token_counts_lock:
+                self._rubric_token_counts[key] = token_count
+        return self._rubric_token_counts[key]
+
+    def get_strands_up_to_grade(self, grade: int) -> Tuple[str, ...]:
+        if grade in self.strands_up_to_grade:
+            return self.strands_up_to_grade[grade]
+        lower_grades = [g for g in self.strands_up_to_grade if g <= grade]
+        return self.strands_up_to_grade[max(lower_grades)] if lower_grades else ()
+
+
+_curriculum_indexes = {}
+_curriculum_indexes_lock = threading.Lock()
+
+
+def get_curriculum_index(file_path: str = CURRICULUM_FILE) -> CurriculumIndex:
+    """Process-wide curriculum index, rebuilt only when the file's mtime changes."""
+    mtime = os.path.getmtime(file_path)
+    cached = _curriculum_indexes.get(file_path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+
+    with _curriculum_indexes_lock:
+        cached = _curriculum_indexes.get(file_path)
+        if cached and cached[0] == mtime:
+            return cached[1]
+        index = CurriculumIndex(load_curriculum(file_path))
+        _curriculum_indexes[file_path] = (mtime, index)
+        return index
+
+
+def get_strand_id_grade_pairs(cbc_data: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, any]]:
+    if cbc_data is None:
+        return [dict(pair) for pair in get_curriculum_index().strand_id_grade_pairs]
+
     result = []
     for grade_obj in cbc_data:
         grade = grade_obj.get("grade")
@@ -130,9 +268,9 @@ def get_exam_curriculum(
     curriculum_file: str = CURRICULUM_FILE,
     bloom_skill_count: int = APP_BLOOM_SKILL_COUNT,
 ) -> List[Dict[str, Any]]:
-    cbc_data = load_curriculum(curriculum_file)
+    index = get_curriculum_index(curriculum_file)
 
-    parsed = parse_curriculum(strand_ids, cbc_data)
+    parsed = {"selected": index.get_selected_strands(strand_ids)}
 
     question_plan = generate_question_plan(
         parsed, question_count=question_count, bloom_skill_count=bloom_skill_count)
@@ -201,20 +339,25 @@ def get_rubrics_by_sub_strand(
         sub_strand_name: str,
         curriculum_file: str = CURRICULUM_FILE,
 ) -> List[Dict[str, str]]:
-    cbc_data = load_curriculum(curriculum_file)
-
-    for grade_data in cbc_data:
-        for strand in grade_data.get("strands", []):
-            for sub_strand in strand.get("sub_strands", []):
-                if sub_strand.get("name") == sub_strand_name:
-                    all_rubrics = []
-                    for skill in sub_strand.get("skills", []):
-                        all_rubrics.append({
-                            "skill": skill.get("skill"),
-                            "rubrics": skill.get("rubrics", [])
-                        })
-                    return all_rubrics
-    return []
+    index = get_curriculum_index(curriculum_file)
+    return list(index.rubrics_by_sub_strand.get(sub_strand_name, ()))
+
+
+def get_rubric_prompt_text(
+        sub_strand_name: str,
+        curriculum_file: str = CURRICULUM_FILE,
+) -> str:
+    """Pre-rendered rubric text for a sub-strand's grading prompt."""
+    return get_curriculum_index(curriculum_file).get_rubric_prompt_text(sub_strand_name)
+
+
+def get_rubric_prompt_tokens(
+        sub_strand_name: str,
+        llm_model: str,
+        curriculum_file: str = CURRICULUM_FILE,
+) -> int:
+    index = get_curriculum_index(curriculum_file)
+    return index.get_rubric_token_count(sub_strand_name, llm_model)
 
 
 def get_uncovered_strands_up_to_grade(
@@ -226,18 +369,9 @@ def get_uncovered_strands_up_to_grade(
     Returns a list of strand names from grade 7 up to the given grade,
     excluding any already present in tested_strands.
     """
-    missing_strands = []
-    cbc_data = load_curriculum(curriculum_file)
-
-    for item in cbc_data:
-        g = item.get("grade")
-        if g is not None and 7 <= g <= grade:
-            for strand in item.get("strands", []):
-                strand_name = f"{strand['name']} (G{g})"
-                if strand_name not in tested_strands:
-                    missing_strands.append(strand_name)
-
-    return missing_strands
+    index = get_curriculum_index(curriculum_file)
+    tested = set(tested_strands)
+    return [name for name in index.get_strands_up_to_grade(grade) if name not in tested]
 
 
 if __name__ == "__main__":
@@ -249,30 +383,10 @@ if __name__ == "__main__":
 def get_all_sub_strand_names(
     curriculum_file: str = CURRICULUM_FILE,
 ) -> List[str]:
-    cbc_data = load_curriculum(curriculum_file)
-
-    strand_names = []
-    for item in cbc_data:
-        for strand in item.get("strands", []):
-            strand_names.append(strand['name'])
-            sub_strands = strand['sub_strands']
-            for sub_strand in sub_strands:
-                strand_names.append(sub_strand['name'])
-
-    return strand_names
+    return list(get_curriculum_index(curriculum_file).all_sub_strand_names)
 
 
 def get_strand_sub_strand_pairs(
     curriculum_file: str = CURRICULUM_FILE,
 ) -> List[List[str]]:
-    cbc_data = load_curriculum(curriculum_file)
-
-    pairs = []
-    for item in cbc_data:
-        for strand in item.get("strands", []):
-            strand_name = strand['name']
-            for sub_strand in strand.get('sub_strands', []):
-                sub_strand_name = sub_strand['name']
-                description = ". ".join(sub_strand.get('descriptions', []))
-                pairs.append((strand_name, sub_strand_name, description))
-    return pairs
\ No newline at end of file
+    return list(get_curriculum_index(curriculum_file).strand_sub_strand_pairs)
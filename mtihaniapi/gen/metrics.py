@@ -0,0 +1,176 @@
+# metrics.py
+
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+from django.db import connections
+
+# Instrumentation for background pipelines. While a PipelineMetrics is
+# active (track_pipeline_metrics), LLM calls and database queries are
+# recorded against the current stage (track_stage). Both live in context
+# variables, so work handed to other threads is only tracked when it is
+# submitted through submit_in_context.
+
+_current_metrics = contextvars.ContextVar("pipeline_metrics", default=None)
+_current_stage = contextvars.ContextVar("pipeline_stage", default=None)
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def count_inserted_rows(statement: str, params) -> int:
+    """Rows of an INSERT: its parameters over the columns in its column list."""
+    head = statement.split(" VALUES", 1)[0]
+    if "(" not in head or not params:
+        # INSERT ... DEFAULT VALUES
+        return 1
+    column_count = head[head.index("(") + 1:head.rindex(")")].count(",") + 1
+    return len(params) // column_count
+
+def _empty_stage_stats() -> Dict[str, Any]:
+    return {
+        "db_queries": 0,
+        "db_seconds": 0.0,
+        "rows_written": 0,
+        "llm_calls": 0,
+        "llm_seconds": 0.0,
+        "llm_errors": 0,
+        "cache_hits": 0,
+        "input_tokens": 0,
+        "output_tokens": 0,
+    }
+
+
+class PipelineMetrics:
+    def __init__(self, default_stage: str = "task"):
+        self.default_stage = default_stage
+        self._lock = threading.Lock()
+        self._stages = defaultdict(_empty_stage_stats)
+        self._stage_runs: Dict[str, Dict[str, Any]] = {}
+        self.llm_calls: List[Dict[str, Any]] = []
+
+    def _stage(self) -> str:
+        return _current_stage.get() or self.default_stage
+
+    def record_llm_call(self, llm_model: str, seconds: float, input_tokens: int = 0,
+                        output_tokens: int = 0, cached: bool = False, error: Optional[str] = None):
+        stage = self._stage()
+        with self._lock:
+            stats = self._stages[stage]
+            stats["llm_calls"] += 1
+            stats["llm_seconds"] += seconds
+            stats["cache_hits"] += int(cached)
+            stats["llm_errors"] += int(error is not None)
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            self.llm_calls.append({
+                "stage": stage,
+                "model": llm_model,
+                "seconds": round(seconds, 3),
+                "input_tokens": input_tokens,
+                "output_tokens": output_tokens,
+                "cached": cached,
+                "error": error,
+            })
+
+    def record_query(self, seconds: float, rows_written: int):
+        with self._lock:
+            stats = self._stages[self._stage()]
+            stats["db_queries"] += 1
+            stats["db_seconds"] += seconds
+            stats["rows_written"] += rows_written
+
+    def record_stage_run(self, stage: str, status: str, started_at: Optional[str],
+                         duration_seconds: Optional[float]):
+        with self._lock:
+            self._stage_runs[stage] = {
+                "status": status,
+                "started_at": started_at,
+                "duration_seconds": duration_seconds,
+            }
+
+    def __call__(self, execute, sql, params, many, context):
+        """Django execute_wrapper: counts queries and the rows they wrote."""
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            rows_written = 0
+            statement = sql.lstrip().upper()
+            if statement.startswith(WRITE_STATEMENTS):
+                rowcount = getattr(context.get("cursor"), "rowcount", -1)
+                if many:
+                    rows_written = len(params)
+                elif rowcount is not None and rowcount > 0:
+                    rows_written = rowcount
+                elif statement.startswith("INSERT") and " RETURNING " in statement:
+                    # SQLite only counts these rows once they are fetched
+                    rows_written = count_inserted_rows(statement, params)
+            self.record_query(time.perf_counter() - start, rows_written)
+
+    def stage_stats(self, stage: str) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stages.get(stage) or _empty_stage_stats())
+        stats["db_seconds"] = round(stats["db_seconds"], 3)
+        stats["llm_seconds"] = round(stats["llm_seconds"], 3)
+        return stats
+
+    def stages(self) -> Dict[str, Dict[str, Any]]:
+        """Every stage's counters, with its status and timing if it was a pipeline stage."""
+        with self._lock:
+            names = list(dict.fromkeys([*self._stage_runs, *self._stages]))
+            stage_runs = dict(self._stage_runs)
+        return {
+            name: {**stage_runs.get(name, {}), **self.stage_stats(name)}
+            for name in names
+        }
+
+    def totals(self) -> Dict[str, Any]:
+        totals = _empty_stage_stats()
+        for stats in self.stages().values():
+            for key in totals:
+                totals[key] += stats[key]
+        totals["db_seconds"] = round(totals["db_seconds"], 3)
+        totals["llm_seconds"] = round(totals["llm_seconds"], 3)
+        return totals
+
+
+def get_current_metrics() -> Optional[PipelineMetrics]:
+    return _current_metrics.get()
+
+
+@contextmanager
+def track_database_queries(metrics: Optional[PipelineMetrics] = None):
+    """Counts this thread's queries into metrics (default: the active one)."""
+    metrics = metrics or get_current_metrics()
+    if metrics is None:
+        yield
+        return
+    with connections["default"].execute_wrapper(metrics):
+        yield
+
+
+@contextmanager
+def track_pipeline_metrics(metrics: PipelineMetrics):
+    token = _current_metrics.set(metrics)
+    try:
+        with track_database_queries(metrics):
+            yield metrics
+    finally:
+        _current_metrics.reset(token)
+
+
+@contextmanager
+def track_stage(stage: str):
+    token = _current_stage.set(stage)
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+def submit_in_context(executor, fn, *args, **kwargs):
+    """executor.submit that carries the caller's metrics and stage over."""
+    return executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
@@ -0,0 +1,398 @@
+# providers.py
+
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional
+from gen.constants import *
+from gen.prompts import *
+
+# LLM providers behind one interface, looked up by model name. Every call
+# made through a provider, single prompts and fanned-out tasks alike, shares
+# its concurrency and request rate limits. SDK clients are only built on
+# first use, so picking the fake provider needs no API keys or network.
+
+
+class LLMRequest:
+    def __init__(self, model: str, prompt: str, prompt_template: Any = None,
+                 invoke_param: Optional[Dict[str, Any]] = None):
+        """
+        prompt is the formatted prompt sent to the model. prompt_template and
+        invoke_param are what it was formatted from; the fake provider builds
+        its answers from them.
+        """
+        self.model = model
+        self.prompt = prompt
+        self.prompt_template = prompt_template
+        self.invoke_param = invoke_param or {}
+
+
+class LLMCompletion:
+    def __init__(self, text: str, usage: Optional[Dict[str, int]] = None,
+                 truncated: bool = False, raw: Any = None):
+        self.text = text
+        self.usage = usage or {}
+        # Cut off by the output token limit
+        self.truncated = truncated
+        self.raw = raw
+
+
+def get_llm_response_usage(response: Any) -> Dict[str, int]:
+    """Token usage reported by a LangChain message or an Anthropic SDK response."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage:
+        return {"input_tokens": usage.get("input_tokens", 0),
+                "output_tokens": usage.get("output_tokens", 0)}
+    usage = getattr(response, "usage", None)
+    if usage is not None:
+        return {"input_tokens": getattr(usage, "input_tokens", 0) or 0,
+                "output_tokens": getattr(usage, "output_tokens", 0) or 0}
+    return {}
+
+
+class LLMProvider:
+    name = None
+    models = ()
+    temperature = LLM_TEMPERATURE
+    max_tokens = LLM_MAX_TOKENS
+    # Whether responses go through the LLM response cache (gen.cache)
+    cacheable = True
+
+    def __init__(self, max_concurrency: Optional[int] = None,
+                 requests_per_minute: Optional[int] = None):
+        if max_concurrency is None:
+            max_concurrency = LLM_PROVIDER_CONCURRENCY.get(self.name, 4)
+        if requests_per_minute is None:
+            requests_per_minute = LLM_PROVIDER_REQUESTS_PER_MINUTE.get(
+                self.name, 0)
+        self.max_concurrency = max(1, max_concurrency)
+        self.requests_per_minute = requests_per_minute
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._rate_lock = threading.Lock()
+        self._next_request_at = 0.0
+
+    @contextmanager
+    def slot(self):
+        """One of the provider's concurrent slots, paced to requests_per_minute."""
+        with self._semaphore:
+            if self.requests_per_minute:
+                with self._rate_lock:
+                    now = time.monotonic()
+                    start_at = max(now, self._next_request_at)
+                    self._next_request_at = start_at + 60 / self.requests_per_minute
+                time.sleep(start_at - now)
+            yield
+
+    def complete(self, request: LLMRequest,
+                 on_text: Optional[Callable[[str], None]] = None) -> LLMCompletion:
+        """
+        Runs a prompt. With on_text the response is streamed and on_text is
+        called with each piece of text as it arrives.
+        """
+        with self.slot():
+            return self._complete(request, on_text)
+
+    async def acomplete(self, request: LLMRequest,
+                        on_text: Optional[Callable[[str], None]] = None) -> LLMCompletion:
+        # The SDK calls block; keep them off the event loop
+        return await asyncio.to_thread(self.complete, request, on_text)
+
+    def _complete(self, request: LLMRequest,
+                  on_text: Optional[Callable[[str], None]] = None) -> LLMCompletion:
+        raise NotImplementedError
+
+
+class OpenAIProvider(LLMProvider):
+    name = "openai"
+    models = (OPENAI_GPT_4O,)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._clients = {}
+        self._clients_lock = threading.Lock()
+
+    def get_client(self, model: str):
+        with self._clients_lock:
+            if model not in self._clients:
+                from langchain_openai import ChatOpenAI
+                self._clients[model] = ChatOpenAI(
+                    model_name=model,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    openai_api_key=OPENAI_API_KEY,
+                    # Token usage on streamed responses too (gen.metrics)
+                    stream_usage=True,
+                )
+            return self._clients[model]
+
+    def _complete(self, request, on_text=None):
+        llm = self.get_client(request.model)
+        if on_text is None:
+            response = llm.invoke(request.prompt)
+        else:
+            response = None
+            for chunk in llm.stream(request.prompt):
+                response = chunk if response is None else response + chunk
+                on_text(chunk.content)
+        if response is None:
+            return LLMCompletion("")
+
+        return LLMCompletion(
+            text=response.content,
+            usage=get_llm_response_usage(response),
+            truncated=response.response_metadata.get(
+                "finish_reason") == "length",
+            raw=response,
+        )
+
+
+class AnthropicProvider(LLMProvider):
+    name = "anthropic"
+    models = (CLAUDE_SONNET_4, CLAUDE_OPUS_4)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._client = None
+        self._client_lock = threading.Lock()
+
+    def get_client(self):
+        with self._client_lock:
+            if self._client is None:
+                from anthropic import Client
+                self._client = Client(api_key=ANTHROPIC_API_KEY)
+            return self._client
+
+    def _complete(self, request, on_text=None):
+        client = self.get_client()
+        message = {
+            "model": request.model,
+            "max_tokens": self.max_tokens,
+            "temperature": self.temperature,
+            "messages": [
+                {"role": "user", "content": request.prompt}
+            ],
+        }
+        if on_text is None:
+            response = client.messages.create(**message)
+        else:
+            with client.messages.stream(**message) as message_stream:
+                for text in message_stream.text_stream:
+                    on_text(text)
+                response = message_stream.get_final_message()
+
+        return LLMCompletion(
+            text="".join(getattr(block, "text", "")
+                         for block in response.content),
+            usage=get_llm_response_usage(response),
+            truncated=response.stop_reason == "max_tokens",
+            raw=response,
+        )
+
+
+# ================================================================== FAKE PROVIDER
+
+
+def _fake_score(*parts: Any) -> int:
+    # Stable per answer, however the answers were chunked into prompts
+    digest = hashlib.sha256("|".join(map(str, parts)).encode("utf-8")).digest()
+    return digest[0] % 4 + 1
+
+
+def _fake_questions(params: Dict[str, Any], rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "question": f"{skill}: question {idx + 1} on {params.get('sub_strand')} "
+                        f"({rng.randint(1000, 9999)})",
+            "expected_answer": f"Expected answer {idx + 1} on {params.get('sub_strand')}",
+        }
+        for idx, skill in enumerate(params.get("skills_to_test") or [])
+    ]
+
+
+def _fake_mock_answers(params: Dict[str, Any], rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "id": student.get("id"),
+            "answers": [
+                {
+                    "question_id": question.get("id"),
+                    "answer": rng.choice(["", "I don't know", question.get("expected_answer", "")]),
+                }
+                for question in params.get("exam") or []
+            ],
+        }
+        for student in params.get("student_list") or []
+    ]
+
+
+def _fake_grades(params: Dict[str, Any], rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "answer_id": answer.get("answer_id"),
+            "score": _fake_score(params.get("question"), answer.get("answer")),
+        }
+        for answer in params.get("student_answers") or []
+    ]
+
+
+def _fake_class_insights(params: Dict[str, Any], rng: random.Random) -> List[str]:
+    return [f"Class insight {idx + 1}" for idx in range(rng.randint(2, 4))]
+
+
+def _fake_strand_insights(params: Dict[str, Any], rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "strand": strand.get("name"),
+            "insights": [f"Insight on {strand.get('name')}"],
+            "suggestions": [f"Suggestion for {strand.get('name')}"],
+        }
+        for strand in params.get("strand_performance_data") or []
+    ]
+
+
+def _fake_sub_strand_insights(params: Dict[str, Any], rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "pair": [item.get("name"), item.get("strongest_negative_pair")],
+            "correlation": item.get("correlation"),
+            "insight": f"Insight on {item.get('name')}",
+            "suggestion": f"Suggestion for {item.get('name')}",
+        }
+        for item in params.get("sub_strand_correlations") or []
+    ]
+
+
+def _fake_follow_up_quiz(params: Dict[str, Any], rng: random.Random) -> List[Dict[str, Any]]:
+    exam_questions = params.get("exam_questions") or [{}]
+    quiz = []
+    for idx in range(int(params.get("question_count") or 0)):
+        source = rng.choice(exam_questions)
+        quiz.append({
+            "question": f"Follow up question {idx + 1}",
+            "expected_answer": f"Follow up answer {idx + 1}",
+            "grade": str(source.get("grade", 7)),
+            "strand": source.get("strand", ""),
+            "sub_strand": source.get("sub_strand", ""),
+            "bloom_skill": source.get("bloom_skill") or rng.choice(BLOOM_SKILLS),
+        })
+    return quiz
+
+
+def _fake_sub_strand_samples(params: Dict[str, Any], rng: random.Random) -> List[Dict[str, Any]]:
+    return [
+        {
+            "question": f"Sample question {idx + 1} on {params.get('sub_strand')}",
+            "expected_answer": f"Sample answer {idx + 1}",
+        }
+        for idx in range(rng.randint(1, 3))
+    ]
+
+
+# Keyed by prompt text (gen.prompts)
+FAKE_LLM_RESPONSE_BUILDERS = {
+    CREATE_EXAM_PROMPT_TEXT: _fake_questions,
+    MOCK_EXAM_ANSWERS_PROMPT_TEXT: _fake_mock_answers,
+    GRADE_ANSWERS_PROMPT_TEXT: _fake_grades,
+    CLASSROOM_EXAM_INSIGHTS_PROMPT: _fake_class_insights,
+    STRAND_PERFORMANCE_INSIGHTS_PROMPT: _fake_strand_insights,
+    FLAGGED_SUB_STRAND_INSIGHTS_PROMPT: _fake_sub_strand_insights,
+    CREATE_CLUSTER_FOLLOW_UP_QUIZ_PROMPT: _fake_follow_up_quiz,
+    EXTRACT_SUB_STRAND_CONTEXT_PROMPT: _fake_sub_strand_samples,
+}
+
+
+class FakeLLMProvider(LLMProvider):
+    """
+    Local stand-in that answers every app prompt with schema-valid JSON
+    built from the request, seeded by the prompt so the same prompt always
+    gets the same answer. Each call takes latency_seconds, give or take
+    jitter_seconds, spread over the streamed chunks.
+    """
+    name = "fake"
+    models = (FAKE_LLM,)
+    # Load tests should pay the latency of every call
+    cacheable = False
+
+    def __init__(self, latency_seconds: float = FAKE_LLM_LATENCY_SECONDS,
+                 jitter_seconds: float = FAKE_LLM_LATENCY_JITTER_SECONDS,
+                 chunk_size: int = 64, **kwargs):
+        super().__init__(**kwargs)
+        self.latency_seconds = latency_seconds
+        self.jitter_seconds = jitter_seconds
+        self.chunk_size = chunk_size
+
+    def _complete(self, request, on_text=None):
+        seed = hashlib.sha256(request.prompt.encode("utf-8")).hexdigest()
+        rng = random.Random(seed)
+
+        template_text = getattr(request.prompt_template, "template", None)
+        builder = FAKE_LLM_RESPONSE_BUILDERS.get(template_text)
+        if builder is None:
+            raise ValueError("Fake LLM has no response for this prompt")
+        text = json.dumps(builder(request.invoke_param, rng),
+                          ensure_ascii=False)
+
+        latency = max(0.0, self.latency_seconds +
+                      rng.uniform(-self.jitter_seconds, self.jitter_seconds))
+        if on_text is None:
+            time.sleep(latency)
+        else:
+            chunks = [text[i:i + self.chunk_size]
+                      for i in range(0, len(text), self.chunk_size)] or [""]
+            for chunk in chunks:
+                time.sleep(latency / len(chunks))
+                on_text(chunk)
+
+        return LLMCompletion(
+            text=text,
+            usage={"input_tokens": len(request.prompt) // 4,
+                   "output_tokens": len(text) // 4},
+        )
+
+
+# ================================================================== REGISTRY
+
+_llm_providers: Dict[str, LLMProvider] = {}
+_llm_providers_lock = threading.Lock()
+
+
+def register_llm_provider(provider: LLMProvider) -> LLMProvider:
+    """Serves provider.models from provider, replacing any earlier provider of theirs."""
+    with _llm_providers_lock:
+        for model in provider.models:
+            _llm_providers[model] = provider
+    return provider
+
+
+def get_llm_provider(llm: str) -> Optional[LLMProvider]:
+    with _llm_providers_lock:
+        return _llm_providers.get(llm)
+
+
+def get_llm_models() -> List[str]:
+    with _llm_providers_lock:
+        return list(_llm_providers)
+
+
+register_llm_provider(OpenAIProvider())
+register_llm_provider(AnthropicProvider())
+register_llm_provider(FakeLLMProvider())
+
+
+@contextmanager
+def override_llm_provider(provider: LLMProvider):
+    """Serves every registered model from provider until exit, e.g. the fake one in benchmarks."""
+    with _llm_providers_lock:
+        saved = dict(_llm_providers)
+        for model in saved:
+            _llm_providers[model] = provider
+    try:
+        yield provider
+    finally:
+        with _llm_providers_lock:
+            _llm_providers.clear()
+            _llm_providers.update(saved)
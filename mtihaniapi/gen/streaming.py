@@ -0,0 +1,90 @@
+# streaming.py
+
+import json
+from typing import Any, List
+
+
+class JsonArrayStreamParser:
+    """
+    Incrementally parses a streamed LLM response holding a JSON array of
+    objects (or arrays).
+
+    feed() takes text as it arrives and returns the top-level items whose
+    JSON has closed since the last call. Anything before the opening bracket
+    (a ```json fence, a preamble) is skipped. A response that is an object,
+    or an array of scalars, stops yielding items (is_array is False) and
+    callers parse it whole.
+    """
+
+    def __init__(self):
+        self.items: List[Any] = []
+        self.is_array = None  # None until the first bracket or brace
+        self.closed = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._item_chars: List[str] = []
+
+    @property
+    def started(self) -> bool:
+        return self.is_array is not None
+
+    def feed(self, text: str) -> List[Any]:
+        new_items = []
+        for char in text:
+            if self.closed or self.is_array is False:
+                break
+
+            if not self.started:
+                if char == "[":
+                    self.is_array = True
+                elif char == "{":
+                    self.is_array = False
+                continue
+
+            if self._in_string:
+                self._item_chars.append(char)
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if self._depth == 0:
+                # Between items: only separators, whitespace or the end
+                if char == "]":
+                    self.closed = True
+                    continue
+                if char in ", \n\r\t":
+                    continue
+                if char not in "[{":
+                    self.is_array = False
+                    break
+
+            self._item_chars.append(char)
+            if char == '"':
+                self._in_string = True
+            elif char in "[{":
+                self._depth += 1
+            elif char in "]}":
+                self._depth -= 1
+
+            if self._depth == 0 and char in "]}":
+                new_items.append(self._close_item())
+
+        return new_items
+
+    def _close_item(self) -> Any:
+        raw = "".join(self._item_chars).strip()
+        self._item_chars = []
+        # Raises json.JSONDecodeError on a malformed item
+        item = json.loads(raw)
+        self.items.append(item)
+        return item
+
+    @property
+    def is_truncated(self) -> bool:
+        """The array was opened but the stream ended before it closed."""
+        return bool(self.is_array) and not self.closed
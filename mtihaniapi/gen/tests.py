@@ -0,0 +1,452 @@
+# gen/tests.py
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest.mock import patch
+from django.test import SimpleTestCase
+from gen.cache import SQLiteLLMResponseCache, get_llm_cache_key
+from gen.curriculum import *
+from gen.metrics import PipelineMetrics
+from gen.providers import FakeLLMProvider, LLMRequest, get_llm_models, get_llm_provider, override_llm_provider
+from gen.streaming import JsonArrayStreamParser
+from gen.utils import *
+
+
+class RunLLMFanOutTests(SimpleTestCase):
+    """Concurrent LLM tasks come back in input order, failures where they happened."""
+
+    def test_results_keep_input_order(self):
+        def llm_function(task_input):
+            # Later inputs finish first
+            time.sleep((5 - task_input) * 0.01)
+            return [task_input]
+
+        completed = []
+        res = run_llm_fan_out(
+            list(range(5)), llm_function, max_workers=5,
+            on_result=lambda idx, result: completed.append(idx))
+
+        self.assertEqual(res, [[0], [1], [2], [3], [4]])
+        self.assertEqual(sorted(completed), [0, 1, 2, 3, 4])
+
+    def test_failures_are_retried_then_kept_in_place(self):
+        calls = {}
+        lock = threading.Lock()
+
+        def llm_function(task_input):
+            with lock:
+                calls[task_input] = calls.get(task_input, 0) + 1
+                attempt = calls[task_input]
+            if task_input == "flaky" and attempt == 1:
+                return {"error": "Rate limited"}
+            if task_input == "broken":
+                return {"error": "Invalid JSON"}
+            return [task_input]
+
+        res = run_llm_fan_out(
+            ["ok", "flaky", "broken", "ok too"], llm_function, retries=1, fail_fast=False)
+
+        self.assertEqual(res[0], ["ok"])
+        self.assertEqual(res[1], ["flaky"])
+        self.assertEqual(res[2], {"error": "Invalid JSON"})
+        self.assertEqual(res[3], ["ok too"])
+        self.assertEqual(calls, {"ok": 1, "flaky": 2, "broken": 2, "ok too": 1})
+
+    def test_fail_fast_returns_the_first_error(self):
+        def llm_function(task_input):
+            if task_input == 1:
+                return {"error": "Invalid JSON"}
+            return [task_input]
+
+        res = run_llm_fan_out([0, 1, 2], llm_function, retries=0)
+        self.assertEqual(res, {"error": "Invalid JSON"})
+
+    def test_streamed_items_are_handed_over_per_task(self):
+        def llm_function(task_input, on_item=None):
+            items = [f"{task_input}-{idx}" for idx in range(3)]
+            for idx, item in enumerate(items):
+                on_item(idx, item)
+            return items
+
+        streamed = []
+        res = run_llm_fan_out(
+            ["a", "b"], llm_function,
+            on_item=lambda idx, item_index, item: streamed.append((idx, item_index, item)))
+
+        self.assertEqual(res, [["a-0", "a-1", "a-2"], ["b-0", "b-1", "b-2"]])
+        self.assertEqual(sorted(streamed), [
+            (0, 0, "a-0"), (0, 1, "a-1"), (0, 2, "a-2"),
+            (1, 0, "b-0"), (1, 1, "b-1"), (1, 2, "b-2"),
+        ])
+
+
+def get_answers_data(answer_count):
+    return {
+        "question": "Name two states of matter.",
+        "expected_answer": "Solid and liquid",
+        "rubrics": ["1 - none", "2 - one state", "3 - two states", "4 - two states with examples"],
+        "student_answers": [
+            {"answer_id": answer_id, "answer": f"Answer {answer_id}"}
+            for answer_id in range(1, answer_count + 1)
+        ],
+    }
+
+
+@patch("gen.utils.get_token_count_from_str", lambda text, llm_model: len(text) // 4)
+class GradingChunkTests(SimpleTestCase):
+    """Large classes are graded in bounded chunks, and nothing is left ungraded."""
+
+    def test_chunks_respect_answer_limit_and_token_budget(self):
+        answers_data = get_answers_data(10)
+
+        chunks = chunk_student_answers(answers_data, max_answers=4)
+        self.assertEqual([len(c["student_answers"]) for c in chunks], [4, 4, 2])
+
+        base_tokens = len(GRADE_ANSWERS_LLM_PROMPT.format(
+            question=answers_data["question"], expected_answer=answers_data["expected_answer"],
+            rubrics=answers_data["rubrics"], student_answers=[])) // 4
+        answer_tokens = len(f"{answers_data['student_answers'][0]}, ") // 4
+        chunks = chunk_student_answers(
+            answers_data, token_budget=base_tokens + 3 * answer_tokens)
+        self.assertEqual([len(c["student_answers"]) for c in chunks], [3, 3, 3, 1])
+
+        # Every answer once, in order, with the question carried along
+        self.assertEqual(
+            [a for c in chunks for a in c["student_answers"]], answers_data["student_answers"])
+        self.assertTrue(all(c["question"] == answers_data["question"] for c in chunks))
+
+    def test_missing_grades_are_re_requested(self):
+        requested = []
+
+        def run_llm_qa_grades(answers_data, **kwargs):
+            answer_ids = [a["answer_id"] for a in answers_data["student_answers"]]
+            requested.append(answer_ids)
+            if len(requested) == 1:
+                # Leaves out answer 3, grades answer 1 twice and makes up answer 9
+                return [{"answer_id": "1", "score": 4}, {"answer_id": 1, "score": 1},
+                        {"answer_id": 2, "score": 2}, {"answer_id": 9, "score": 3}]
+            return [{"answer_id": answer_id, "score": 3} for answer_id in answer_ids]
+
+        with patch("gen.utils._run_llm_qa_grades", run_llm_qa_grades):
+            grades = generate_llm_qa_grades(get_answers_data(3))
+
+        self.assertEqual(requested, [[1, 2, 3], [3]])
+        self.assertEqual(grades, [
+            {"answer_id": 1, "score": 4}, {"answer_id": 2, "score": 2}, {"answer_id": 3, "score": 3}])
+
+    def test_grades_still_missing_after_retries_are_an_error(self):
+        def run_llm_qa_grades(answers_data, **kwargs):
+            return [{"answer_id": 1, "score": 4}]
+
+        with patch("gen.utils._run_llm_qa_grades", run_llm_qa_grades):
+            res = generate_llm_qa_grades(get_answers_data(2), missing_retries=1)
+
+        self.assertEqual(res, {"error": "Missing grades for answer ids: [2]"})
+
+
+class DedupeStudentAnswersTests(SimpleTestCase):
+    """Only answers identical up to whitespace share a grading slot."""
+
+    def test_case_different_answers_are_graded_separately(self):
+        answers_data = {
+            "question": "What is the symbol for cobalt?",
+            "student_answers": [
+                {"answer_id": 1, "answer": "Co"},
+                {"answer_id": 2, "answer": "CO"},
+                {"answer_id": 3, "answer": "  Co "},
+                {"answer_id": 4, "answer": "co"},
+                {"answer_id": 5, "answer": " "},
+                {"answer_id": 6, "answer": "CO"},
+            ],
+        }
+
+        deduped, duplicate_ids, blank_grades = dedupe_student_answers(
+            answers_data)
+
+        self.assertEqual(
+            [ans["answer_id"] for ans in deduped["student_answers"]], [1, 2, 4])
+        self.assertEqual(duplicate_ids, {1: [1, 3], 2: [2, 6], 4: [4]})
+        self.assertEqual(blank_grades, [{"answer_id": 5, "score": 0}])
+
+        grades = expand_duplicate_grades(
+            [{"answer_id": 1, "score": 4}, {"answer_id": 2, "score": 1},
+             {"answer_id": 4, "score": 2}], duplicate_ids)
+        self.assertEqual(
+            {grade["answer_id"]: grade["score"] for grade in grades},
+            {1: 4, 3: 4, 2: 1, 6: 1, 4: 2})
+
+
+class SQLiteLLMResponseCacheTests(SimpleTestCase):
+    """Content-addressed LLM responses on disk, without leaking connections."""
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.file_path = os.path.join(tmp_dir.name, "cache", "llm_cache.sqlite3")
+
+    def test_key_is_stable_and_content_addressed(self):
+        key = get_llm_cache_key("gpt-4o", 0.2, "Grade these answers")
+        self.assertEqual(key, get_llm_cache_key("gpt-4o", 0.2, "Grade these answers"))
+        self.assertNotEqual(key, get_llm_cache_key("gpt-4o", 0.2, "Grade these answers "))
+        self.assertNotEqual(key, get_llm_cache_key("gpt-4o", 0.3, "Grade these answers"))
+        self.assertNotEqual(key, get_llm_cache_key("claude-sonnet-4", 0.2, "Grade these answers"))
+
+    def test_hits_misses_and_expiry(self):
+        cache = SQLiteLLMResponseCache(file_path=self.file_path)
+        self.assertIsNone(cache.get("key"))
+        cache.set("key", "[1, 2]")
+        self.assertEqual(cache.get("key"), "[1, 2]")
+        # Another process reading the same file sees it too
+        self.assertEqual(
+            SQLiteLLMResponseCache(file_path=self.file_path).get("key"), "[1, 2]")
+        self.assertEqual(
+            cache.stats(), {"hits": 1, "misses": 1, "sets": 1, "errors": 0})
+
+        with patch("gen.cache.time.time", return_value=10 ** 12):
+            self.assertIsNone(cache.get("key"))
+
+    def test_evicts_least_recently_used(self):
+        cache = SQLiteLLMResponseCache(file_path=self.file_path, max_entries=2)
+        with patch("gen.cache.time.time", side_effect=range(1, 100)):
+            cache.set("a", "1")
+            cache.set("b", "2")
+            cache.get("a")
+            cache.set("c", "3")
+            self.assertEqual(
+                [cache.get(key) for key in ("a", "b", "c")], ["1", None, "3"])
+
+    def test_connections_are_closed(self):
+        connections = []
+        sqlite_connect = sqlite3.connect
+
+        def connect(*args, **kwargs):
+            connections.append(sqlite_connect(*args, **kwargs))
+            return connections[-1]
+
+        with patch("gen.cache.sqlite3.connect", connect):
+            cache = SQLiteLLMResponseCache(file_path=self.file_path)
+            cache.set("key", "value")
+            cache.get("key")
+            cache.get("missing")
+
+        self.assertEqual(len(connections), 4)
+        for conn in connections:
+            with self.assertRaises(sqlite3.ProgrammingError):
+                conn.execute("SELECT 1")
+
+
+    def test_only_cacheable_calls_use_the_cache(self):
+        answers_data = get_answers_data(4)
+        cache = SQLiteLLMResponseCache(file_path=self.file_path)
+        cacheable = FakeLLMProvider(latency_seconds=0, jitter_seconds=0)
+        cacheable.cacheable = True
+
+        with patch("gen.utils.get_llm_response_cache", return_value=cache) as get_cache:
+            with override_llm_provider(FakeLLMProvider(latency_seconds=0, jitter_seconds=0)):
+                generate_llm_qa_grades(answers_data)
+            get_cache.assert_not_called()
+
+            with override_llm_provider(cacheable):
+                grades = generate_llm_qa_grades(answers_data)
+                with patch.object(cacheable, "_complete") as complete:
+                    self.assertEqual(generate_llm_qa_grades(answers_data), grades)
+                complete.assert_not_called()
+
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "sets": 1, "errors": 0})
+
+class CurriculumIndexTests(SimpleTestCase):
+    """The curriculum is loaded once per file version and answers like the raw JSON."""
+
+    def setUp(self):
+        tmp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp_dir.cleanup)
+        self.file_path = os.path.join(tmp_dir.name, "cbc_data.json")
+        self.cbc_data = load_curriculum(CURRICULUM_FILE)
+        with open(self.file_path, "w") as f:
+            json.dump(self.cbc_data, f)
+
+    def test_loaded_once_until_the_file_changes(self):
+        with patch("gen.curriculum.load_curriculum", wraps=load_curriculum) as load:
+            index = get_curriculum_index(self.file_path)
+            self.assertIs(get_curriculum_index(self.file_path), index)
+            self.assertEqual(load.call_count, 1)
+
+            mtime = os.path.getmtime(self.file_path)
+            os.utime(self.file_path, (mtime + 10, mtime + 10))
+            self.assertIsNot(get_curriculum_index(self.file_path), index)
+            self.assertEqual(load.call_count, 2)
+
+    def test_lookups_match_the_raw_curriculum(self):
+        strand_ids = [pair["id"] for pair in get_strand_id_grade_pairs(self.cbc_data)]
+        self.assertEqual(get_strand_id_grade_pairs(), get_strand_id_grade_pairs(self.cbc_data))
+
+        index = get_curriculum_index(self.file_path)
+        selected = strand_ids[::-2] + [-1]
+        self.assertEqual(
+            index.get_selected_strands(selected),
+            parse_curriculum(selected, self.cbc_data)["selected"])
+
+    def test_rubric_text_is_rendered_as_in_grading_prompts(self):
+        index = get_curriculum_index(self.file_path)
+        sub_strand = self.cbc_data[0]["strands"][0]["sub_strands"][0]
+        rubrics = [
+            {"skill": skill.get("skill"), "rubrics": skill.get("rubrics", [])}
+            for skill in sub_strand.get("skills", [])
+        ]
+
+        self.assertEqual(index.get_rubric_prompt_text(sub_strand["name"]), str(rubrics))
+        self.assertEqual(index.get_rubric_prompt_text("Unknown"), "[]")
+
+        with patch("gen.utils.get_token_count_from_str", return_value=42) as count:
+            self.assertEqual(index.get_rubric_token_count(sub_strand["name"], "gpt-4o"), 42)
+            self.assertEqual(index.get_rubric_token_count(sub_strand["name"], "gpt-4o"), 42)
+        self.assertEqual(count.call_count, 1)
+
+
+class JsonArrayStreamParserTests(SimpleTestCase):
+    """Streamed array items are handed out as soon as their JSON closes."""
+
+    def feed_chunks(self, text, chunk_size):
+        parser = JsonArrayStreamParser()
+        fed = []
+        for i in range(0, len(text), chunk_size):
+            fed.append(parser.feed(text[i:i + chunk_size]))
+        return parser, fed
+
+    def test_items_split_across_chunks(self):
+        items = [
+            {"number": 1, "question": "Name a {mixture}, e.g. \"salt\" [water]"},
+            {"number": 2, "options": ["A", "B"]},
+        ]
+        text = "```json\n" + json.dumps(items, indent=2) + "\n```"
+
+        for chunk_size in (1, 3, 7, len(text)):
+            parser, fed = self.feed_chunks(text, chunk_size)
+            self.assertEqual([item for new in fed for item in new], items)
+            self.assertEqual(parser.items, items)
+            self.assertTrue(parser.is_array)
+            self.assertFalse(parser.is_truncated)
+
+        # Each item is handed out once, as soon as it closes
+        parser = JsonArrayStreamParser()
+        first, rest = json.dumps(items).rsplit("}, ", 1)
+        self.assertEqual(parser.feed(first), [])
+        self.assertEqual(parser.feed("}, "), [items[0]])
+        self.assertEqual(parser.feed(rest), [items[1]])
+
+    def test_truncated_stream_keeps_complete_items(self):
+        text = json.dumps([{"number": 1}, {"number": 2}, {"number": 3}])
+        parser, fed = self.feed_chunks(text[:-12], 5)
+
+        self.assertEqual(parser.items, [{"number": 1}, {"number": 2}])
+        self.assertTrue(parser.is_truncated)
+
+    def test_non_array_response_is_left_to_the_caller(self):
+        parser = JsonArrayStreamParser()
+        self.assertEqual(parser.feed('{"error": "No questions"}'), [])
+        self.assertFalse(parser.is_array)
+        self.assertFalse(parser.is_truncated)
+
+        parser = JsonArrayStreamParser()
+        self.assertEqual(parser.feed('["Solid", "Gas"]'), [])
+        self.assertFalse(parser.is_array)
+        self.assertEqual(parser.items, [])
+
+    def test_malformed_item_raises(self):
+        parser = JsonArrayStreamParser()
+        parser.feed('[{"number": 1}, ')
+        with self.assertRaises(json.JSONDecodeError):
+            parser.feed('{"number": 2,}]')
+        self.assertEqual(parser.items, [{"number": 1}])
+
+
+@patch("gen.utils.get_token_count_from_str", lambda text, llm_model: len(text) // 4)
+class FakeLLMProviderTests(SimpleTestCase):
+    """The fake provider answers app prompts the same way every time, in the app's schema."""
+
+    def setUp(self):
+        self.provider = FakeLLMProvider(latency_seconds=0, jitter_seconds=0, chunk_size=16)
+
+    def grading_request(self, answers_data):
+        return LLMRequest(
+            model=DEFAULT_LLM,
+            prompt=GRADE_ANSWERS_LLM_PROMPT.format(**answers_data),
+            prompt_template=GRADE_ANSWERS_LLM_PROMPT,
+            invoke_param=answers_data,
+        )
+
+    def test_same_prompt_same_response(self):
+        request = self.grading_request(get_answers_data(4))
+        first = self.provider.complete(request)
+
+        streamed = []
+        second = self.provider.complete(request, on_text=streamed.append)
+
+        self.assertEqual(first.text, second.text)
+        self.assertGreater(len(streamed), 1)
+        self.assertEqual("".join(streamed), first.text)
+        self.assertGreater(first.usage["input_tokens"], 0)
+
+    def test_grades_match_the_grading_schema(self):
+        answers_data = get_answers_data(4)
+        with override_llm_provider(self.provider):
+            grades = generate_llm_qa_grades(answers_data)
+            # An answer gets the same grade whichever chunk it was sent in
+            chunked = [
+                grade
+                for chunk in chunk_student_answers(answers_data, max_answers=3)
+                for grade in generate_llm_qa_grades(chunk)
+            ]
+
+        self.assertEqual([g["answer_id"] for g in grades], [1, 2, 3, 4])
+        self.assertTrue(all(g["score"] in [1, 2, 3, 4] for g in grades))
+        self.assertEqual(chunked, grades)
+
+    def test_unknown_prompt_is_an_error(self):
+        request = LLMRequest(model=DEFAULT_LLM, prompt="Hello", prompt_template=None)
+        with self.assertRaises(ValueError):
+            self.provider.complete(request)
+
+    def test_override_restores_the_providers(self):
+        providers = {model: get_llm_provider(model) for model in get_llm_models()}
+
+        with self.assertRaises(RuntimeError):
+            with override_llm_provider(self.provider):
+                self.assertTrue(all(
+                    get_llm_provider(model) is self.provider for model in providers))
+                raise RuntimeError("Stage failed")
+
+        self.assertEqual(
+            {model: get_llm_provider(model) for model in get_llm_models()}, providers)
+
+
+class PipelineMetricsTests(SimpleTestCase):
+    """Queries are counted with the rows they wrote, whatever the INSERT looks like."""
+
+    def rows_written(self, sql, params, rowcount, many=False):
+        class Cursor:
+            pass
+
+        cursor = Cursor()
+        cursor.rowcount = rowcount
+        metrics = PipelineMetrics()
+        metrics(lambda *args: None, sql, params, many, {"cursor": cursor})
+        return metrics.totals()["rows_written"]
+
+    def test_rowcount_is_used_when_known(self):
+        # A PostgreSQL bulk insert has one parameter per column, not per value
+        sql = ('INSERT INTO "exam_examquestion" ("number", "grade") '
+               "SELECT * FROM UNNEST(%s::integer[], %s::integer[]) RETURNING \"id\"")
+        self.assertEqual(self.rows_written(sql, [[1, 2, 3], [7, 7, 7]], rowcount=3), 3)
+        self.assertEqual(self.rows_written('UPDATE "exam_exam" SET "status" = %s', ["Complete"], 2), 2)
+        self.assertEqual(self.rows_written("SELECT 1", [], rowcount=1), 0)
+
+    def test_unfetched_returning_insert_is_counted_from_its_parameters(self):
+        sql = ('INSERT INTO "exam_examquestion" ("number", "grade") '
+               'VALUES (%s, %s), (%s, %s), (%s, %s) RETURNING "id"')
+        self.assertEqual(self.rows_written(sql, [1, 7, 2, 7, 3, 7], rowcount=0), 3)
+        self.assertEqual(
+            self.rows_written('INSERT INTO "exam_exam" DEFAULT VALUES RETURNING "id"', [], rowcount=0), 1)
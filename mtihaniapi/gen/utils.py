@@ -1,21 +1,50 @@
-from collections import defaultdict
+from collections import Counter, defaultdict
+from functools import lru_cache
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 import json
 from operator import itemgetter
-from typing import List, Dict, Any, Union
+import queue
+from typing import Callable, List, Dict, Any, Optional, Tuple, Union
 from langchain.prompts import PromptTemplate
 import re
+import time
 import tiktoken
 from gen.prompts import *
 from gen.constants import *
+from gen.cache import get_llm_cache_key, get_llm_response_cache
+from gen.curriculum import get_rubric_prompt_tokens
+from gen.metrics import get_current_metrics, submit_in_context
+from gen.providers import LLMRequest, get_llm_provider
+from gen.streaming import JsonArrayStreamParser
 
 # ================================================================== UTILS
 
 
+@lru_cache(maxsize=None)
+def get_token_encoding(llm_model: str) -> Optional[tiktoken.Encoding]:
+    try:
+        try:
+            return tiktoken.encoding_for_model(llm_model)
+        except KeyError:
+            # Non-OpenAI models (e.g. Claude) get a close enough approximation
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # The encoding files are downloaded on first use; offline we estimate
+        print(f"Token encoding unavailable for {llm_model}, estimating: {e}")
+        return None
+
+
 def get_token_count_from_str(text: str, llm_model: str) -> int:
-    encoding = tiktoken.encoding_for_model(llm_model)
+    encoding = get_token_encoding(llm_model)
+    if encoding is None:
+        return len(text) // 4
     return len(encoding.encode(text))
 
 
+def get_llm_model_name(llm: Any) -> str:
+    return getattr(llm, "model_name", None) or str(llm)
+
+
 def clean_llm_response(raw_response: str) -> str:
     cleaned = raw_response.strip()
 
@@ -31,58 +60,232 @@ def run_llm_function(
         invoke_param: Dict[str, Any],
         prompt_template: PromptTemplate,
         formatted_prompt: str,
-        llm: Any = OPENAI_LLM_4O,
-        is_debug: bool = False) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+        llm: str = DEFAULT_LLM,
+        is_debug: bool = False,
+        use_cache: bool = True,
+        stream: bool = LLM_STREAMING,
+        on_item: Optional[Callable[[int, Any], None]] = None) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Runs a prompt on the provider of the llm model (gen.providers) and
+    returns its parsed JSON, or an error dict. When streaming, the items of
+    a JSON array response are parsed as they arrive and
+    on_item(item_index, item) is called (on this thread) as each one closes.
+    A response cut off before its array closed returns
+    {"error", "truncated": True, "items": <the completed items>}.
+    """
+    started = time.perf_counter()
+    llm_model = get_llm_model_name(llm)
+    provider = get_llm_provider(llm_model)
+    if provider is None:
+        return {"error": f"Error: Invalid LLM Choice!"}
+
     try:
-        # LCEL-style prompt-to-LLM pipe
-        runnable = prompt_template | llm
-        llm_model = llm.model_name
+        use_cache = use_cache and provider.cacheable
+        cached = None
+        if use_cache:
+            cache = get_llm_response_cache()
+            cache_key = get_llm_cache_key(
+                llm_model, provider.temperature, formatted_prompt)
+            cached = cache.get(cache_key)
+        if cached is not None:
+            if (is_debug):
+                print(f"♻️ LLM cache hit ({llm_model}): {cache.stats()}")
+            record_llm_call(llm_model, started, cached=True)
+            parsed = json.loads(cached)
+            emit_llm_items(parsed, on_item)
+            return parsed
 
         if (is_debug):
             input_tokens = get_token_count_from_str(
                 formatted_prompt, llm_model)
             print(f"📝 Input token count ({llm_model}): {input_tokens}")
 
+        request = LLMRequest(
+            model=llm_model,
+            prompt=formatted_prompt,
+            prompt_template=prompt_template,
+            invoke_param=invoke_param,
+        )
         # Invoke model
-        response = runnable.invoke(invoke_param)
+        parser = None
+        if stream:
+            parser = JsonArrayStreamParser()
+            try:
+                completion = provider.complete(
+                    request, on_text=lambda text: feed_llm_stream(parser, text, on_item))
+            except json.JSONDecodeError as e:
+                # A malformed item: stop the stream rather than wait it out
+                record_llm_call(llm_model, started, error="parse")
+                return {"error": f"Failed to parse LLM response: {e}"}
+            truncated = parser.is_truncated or completion.truncated
+        else:
+            completion = provider.complete(request)
+            truncated = completion.truncated
         if (is_debug):
-            print("📦 Raw LLM output:\n", response)
+            print("📦 Raw LLM output:\n", completion.raw or completion.text)
+
+        if truncated:
+            record_llm_call(llm_model, started,
+                            completion.usage, error="truncated")
+            return truncated_llm_response(parser.items if parser else [])
 
         # Clean and count output tokens
-        cleaned = clean_llm_response(response.content)
+        cleaned = clean_llm_response(completion.text)
 
         if (is_debug):
             output_tokens = get_token_count_from_str(cleaned, llm_model)
             print(f"📤 Output token count ({llm_model}): {output_tokens}")
             print(f"🔢 Total token usage: {input_tokens + output_tokens}")
 
-        try:
-            parsed = json.loads(cleaned)
-            return parsed
-        except json.JSONDecodeError as e:
-            return {"error": f"Failed to parse LLM response: {e}", "raw": cleaned}
+        if parser and parser.is_array:
+            parsed = parser.items
+        else:
+            try:
+                parsed = json.loads(cleaned)
+            except json.JSONDecodeError as e:
+                record_llm_call(llm_model, started,
+                                completion.usage, error="parse")
+                return {"error": f"Failed to parse LLM response: {e}", "raw": cleaned}
+            emit_llm_items(parsed, on_item)
+
+        record_llm_call(llm_model, started, completion.usage)
+        # Only responses that parsed are worth replaying
+        if use_cache:
+            cache.set(cache_key, cleaned)
+        return parsed
 
     except Exception as e:
+        record_llm_call(llm_model, started, error=str(e))
         return {"error": f"Error: {e}"}
 
 
-def safe_parse_claude_llm_output(raw):
-    # If it's already a list, just return it
-    if isinstance(raw, list):
-        return raw
-    # If it's a string, try to parse as JSON
-    if isinstance(raw, str):
-        try:
-            cleaned = raw.strip()
-            # Sometimes LLMs wrap outputs in ``` or ```json code fences
-            if cleaned.startswith("```"):
-                cleaned = cleaned.lstrip("`").replace("json", "", 1).strip()
-            return json.loads(cleaned)
-        except Exception:
-            print("Warning: Could not parse LLM output as JSON.")
-            return []
-    # If it's something else, return empty list
-    return []
+def feed_llm_stream(parser: JsonArrayStreamParser, text: str,
+                    on_item: Optional[Callable[[int, Any], None]] = None):
+    first_index = len(parser.items)
+    for offset, item in enumerate(parser.feed(text or "")):
+        if on_item:
+            on_item(first_index + offset, item)
+
+
+def emit_llm_items(parsed: Any, on_item: Optional[Callable[[int, Any], None]] = None):
+    """on_item for every item of a response that was not streamed item by item."""
+    if on_item and isinstance(parsed, list):
+        for item_index, item in enumerate(parsed):
+            on_item(item_index, item)
+
+
+def truncated_llm_response(items: List[Any]) -> Dict[str, Any]:
+    return {
+        "error": f"LLM response was truncated after {len(items)} complete items",
+        "truncated": True,
+        "items": items,
+    }
+
+
+def record_llm_call(llm_model: str, started: float, usage: Optional[Dict[str, int]] = None,
+                    cached: bool = False, error: Optional[str] = None):
+    """Adds an LLM call to the active pipeline metrics, if any (gen.metrics)."""
+    metrics = get_current_metrics()
+    if metrics is None:
+        return
+    usage = usage or {}
+    metrics.record_llm_call(
+        llm_model,
+        time.perf_counter() - started,
+        input_tokens=usage.get("input_tokens", 0),
+        output_tokens=usage.get("output_tokens", 0),
+        cached=cached,
+        error=error,
+    )
+
+
+def _run_llm_task_with_retries(
+        llm_function: Callable[[Any], Union[List[Any], Dict[str, Any]]],
+        task_input: Any,
+        retries: int,
+        **kwargs) -> Union[List[Any], Dict[str, Any]]:
+    res = {"error": "LLM task was not run"}
+    for _ in range(retries + 1):
+        res = llm_function(task_input, **kwargs)
+        if isinstance(res, list):
+            return res
+    return res
+
+
+def run_llm_fan_out(
+        task_inputs: List[Any],
+        llm_function: Callable[[Any], Union[List[Any], Dict[str, Any]]],
+        max_workers: int = LLM_MAX_WORKERS,
+        retries: int = LLM_TASK_RETRIES,
+        fail_fast: bool = True,
+        on_result: Optional[Callable[[int, List[Any]], None]] = None,
+        on_item: Optional[Callable[[int, int, Any], None]] = None,
+) -> Union[List[Union[List[Any], Dict[str, Any]]], Dict[str, Any]]:
+    """
+    Runs llm_function over task_inputs on a bounded thread pool. The LLM
+    calls themselves are also bounded by their provider's limits.
+
+    Each failed task is retried on its own up to `retries` times. Results are
+    returned in input order. With fail_fast, the first task that still fails
+    cancels the pending ones and its error dict is returned; otherwise failed
+    tasks keep their error dict in place. on_result(index, result) is called
+    from the calling thread as each successful task completes.
+
+    With on_item, llm_function is called with an on_item keyword (see
+    run_llm_function) and on_item(index, item_index, item) is called from
+    the calling thread as each task's streamed items arrive. A retried task
+    streams its items again from item_index 0.
+    """
+    if not task_inputs:
+        return []
+
+    results = [None] * len(task_inputs)
+    streamed_items = queue.Queue()
+
+    def emit_items(idx):
+        return lambda item_index, item: streamed_items.put((idx, item_index, item))
+
+    def drain_items():
+        while on_item:
+            try:
+                on_item(*streamed_items.get_nowait())
+            except queue.Empty:
+                return
+
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, min(max_workers, len(task_inputs))))
+    try:
+        futures = {
+            submit_in_context(
+                executor, _run_llm_task_with_retries, llm_function, task_input, retries,
+                **({"on_item": emit_items(idx)} if on_item else {})): idx
+            for idx, task_input in enumerate(task_inputs)
+        }
+        pending = set(futures)
+        while pending:
+            # Wake up regularly to hand streamed items over while tasks run
+            done, pending = wait(
+                pending, timeout=0.05 if on_item else None, return_when=FIRST_COMPLETED)
+            drain_items()
+            for future in done:
+                idx = futures[future]
+                try:
+                    res = future.result()
+                except Exception as e:
+                    res = {"error": f"Error: {e}"}
+
+                if not isinstance(res, list):
+                    if fail_fast:
+                        return res
+                elif on_result:
+                    on_result(idx, res)
+
+                results[idx] = res
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    return results
+
 
 # ================================================================== CREATE EXAM
 
@@ -98,7 +301,8 @@ CREATE_EXAM_LLM_PROMPT = PromptTemplate(
 def generate_llm_sub_strand_questions(
         sub_strand_data: Dict[str, Any],
         is_debug: bool = False,
-        llm: Any = OPENAI_LLM_4O,
+        llm: str = DEFAULT_LLM,
+        on_item: Optional[Callable[[int, Any], None]] = None,
 ) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
 
     prompt_template = CREATE_EXAM_LLM_PROMPT
@@ -127,55 +331,41 @@ def generate_llm_sub_strand_questions(
         prompt_template=prompt_template,
         formatted_prompt=formatted_prompt,
         llm=llm,
-        is_debug=is_debug
+        is_debug=is_debug,
+        on_item=on_item,
     )
 
     return res
 
 
-CLAUDE_SONNET_4 = "claude-sonnet-4-20250514"
-CLAUDE_OPUS_4 = "claude-opus-4-20250514"
-
-
-def generate_claude_sub_strand_questions(
-    sub_strand_data: Dict[str, Any],
-    llm: str = CLAUDE_SONNET_4,
-) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
-    try:
-        prompt_template = CREATE_EXAM_LLM_PROMPT
-        formatted_prompt = prompt_template.format(
-            strand=sub_strand_data["strand"],
-            sub_strand=sub_strand_data["sub_strand"],
-            learning_outcomes=sub_strand_data["learning_outcomes"],
-            skills_to_assess=sub_strand_data["skills_to_assess"],
-            skills_to_test=sub_strand_data["skills_to_test"],
-            question_count=sub_strand_data["question_count"],
-            sample_questions=sub_strand_data["sample_questions"],
-        )
-
-        response = client.messages.create(
-            model=llm,
-            max_tokens=10240,
-            temperature=0.1,
-            messages=[
-                {"role": "user", "content": formatted_prompt}
-            ]
-        )
-        # This works for non-streaming Claude calls:
-        res_str = "".join(block.text for block in response.content)
-        return safe_parse_claude_llm_output(res_str)
-    except Exception as e:
-        return {"error": f"Error: {e}"}
-
-
 def generate_llm_question_list(
     grouped_question_data: List[Dict[str, Any]],
     is_debug: bool = False,
-    llm: Any = OPENAI_LLM_4O,
+    llm: str = DEFAULT_LLM,
     output_file: str = QUESTION_LIST_OUTPUT_FILE,
+    on_question: Optional[Callable[[Dict[str, Any]], None]] = None,
 ) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
-    all_question_list = []
+    """
+    Generates every sub strand group's questions concurrently. With
+    on_question, each exam question (as from get_db_question_objects) is
+    handed over on the calling thread as soon as all of its variants have
+    streamed in. A retried group can hand a number over again; the final
+    return value is authoritative.
+    """
+    provider = get_llm_provider(llm)
+    if provider is None:
+        return {"error": f"Error: Invalid LLM Choice!"}
+
+    def llm_function(sub_strand_data, on_item=None):
+        return generate_llm_sub_strand_questions(
+            llm=llm,
+            sub_strand_data=sub_strand_data,
+            is_debug=is_debug,
+            on_item=on_item,
+        )
 
+    sub_strand_data_list = []
+    numbered_skills_list = []
     for group in grouped_question_data:
         strand = group["strand"]
         sub_strand = group["sub_strand"]
@@ -193,9 +383,7 @@ def generate_llm_question_list(
         # Step 2: Build a flat list of just the skills (in order)
         skills_only = [entry["skill"] for entry in numbered_skills]
 
-        # Step 3: Generate all questions in one LLM call
-
-        sub_strand_data = {
+        sub_strand_data_list.append({
             "question_count": len(skills_only),
             "strand": strand,
             "sub_strand": sub_strand,
@@ -203,43 +391,60 @@ def generate_llm_question_list(
             "skills_to_assess": skills_to_assess,
             "skills_to_test": skills_only,
             "sample_questions": sample_questions,
-        }
-
-        if (is_debug):
-            print(f"\n{sub_strand} =========")
+        })
+        numbered_skills_list.append(numbered_skills)
 
-        if (llm == OPENAI_LLM_4O):
-            parsed_output = generate_llm_sub_strand_questions(
-                llm=llm,
-                sub_strand_data=sub_strand_data,
-                is_debug=is_debug,
-            )
-        elif (llm == CLAUDE_SONNET_4):
-            parsed_output = generate_claude_sub_strand_questions(
-                llm=llm,
-                sub_strand_data=sub_strand_data,
-            )
-        else:
-            return {"error": f"Error: Invalid LLM Choice!"}
+    # Step 3: Generate each sub strand's questions in one LLM call, all groups concurrently
+    if (is_debug):
+        print(
+            f"\nGenerating {len(sub_strand_data_list)} sub strands ({provider.name}) =========")
+
+    def tag_question(group, numbered_skill, qa):
+        return {
+            "number": numbered_skill["number"],
+            "grade": group["grade"],
+            "strand": group["strand"],
+            "sub_strand": group["sub_strand"],
+            "bloom_skill": numbered_skill["skill"],
+            "description": qa["question"],
+            "expected_answer": qa["expected_answer"],
+        }
 
-        if not isinstance(parsed_output, list):
-            return parsed_output
+    on_item = None
+    if on_question:
+        # Variants streamed so far per (group, number), by position in the response
+        streamed_variants = defaultdict(dict)
+        variant_counts = [Counter(entry["number"] for entry in numbered_skills)
+                          for numbered_skills in numbered_skills_list]
+
+        def on_item(group_idx, item_index, qa):
+            numbered_skills = numbered_skills_list[group_idx]
+            if item_index >= len(numbered_skills) or not isinstance(qa, dict):
+                return
+            numbered_skill = numbered_skills[item_index]
+            number = numbered_skill["number"]
+            variants = streamed_variants[(group_idx, number)]
+            variants[item_index] = tag_question(
+                grouped_question_data[group_idx], numbered_skill, qa)
+            if len(variants) == variant_counts[group_idx][number]:
+                on_question(get_db_question_objects(
+                    [variants[i] for i in sorted(variants)])[0])
+
+    parsed_outputs = run_llm_fan_out(
+        task_inputs=sub_strand_data_list,
+        llm_function=llm_function,
+        on_item=on_item,
+    )
+    if not isinstance(parsed_outputs, list):
+        return parsed_outputs
 
+    all_question_list = []
+    for group, numbered_skills, parsed_output in zip(
+            grouped_question_data, numbered_skills_list, parsed_outputs):
         # Step 4: Map each generated question back to the correct `number`
-        tagged_responses = []
-        for idx, qa in enumerate(parsed_output):
-            question_item = {}
-            question_item["number"] = numbered_skills[idx]["number"]
-            question_item["grade"] = group["grade"]
-            question_item["strand"] = group["strand"]
-            question_item["sub_strand"] = group["sub_strand"]
-            question_item["bloom_skill"] = numbered_skills[idx]["skill"]
-            question_item["description"] = qa["question"]
-            question_item["expected_answer"] = qa["expected_answer"]
-
-            tagged_responses.append(question_item)
-
-        all_question_list.extend(tagged_responses)
+        all_question_list.extend(
+            tag_question(group, numbered_skills[idx], qa)
+            for idx, qa in enumerate(parsed_output))
 
     all_question_list = sorted(all_question_list, key=itemgetter("number"))
 
@@ -311,7 +516,7 @@ def generate_llm_exam_answers_list(
         exam_data: List[Dict[str, Any]],
         student_data: List[Dict[str, Any]],
         is_debug: bool = False,
-        llm: Any = OPENAI_LLM_4O,
+        llm: str = DEFAULT_LLM,
         output_file: str = ANSWERS_LIST_OUTPUT_FILE,
 ) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
 
@@ -351,11 +556,118 @@ GRADE_ANSWERS_LLM_PROMPT = PromptTemplate(
 )
 
 
-def generate_llm_qa_grades(
+def normalise_student_answer(answer: Any) -> str:
+    # Whitespace only: case can matter to the grade (e.g. chemical symbols)
+    return " ".join(str(answer or "").split())
+
+
+def dedupe_student_answers(
+    answers_data: Dict[str, Any],
+) -> Tuple[Dict[str, Any], Dict[Any, List[Any]], List[Dict[str, Any]]]:
+    """
+    Collapses a question's identical answers (after whitespace
+    normalisation) into one representative answer each.
+
+    Returns the deduplicated answers_data, a map of representative answer_id
+    to every answer_id sharing its text, and ready-made 0 grades for blanks.
+    """
+    representatives = {}
+    duplicate_ids = {}
+    blank_grades = []
+    for ans in answers_data["student_answers"]:
+        normalised = normalise_student_answer(ans["answer"])
+        if not normalised:
+            blank_grades.append({"answer_id": ans["answer_id"], "score": 0})
+            continue
+        if normalised in representatives:
+            rep_id = representatives[normalised]["answer_id"]
+            duplicate_ids[rep_id].append(ans["answer_id"])
+            continue
+        representatives[normalised] = ans
+        duplicate_ids[ans["answer_id"]] = [ans["answer_id"]]
+
+    deduped = {**answers_data,
+               "student_answers": list(representatives.values())}
+    return deduped, duplicate_ids, blank_grades
+
+
+def expand_duplicate_grades(
+    grades: List[Dict[str, Any]],
+    duplicate_ids: Dict[Any, List[Any]],
+) -> List[Dict[str, Any]]:
+    expanded = []
+    for grade in grades:
+        answer_id = grade.get("answer_id")
+        for dup_id in duplicate_ids.get(answer_id, [answer_id]):
+            expanded.append({**grade, "answer_id": dup_id})
+    return expanded
+
+
+def chunk_student_answers(
+    answers_data: Dict[str, Any],
+    llm: str = DEFAULT_LLM,
+    token_budget: int = GRADING_PROMPT_TOKEN_BUDGET,
+    max_answers: int = GRADING_MAX_ANSWERS_PER_CHUNK,
+) -> List[Dict[str, Any]]:
+    """
+    Splits a question's student_answers into chunks whose grading prompt stays
+    within token_budget. Each chunk is a copy of answers_data holding only its
+    own student_answers.
+
+    When answers_data carries a sub_strand and its pre-rendered rubric text
+    (see get_rubric_prompt_text), the rubric's cached token count is used
+    instead of encoding it again.
+    """
+    student_answers = answers_data["student_answers"]
+    if not student_answers:
+        return [answers_data]
+
+    llm_model = get_llm_model_name(llm)
+    rubrics = answers_data["rubrics"]
+    sub_strand = answers_data.get("sub_strand")
+    if isinstance(rubrics, str) and sub_strand:
+        rubric_tokens = get_rubric_prompt_tokens(sub_strand, llm_model)
+        rubrics = ""
+    else:
+        rubric_tokens = 0
+
+    base_tokens = rubric_tokens + get_token_count_from_str(
+        GRADE_ANSWERS_LLM_PROMPT.format(
+            question=answers_data["question"],
+            expected_answer=answers_data["expected_answer"],
+            rubrics=rubrics,
+            student_answers=[],
+        ),
+        llm_model,
+    )
+    answers_budget = max(token_budget - base_tokens, 0)
+
+    chunks = []
+    current_chunk = []
+    current_tokens = 0
+    for answer in student_answers:
+        answer_tokens = get_token_count_from_str(f"{answer}, ", llm_model)
+        if current_chunk and (
+            current_tokens + answer_tokens > answers_budget
+            or len(current_chunk) >= max_answers
+        ):
+            chunks.append(current_chunk)
+            current_chunk = []
+            current_tokens = 0
+        current_chunk.append(answer)
+        current_tokens += answer_tokens
+
+    if current_chunk:
+        chunks.append(current_chunk)
+
+    return [{**answers_data, "student_answers": chunk} for chunk in chunks]
+
+
+def _run_llm_qa_grades(
     answers_data: Dict[str, Any],
     is_debug: bool = False,
-    llm: Any = OPENAI_LLM_4O,
-) -> Union[List[List[Any]], Dict[str, Any]]:
+    llm: str = DEFAULT_LLM,
+) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
 
     prompt_template = GRADE_ANSWERS_LLM_PROMPT
     formatted_prompt = prompt_template.format(
@@ -383,27 +695,143 @@ def generate_llm_qa_grades(
     return res
 
 
+def _normalise_answer_id(answer_id: Any) -> Any:
+    try:
+        return int(answer_id)
+    except (TypeError, ValueError):
+        return answer_id
+
+
+def generate_llm_qa_grades(
+    answers_data: Dict[str, Any],
+    is_debug: bool = False,
+    llm: str = DEFAULT_LLM,
+    missing_retries: int = GRADING_MISSING_ANSWER_RETRIES,
+) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Grades one chunk of student answers. Grades are merged by answer_id and
+    any answer the LLM left out is re-requested on its own.
+    """
+    answers_by_id = {
+        _normalise_answer_id(ans["answer_id"]): ans
+        for ans in answers_data["student_answers"]
+    }
+    grades_by_id = {}
+    pending_answers = answers_data["student_answers"]
+
+    for _ in range(missing_retries + 1):
+        res = _run_llm_qa_grades(
+            answers_data={**answers_data, "student_answers": pending_answers},
+            is_debug=is_debug,
+            llm=llm,
+        )
+        if isinstance(res, dict) and res.get("truncated"):
+            # Keep the grades that arrived; the rest are re-requested below
+            res = res["items"]
+        if not isinstance(res, list):
+            return res
+
+        for item in res:
+            if not isinstance(item, dict):
+                continue
+            answer_id = _normalise_answer_id(item.get("answer_id"))
+            # Ignore ids the LLM made up and keep the first grade per answer
+            if answer_id in answers_by_id and answer_id not in grades_by_id:
+                grades_by_id[answer_id] = {**item, "answer_id": answer_id}
+
+        pending_answers = [
+            ans for answer_id, ans in answers_by_id.items()
+            if answer_id not in grades_by_id
+        ]
+        if not pending_answers:
+            break
+
+        if (is_debug):
+            print(f"🔁 Re-requesting {len(pending_answers)} missing grades")
+
+    if pending_answers:
+        missing_ids = [ans["answer_id"] for ans in pending_answers]
+        return {"error": f"Missing grades for answer ids: {missing_ids}"}
+
+    return list(grades_by_id.values())
+
+
 def generate_llm_answer_grades_list(
     grouped_answers_data: List[Dict[str, Any]],
     is_debug: bool = False,
-    llm: Any = OPENAI_LLM_4O,
+    llm: str = DEFAULT_LLM,
     output_file: str = GRADES_LIST_OUTPUT_FILE,
+    max_workers: int = LLM_GRADING_MAX_WORKERS,
+    retries: int = LLM_TASK_RETRIES,
+    fail_fast: bool = True,
+    on_question_graded: Optional[Callable[[
+        Dict[str, Any], List[Dict[str, Any]]], None]] = None,
 ) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    Grades every question group concurrently. Blank answers score 0 without
+    an LLM call and identical answers are graded once, then the grade is
+    copied to every matching answer_id. Large groups are split into
+    token-budgeted chunks and every chunk runs as its own LLM call.
+    on_question_graded(answer_group, grades) is called as each chunk finishes
+    so callers can persist grades straight away. Without fail_fast, the
+    remaining chunks are still graded when one fails and the failures are
+    returned under "details".
+    """
     all_grades = []
-
+    answer_chunks = []
+    duplicate_ids = {}
     for answer_group in grouped_answers_data:
-        if (is_debug):
-            print(f"\n{answer_group['question']} =========")
+        deduped_group, group_duplicate_ids, blank_grades = dedupe_student_answers(
+            answer_group)
+        duplicate_ids.update(group_duplicate_ids)
 
-        parsed_output = generate_llm_qa_grades(
+        if blank_grades:
+            if on_question_graded:
+                on_question_graded(answer_group, blank_grades)
+            all_grades.extend(blank_grades)
+
+        if deduped_group["student_answers"]:
+            answer_chunks.extend(
+                chunk_student_answers(deduped_group, llm=llm))
+
+    if (is_debug):
+        print(
+            f"\nGrading {len(grouped_answers_data)} questions in {len(answer_chunks)} chunks =========")
+
+    def llm_function(answer_chunk):
+        res = generate_llm_qa_grades(
             llm=llm,
-            answers_data=answer_group,
+            answers_data=answer_chunk,
             is_debug=is_debug,
         )
+        if not isinstance(res, list):
+            return res
+        return expand_duplicate_grades(res, duplicate_ids)
+
+    on_result = None
+    if on_question_graded:
+        def on_result(idx, grades):
+            on_question_graded(answer_chunks[idx], grades)
+
+    parsed_outputs = run_llm_fan_out(
+        task_inputs=answer_chunks,
+        llm_function=llm_function,
+        max_workers=max_workers,
+        retries=retries,
+        fail_fast=fail_fast,
+        on_result=on_result,
+    )
+    if not isinstance(parsed_outputs, list):
+        return parsed_outputs
 
+    failed_questions = []
+    for answer_chunk, parsed_output in zip(answer_chunks, parsed_outputs):
         if not isinstance(parsed_output, list):
-            return parsed_output
-
+            failed_questions.append({
+                "question_id": answer_chunk.get("question_id"),
+                "reason": parsed_output.get("error", "Unknown LLM error"),
+            })
+            continue
         all_grades.extend(parsed_output)
 
     if (is_debug):
@@ -411,6 +839,9 @@ def generate_llm_answer_grades_list(
             json.dump(all_grades, f, ensure_ascii=False, indent=4)
         print(f"\n✅ Graded Answers list written to {output_file}")
 
+    if failed_questions:
+        return {"error": "Some questions failed grading", "details": failed_questions}
+
     return all_grades
 
 
@@ -425,7 +856,7 @@ CLASSROOM_EXAM_INSIGHTS_LLM_PROMPT = PromptTemplate(
 def generate_llm_class_perf_insights(
         class_performance_data: List[Dict[str, Any]],
         is_debug: bool = False,
-        llm: Any = OPENAI_LLM_4O,
+        llm: str = DEFAULT_LLM,
 ) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
 
     prompt_template = CLASSROOM_EXAM_INSIGHTS_LLM_PROMPT
@@ -456,7 +887,7 @@ STRAND_PERFORMANCE_INSIGHTS_LLM_PROMPT = PromptTemplate(
 def generate_llm_strand_insights(
         strand_performance_data: List[Dict[str, Any]],
         is_debug: bool = False,
-        llm: Any = OPENAI_LLM_4O,
+        llm: str = DEFAULT_LLM,
 ) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
 
     prompt_template = STRAND_PERFORMANCE_INSIGHTS_LLM_PROMPT
@@ -487,7 +918,7 @@ FLAGGED_SUB_STRAND_INSIGHTS_LLM_PROMPT = PromptTemplate(
 def generate_llm_sub_strand_corr_insights(
         sub_strand_correlations: List[Dict[str, Any]],
         is_debug: bool = False,
-        llm: Any = OPENAI_LLM_4O,
+        llm: str = DEFAULT_LLM,
 ) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
 
     prompt_template = FLAGGED_SUB_STRAND_INSIGHTS_LLM_PROMPT
@@ -521,7 +952,7 @@ def generate_llm_follow_up_quiz(
         cluster_performance: Dict[str, Any],
         question_count: int = 15,
         is_debug: bool = False,
-        llm: Any = OPENAI_LLM_4O,
+        llm: str = DEFAULT_LLM,
 ) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
 
     prompt_template = CREATE_CLUSTER_FOLLOW_UP_QUIZ_LLM_PROMPT
@@ -562,7 +993,7 @@ def generate_llm_sub_strand_q_samples(
     description: str,
     reference_text: str,
     is_debug: bool = False,
-    llm: Any = OPENAI_LLM_4O,
+    llm: str = DEFAULT_LLM,
 ) -> Union[List[List[Any]], Dict[str, Any]]:
     prompt_template = EXTRACT_SUB_STRAND_CONTEXT_LLM_PROMPT
     formatted_prompt = prompt_template.format(
@@ -594,7 +1025,7 @@ def generate_llm_strand_context_list(
     cbc_data: List[List[str]],
     reference_text: str,
     is_debug: bool = False,
-    llm: Any = OPENAI_LLM_4O,
+    llm: str = DEFAULT_LLM,
     output_file: str = DOC_EXTRACT_OUTPUT_FILE,
 ) -> Union[List[Dict[str, Any]], Dict[str, Any]]:
     all_sub_strand_content = []
@@ -47,4 +47,11 @@ class TermScoreAdmin(admin.ModelAdmin):
     list_display = ('student', 'grade', 'term', 'score', 'expectation_level')
     list_filter = ('grade', 'term', 'expectation_level')
     search_fields = ('student__name',)
-    readonly_fields = ('expectation_level',)
\ No newline at end of file
+    readonly_fields = ('expectation_level',)
+
+
+@admin.register(ClassroomSummary)
+class ClassroomSummaryAdmin(admin.ModelAdmin):
+    list_display = ('classroom', 'student_count', 'avg_term_score', 'avg_mtihani_score', 'updated_at')
+    search_fields = ('classroom__name',)
+    readonly_fields = ('avg_term_expectation_level', 'avg_mtihani_expectation_level')
@@ -0,0 +1,70 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:10
+
+import json
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Avg, Count
+from learner.utils import get_avg_expectation_level
+
+
+def backfill_classroom_summaries(apps, schema_editor):
+    Classroom = apps.get_model("learner", "Classroom")
+    ClassroomSummary = apps.get_model("learner", "ClassroomSummary")
+    LessonTime = apps.get_model("learner", "LessonTime")
+    ClassExamPerformance = apps.get_model("exam", "ClassExamPerformance")
+
+    lesson_times = {}
+    for classroom_id, day, time in LessonTime.objects.order_by("time").values_list(
+            "classroom_id", "day", "time"):
+        lesson_times.setdefault(classroom_id, []).append(
+            [day, time.isoformat()])
+
+    mtihani_scores = dict(
+        ClassExamPerformance.objects.order_by().values("exam__classroom_id")
+        .annotate(avg_score=Avg("avg_score")).values_list("exam__classroom_id", "avg_score"))
+
+    classrooms = Classroom.objects.annotate(
+        student_count=Count("students"), avg_term_score=Avg("students__avg_score"))
+    summaries = []
+    for classroom in classrooms.iterator():
+        avg_term_score = classroom.avg_term_score or 0.0
+        avg_mtihani_score = mtihani_scores.get(classroom.id) or 0.0
+        summaries.append(ClassroomSummary(
+            classroom_id=classroom.id,
+            student_count=classroom.student_count,
+            avg_term_score=avg_term_score,
+            avg_term_expectation_level=get_avg_expectation_level(
+                avg_term_score),
+            avg_mtihani_score=avg_mtihani_score,
+            avg_mtihani_expectation_level=get_avg_expectation_level(
+                avg_mtihani_score),
+            lesson_times=json.dumps(lesson_times.get(classroom.id, [])),
+        ))
+    ClassroomSummary.objects.bulk_create(summaries, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('learner', '0001_initial'),
+        ('exam', '0006_pipeline_run'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ClassroomSummary',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('student_count', models.IntegerField(default=0)),
+                ('avg_term_score', models.FloatField(default=0.0)),
+                ('avg_term_expectation_level', models.CharField(blank=True, max_length=100)),
+                ('avg_mtihani_score', models.FloatField(default=0.0)),
+                ('avg_mtihani_expectation_level', models.CharField(blank=True, max_length=100)),
+                ('lesson_times', models.TextField(blank=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('classroom', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary', to='learner.classroom')),
+            ],
+        ),
+        migrations.RunPython(backfill_classroom_summaries,
+                             migrations.RunPython.noop),
+    ]
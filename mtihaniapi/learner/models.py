@@ -1,5 +1,9 @@
+import json
+from typing import List
 from django.db import models
+from django.db.models import Avg, Count
 from django.contrib.auth.models import User
+from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from learner.utils import EXPECTATION_LEVELS, STUDENT_STATUSES, WEEKDAYS, generate_unique_code, get_avg_expectation_level
 
@@ -103,3 +107,78 @@ class TermScore(models.Model):
 
     def __str__(self):
         return f"{self.student.name} - G{self.grade} T{self.term}: {self.score}"
+
+
+class ClassroomSummary(models.Model):
+    """
+    Dashboard figures for a classroom, kept up to date by the writes that
+    change them (see update_classroom_summary) so the classroom list reads
+    one row per classroom.
+    """
+    classroom = models.OneToOneField(
+        Classroom, on_delete=models.CASCADE, related_name='summary')
+    student_count = models.IntegerField(default=0)
+    avg_term_score = models.FloatField(default=0.0)
+    avg_term_expectation_level = models.CharField(
+        max_length=100, blank=True)
+    avg_mtihani_score = models.FloatField(default=0.0)
+    avg_mtihani_expectation_level = models.CharField(
+        max_length=100, blank=True)
+    # JSON list of [day, "HH:MM:SS"] ordered by time
+    lesson_times = models.TextField(blank=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def save(self, *args, **kwargs):
+        self.avg_term_expectation_level = get_avg_expectation_level(
+            self.avg_term_score)
+        self.avg_mtihani_expectation_level = get_avg_expectation_level(
+            self.avg_mtihani_score)
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"{self.classroom} summary"
+
+
+CLASSROOM_SUMMARY_PARTS = ["students", "lesson_times", "mtihani"]
+
+
+def update_classroom_summary(classroom_id: int, parts: List[str] = CLASSROOM_SUMMARY_PARTS) -> ClassroomSummary:
+    """
+    Recomputes the given parts of a classroom's summary from its students,
+    lesson times or class exam performances. A missing summary is built in
+    full.
+    """
+    summary = ClassroomSummary.objects.filter(
+        classroom_id=classroom_id).first()
+    if summary is None:
+        summary = ClassroomSummary(classroom_id=classroom_id)
+        parts = CLASSROOM_SUMMARY_PARTS
+
+    if "students" in parts:
+        students = Student.objects.filter(classroom_id=classroom_id).aggregate(
+            count=Count('id'), avg_score=Avg('avg_score'))
+        summary.student_count = students["count"]
+        summary.avg_term_score = students["avg_score"] or 0.0
+
+    if "lesson_times" in parts:
+        summary.lesson_times = json.dumps([
+            [day, time.isoformat()] for day, time in LessonTime.objects.filter(
+                classroom_id=classroom_id).order_by('time').values_list('day', 'time')
+        ])
+
+    if "mtihani" in parts:
+        summary.avg_mtihani_score = Classroom.objects.filter(id=classroom_id).aggregate(
+            avg_score=Avg('exams__class_exam_performance__avg_score'))["avg_score"] or 0.0
+
+    summary.save()
+    return summary
+
+
+def set_classroom_mtihani_score(classroom_id: int, avg_score: float) -> None:
+    """Called by exam analysis, which has just averaged the class exams."""
+    updated = ClassroomSummary.objects.filter(classroom_id=classroom_id).update(
+        avg_mtihani_score=avg_score,
+        avg_mtihani_expectation_level=get_avg_expectation_level(avg_score),
+        updated_at=timezone.now())
+    if not updated:
+        update_classroom_summary(classroom_id)
@@ -1 +1,179 @@
-# learner/tests.py
\ No newline at end of file
+# learner/tests.py
+import json
+from datetime import timedelta
+from django.contrib.auth.models import Group, User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from exam.models import ClassExamPerformance, Exam, StudentExamSession, StudentExamSessionPerformance
+from learner.models import (
+    Classroom, ClassroomSummary, LessonTime, Student, Teacher, TermScore,
+    set_classroom_mtihani_score, update_classroom_summary)
+from learner.utils import get_avg_expectation_level
+
+USER_CLASSROOMS_URL = "/api/learner/get-user-classrooms"
+CREATE_CLASSROOM_URL = "/api/learner/create-class"
+EDIT_CLASSROOM_URL = "/api/learner/edit-classroom"
+EDIT_STUDENT_URL = "/api/learner/edit-classroom-student"
+
+
+class GetUserClassroomsQueryCountTests(TestCase):
+    """The classroom list costs the same number of queries however many classrooms it shows."""
+
+    @classmethod
+    def setUpTestData(cls):
+        teacher_group = Group.objects.create(name="teacher")
+        cls.student_group = Group.objects.create(name="student")
+
+        cls.teacher_user = User.objects.create(username="teacher")
+        cls.teacher_user.groups.add(teacher_group)
+        cls.teacher = Teacher.objects.create(
+            name="Teacher", phone_no="0700000000", user=cls.teacher_user)
+
+    def create_student_user(self, classroom_count):
+        user = User.objects.create(
+            username=f"student-{classroom_count}", first_name="Amani")
+        user.groups.add(self.student_group)
+
+        now = timezone.now()
+        for idx in range(classroom_count):
+            classroom = Classroom.objects.create(
+                name=f"Class {classroom_count}-{idx}", subject="Integrated Science",
+                school_name="School", school_address="Nairobi", grade=7, teacher=self.teacher)
+            LessonTime.objects.create(
+                classroom=classroom, day="Monday", time="09:00")
+            student = Student.objects.create(
+                name="Amani", classroom=classroom, user=user, avg_score=50 + idx)
+            for term in (1, 2):
+                TermScore.objects.create(
+                    student=student, grade=7, term=term, score=40 + idx + term)
+
+            exam = Exam.objects.create(
+                start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+                classroom=classroom, teacher=self.teacher)
+            session = StudentExamSession.objects.create(
+                student=student, exam=exam)
+            StudentExamSessionPerformance.objects.create(
+                session=session, avg_score=60 + idx)
+            update_classroom_summary(classroom.id)
+        return user
+
+    def count_queries(self, user):
+        client = APIClient()
+        client.force_authenticate(user=user)
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(USER_CLASSROOMS_URL)
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_student_queries_do_not_grow_with_classrooms(self):
+        one_count, _ = self.count_queries(self.create_student_user(1))
+        many_count, classrooms = self.count_queries(
+            self.create_student_user(4))
+
+        self.assertEqual(many_count, one_count)
+        # permission, role, students with classrooms and summaries,
+        # exam performances, term scores
+        self.assertEqual(many_count, 5)
+
+        self.assertEqual(len(classrooms), 4)
+        for classroom in classrooms:
+            idx = int(classroom["name"].rsplit("-", 1)[1])
+            self.assertEqual(classroom["avg_mtihani_score"], 60 + idx)
+            self.assertEqual(
+                [score["score"] for score in classroom["term_scores"]],
+                [41.0 + idx, 42.0 + idx])
+
+    def test_teacher_queries_do_not_grow_with_classrooms(self):
+        self.create_student_user(1)
+        one_count, _ = self.count_queries(self.teacher_user)
+        self.create_student_user(4)
+        many_count, classrooms = self.count_queries(self.teacher_user)
+
+        self.assertEqual(many_count, one_count)
+        self.assertEqual(len(classrooms), 5)
+
+
+class ClassroomSummaryTests(TestCase):
+    """The writes that change a classroom's figures keep its summary row current."""
+
+    def setUp(self):
+        teacher_group = Group.objects.create(name="teacher")
+        user = User.objects.create(username="teacher")
+        user.groups.add(teacher_group)
+        Teacher.objects.create(name="Teacher", phone_no="0700000000", user=user)
+        self.client = APIClient()
+        self.client.force_authenticate(user=user)
+
+    def create_classroom(self):
+        response = self.client.post(CREATE_CLASSROOM_URL, {
+            "name": "Class", "grade": 7, "subject": "Integrated Science",
+            "school_name": "School", "school_address": "Nairobi",
+            "lesson_times": [{"day": "Tuesday", "time": "11:00"}, {"day": "Monday", "time": "09:00"}],
+            "uploaded_students": [
+                {"name": "Amani", "scores": [{"grade": 6, "term": 1, "score": 40},
+                                             {"grade": 6, "term": 2, "score": 60}]},
+                {"name": "Baraka", "scores": [{"grade": 6, "term": 1, "score": 80}]},
+            ],
+        }, format="json")
+        self.assertEqual(response.status_code, 201, response.data)
+        return Classroom.objects.get(name="Class")
+
+    def test_create_and_edit_keep_the_summary_current(self):
+        classroom = self.create_classroom()
+        summary = ClassroomSummary.objects.get(classroom=classroom)
+        self.assertEqual(summary.student_count, 2)
+        self.assertEqual(summary.avg_term_score, 65)
+        self.assertEqual(summary.avg_term_expectation_level, get_avg_expectation_level(65))
+        self.assertEqual(json.loads(summary.lesson_times), [
+            ["Monday", "09:00:00"], ["Tuesday", "11:00:00"]])
+
+        response = self.client.post(f"{EDIT_CLASSROOM_URL}?classroom_id={classroom.id}", {
+            "lesson_times": [{"day": "Friday", "time": "08:00"}],
+            "uploaded_students": [
+                {"name": "Chebet", "scores": [{"grade": 6, "term": 1, "score": 20}]},
+            ],
+        }, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        summary.refresh_from_db()
+        self.assertEqual(summary.student_count, 3)
+        self.assertEqual(summary.avg_term_score, 50)
+        self.assertEqual(json.loads(summary.lesson_times), [["Friday", "08:00:00"]])
+
+        student = Student.objects.get(classroom=classroom, name="Baraka")
+        response = self.client.post(f"{EDIT_STUDENT_URL}?student_id={student.id}", {
+            "updated_term_scores": [{"grade": 6, "term": 2, "score": 50}],
+        }, format="json")
+        self.assertEqual(response.status_code, 200, response.data)
+        summary.refresh_from_db()
+        # Baraka's average is now the newly entered score: (50 + 50 + 20) / 3
+        self.assertEqual(summary.avg_term_score, 40)
+
+    def test_mtihani_score_is_set_by_analysis(self):
+        classroom = self.create_classroom()
+        now = timezone.now()
+        for avg_score in (40, 70):
+            exam = Exam.objects.create(
+                start_date_time=now - timedelta(hours=2), end_date_time=now - timedelta(hours=1),
+                classroom=classroom)
+            ClassExamPerformance.objects.create(exam=exam, avg_score=avg_score)
+
+        with CaptureQueriesContext(connection) as ctx:
+            set_classroom_mtihani_score(classroom.id, 55)
+        self.assertEqual(len(ctx.captured_queries), 1)
+
+        summary = ClassroomSummary.objects.get(classroom=classroom)
+        self.assertEqual(summary.avg_mtihani_score, 55)
+        self.assertEqual(summary.avg_mtihani_expectation_level, get_avg_expectation_level(55))
+        self.assertEqual(summary.student_count, 2)
+
+        # A classroom without a summary gets one built in full, averaging
+        # its class exam performances
+        summary.delete()
+        set_classroom_mtihani_score(classroom.id, 55)
+        summary = ClassroomSummary.objects.get(classroom=classroom)
+        self.assertEqual(summary.avg_mtihani_score, 55)
+        self.assertEqual(summary.student_count, 2)
+        self.assertEqual(len(json.loads(summary.lesson_times)), 2)
@@ -1,5 +1,6 @@
 from collections import defaultdict, Counter
-from datetime import datetime, timedelta
+import json
+from datetime import datetime, time, timedelta
 from typing import List, Dict, Any
 from django.db.models import Avg
 from rest_framework.decorators import api_view, permission_classes
@@ -10,9 +11,8 @@ from learner.serializers import ClassroomDetailSerializer, ClassroomInputSeriali
 from permissions import IsStudent, IsTeacher, IsTeacherOrStudent
 from learner.utils import GlobalPagination, get_avg_expectation_level
 from learner.models import (
-    LessonTime, Teacher, TermScore, Classroom, Student)
-from exam.models import (
-    ClassExamPerformance, StudentExamSessionPerformance)
+    ClassroomSummary, LessonTime, Teacher, TermScore, Classroom, Student, update_classroom_summary)
+from exam.models import StudentExamSessionPerformance
 
 
 @api_view(['POST'])
@@ -32,8 +32,8 @@ def create_classroom(request) -> Response:
             data=request.data, context={"request": request})
         if serializer.is_valid():
             classroom = serializer.save()
-            classroom_with_details = _get_classroom_with_details([classroom])
-            full_classroom = _get_teacher_classrooms(classroom_with_details)[0]
+            classroom.summary = update_classroom_summary(classroom.id)
+            full_classroom = _get_teacher_classrooms([classroom])[0]
             return Response({
                 "message": "Classroom created successfully",
                 "new_classroom": ClassroomDetailSerializer(full_classroom).data}, status=HTTP_201_CREATED)
@@ -59,13 +59,12 @@ def get_user_classrooms(request) -> Response:
                 return Response({"message": "Teacher account not found."}, status=HTTP_400_BAD_REQUEST)
 
             classrooms = teacher.classrooms.all().order_by(
-                '-grade').prefetch_related('lesson_times')
-            classrooms_with_details = _get_classroom_with_details(classrooms)
-            classrooms_list = _get_teacher_classrooms(classrooms_with_details)
+                '-grade').select_related('summary')
+            classrooms_list = _get_teacher_classrooms(classrooms)
 
         else:
             student_records = Student.objects.filter(
-                user=user).select_related('classroom')
+                user=user).select_related('classroom__summary')
             classrooms = [s.classroom for s in student_records if s.classroom]
             classrooms = sorted(
                 classrooms, key=lambda c: c.grade, reverse=True)
@@ -83,22 +82,36 @@ def get_user_classrooms(request) -> Response:
         }, status=HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-def _get_classroom_with_details(classrooms: List[Classroom]) -> List[Dict[str, Any]]:
-    classrooms_with_details = []
+def _get_classroom_summary(classroom: Classroom) -> ClassroomSummary:
+    try:
+        return classroom.summary
+    except ClassroomSummary.DoesNotExist:
+        # Classrooms created outside the API get theirs on first read
+        classroom.summary = update_classroom_summary(classroom.id)
+        return classroom.summary
+
+
+def _get_upcoming_lessons(lesson_times: List[List[str]]) -> List[str]:
+    lessons_by_day = defaultdict(list)
+    for day, lesson_time in lesson_times:
+        lessons_by_day[day].append(time.fromisoformat(lesson_time))
+
+    upcoming_lessons = []
     today = datetime.now().date()
+    for i in range(7):
+        target_date = today + timedelta(days=i)
+        for lesson_time in lessons_by_day.get(target_date.strftime("%A"), []):
+            upcoming_lessons.append(
+                datetime.combine(target_date, lesson_time).isoformat())
+
+    return upcoming_lessons
 
-    for classroom in classrooms:
-        upcoming_lessons = []
-        for i in range(7):
-            target_date = today + timedelta(days=i)
-            weekday_name = target_date.strftime("%A")
 
-            for lesson in classroom.lesson_times.all():
-                if lesson.day == weekday_name:
-                    lesson_datetime = datetime.combine(
-                        target_date, lesson.time)
-                    upcoming_lessons.append(lesson_datetime.isoformat())
+def _get_classroom_with_details(classrooms: List[Classroom]) -> List[Dict[str, Any]]:
+    classrooms_with_details = []
 
+    for classroom in classrooms:
+        summary = _get_classroom_summary(classroom)
         classrooms_with_details.append({
             "id": classroom.id,
             "name": classroom.name,
@@ -106,40 +119,24 @@ def _get_classroom_with_details(classrooms: List[Classroom]) -> List[Dict[str, A
             "school_name": classroom.school_name,
             "school_address": classroom.school_address,
             "subject": classroom.subject,
-            "lesson_times": upcoming_lessons,
-            "teacher_id": classroom.teacher.id if classroom.teacher else None,
+            "lesson_times": _get_upcoming_lessons(json.loads(summary.lesson_times or "[]")),
+            "teacher_id": classroom.teacher_id,
         })
 
     return classrooms_with_details
 
 
-def _get_teacher_classrooms(classroom_with_details: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-    full_classrooms = []
-
-    for classroom_data in classroom_with_details:
-        classroom_id = classroom_data['id']
-
-        # Count students directly
-        student_qs = Student.objects.filter(classroom_id=classroom_id)
-        classroom_data["student_count"] = student_qs.count()
+def _get_teacher_classrooms(classrooms: List[Classroom]) -> List[Dict[str, Any]]:
+    full_classrooms = _get_classroom_with_details(classrooms)
 
-        # Avg term score from stored field on students
-        avg_score = student_qs.aggregate(avg=Avg('avg_score'))['avg'] or 0.0
-        classroom_data["avg_term_score"] = avg_score
-        classroom_data["avg_term_expectation_level"] = get_avg_expectation_level(
-            avg_score)
-
-        # Avg mtihani score from ClassExamPerformance
-        result = ClassExamPerformance.objects.filter(
-            exam__classroom_id=classroom_id
-        ).aggregate(average_score=Avg('avg_score'))
-
-        avg_mtihani_score = result['average_score'] or 0.0
-        classroom_data["avg_mtihani_score"] = avg_mtihani_score
-        classroom_data["avg_mtihani_expectation_level"] = get_avg_expectation_level(
-            avg_mtihani_score)
-
-        full_classrooms.append(classroom_data)
+    # Figures come from the maintained summary, see update_classroom_summary
+    for classroom, classroom_data in zip(classrooms, full_classrooms):
+        summary = classroom.summary
+        classroom_data["student_count"] = summary.student_count
+        classroom_data["avg_term_score"] = summary.avg_term_score
+        classroom_data["avg_term_expectation_level"] = summary.avg_term_expectation_level
+        classroom_data["avg_mtihani_score"] = summary.avg_mtihani_score
+        classroom_data["avg_mtihani_expectation_level"] = summary.avg_mtihani_expectation_level
 
     return full_classrooms
 
@@ -147,6 +144,22 @@ def _get_teacher_classrooms(classroom_with_details: List[Dict[str, Any]]) -> Lis
 def _get_student_classrooms(classroom_with_details: List[Dict[str, Any]], students: List[Student]) -> List[Dict[str, Any]]:
     full_classrooms = []
     student_map = {s.classroom_id: s for s in students if s.classroom_id}
+    student_ids = [s.id for s in student_map.values()]
+
+    # One grouped query each for all of the student's classrooms
+    mtihani_scores = dict(
+        StudentExamSessionPerformance.objects.filter(
+            session__student_id__in=student_ids
+        ).order_by().values('session__student_id')
+        .annotate(average_score=Avg('avg_score'))
+        .values_list('session__student_id', 'average_score')
+    )
+
+    term_scores = defaultdict(list)
+    for term_score in TermScore.objects.filter(
+        student_id__in=student_ids,
+    ).order_by('grade', 'term').values('id', 'student_id', 'grade', 'term', 'score', 'expectation_level'):
+        term_scores[term_score.pop('student_id')].append(term_score)
 
     for classroom_data in classroom_with_details:
         classroom_id = classroom_data['id']
@@ -160,22 +173,13 @@ def _get_student_classrooms(classroom_with_details: List[Dict[str, Any]], studen
         classroom_data["avg_term_expectation_level"] = student.avg_expectation_level
 
         # Avg mtihani score
-        result = StudentExamSessionPerformance.objects.filter(
-            session__student=student
-        ).aggregate(average_score=Avg('avg_score'))
-
-        avg_mtihani_score = result['average_score'] or 0.0
+        avg_mtihani_score = mtihani_scores.get(student.id) or 0.0
         classroom_data["avg_mtihani_score"] = avg_mtihani_score
         classroom_data["avg_mtihani_expectation_level"] = get_avg_expectation_level(
             avg_mtihani_score)
 
         # Term scores list
-        classroom_data["term_scores"] = list(
-            TermScore.objects.filter(
-                student=student,
-            ).order_by('grade', 'term')
-            .values('id', 'grade', 'term', 'score', 'expectation_level')
-        )
+        classroom_data["term_scores"] = term_scores[student.id]
 
         full_classrooms.append(classroom_data)
 
@@ -344,8 +348,9 @@ def edit_classroom(request) -> Response:
                         **score_data
                     )
 
-        classroom_with_details = _get_classroom_with_details([classroom])
-        full_classroom = _get_teacher_classrooms(classroom_with_details)[0]
+        classroom.summary = update_classroom_summary(
+            classroom.id, ["students", "lesson_times"])
+        full_classroom = _get_teacher_classrooms([classroom])[0]
         return Response({
             "message": "Classroom updated successfully.",
             "new_classroom": ClassroomDetailSerializer(full_classroom).data
@@ -416,6 +421,7 @@ def edit_student(request) -> Response:
                 avg_score)
 
         student.save()
+        update_classroom_summary(student.classroom_id, ["students"])
 
         return Response({"message": "Student updated successfully."}, status=HTTP_200_OK)
 
@@ -11,9 +11,14 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 import os
+import dotenv
 from pathlib import Path
 from datetime import timedelta
 
+# Loaded before any app module reads the environment (gen.constants
+# included), by the web process and Celery workers alike
+dotenv.load_dotenv()
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -153,6 +158,52 @@ MEDIA_ROOT = BASE_DIR / 'media'
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 
+# Without CACHE_REDIS_URL each process keeps its own local-memory cache,
+# so cached renderings (exam.serializers.render_performance) are not
+# shared between web workers and each one warms up on its own
+CACHE_REDIS_URL = os.getenv("CACHE_REDIS_URL")
+if CACHE_REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
 CELERY_BROKER_URL = 'redis://localhost:6379/0'  # 0 = Redis DB index
 CELERY_ACCEPT_CONTENT = ['json']
-CELERY_TASK_SERIALIZER = 'json'
\ No newline at end of file
+CELERY_TASK_SERIALIZER = 'json'
+
+# Class average change (percentage points) after teacher score edits that
+# triggers a full re-analysis, regenerating LLM insights and follow-ups
+ANALYSIS_DRIFT_THRESHOLD = float(os.getenv("ANALYSIS_DRIFT_THRESHOLD", "5"))
+
+# Threads for the analysis pipeline's concurrent (LLM) stages
+ANALYSIS_MAX_WORKERS = int(os.getenv("ANALYSIS_MAX_WORKERS", "4"))
+
+# Per-exam task scheduling (exam/tasks.py). Score edits are debounced so a
+# run of corrections triggers one re-analysis.
+EXAM_TASK_DEBOUNCE_SECONDS = {
+    "incremental_analysis": float(os.getenv("EXAM_ANALYSIS_DEBOUNCE_SECONDS", "15")),
+}
+# How often a request waiting on another run of the same exam checks back
+EXAM_TASK_RETRY_SECONDS = 30
+# A run older than this is assumed dead and no longer blocks the exam
+EXAM_TASK_STALE_AFTER_SECONDS = 60 * 60
+
+# Exam status transitions (exam.tasks.advance_exam_lifecycle) run on beat:
+# celery -A mtihaniapi beat
+EXAM_LIFECYCLE_INTERVAL_SECONDS = float(
+    os.getenv("EXAM_LIFECYCLE_INTERVAL_SECONDS", "30"))
+CELERY_BEAT_SCHEDULE = {
+    "advance-exam-lifecycle": {
+        "task": "exam.tasks.advance_exam_lifecycle",
+        "schedule": EXAM_LIFECYCLE_INTERVAL_SECONDS,
+    },
+}
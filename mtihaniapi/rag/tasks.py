@@ -0,0 +1,68 @@
+from celery import shared_task
+from django.utils import timezone
+from gen.curriculum import get_strand_sub_strand_pairs
+from rag.models import TeacherDocument, SubStrandReference
+from rag.utils import *
+
+
+# ==================================================================== RAG
+
+# =============================================
+# ==========ANY CHANGE TO THIS=================
+# =======!!!!RESTART CELERY!!!=================
+# =============================================
+
+@shared_task
+def generate_doc_samples(doc_id):
+    # Imported here: rag.views imports this module to queue the task
+    from gen.utils import generate_llm_strand_context_list
+
+    try:
+        doc = TeacherDocument.objects.get(id=doc_id)
+        doc.update_to_chunking()
+
+        cbc_data = get_strand_sub_strand_pairs()
+        doc_text = extract_text_from_file(doc)
+        extract_res = generate_llm_strand_context_list(
+            cbc_data=cbc_data,
+            reference_text=doc_text
+        )
+
+        if not isinstance(extract_res, list):
+            doc.status = "Failed"
+            doc.generation_error = extract_res.get(
+                "error", "Unknown LLM error")
+            doc.save()
+            return
+        
+        for ref in extract_res:
+            sub_strand = ref.get("sub_strand")
+            strand = ref.get("strand")
+            samples = ref.get("samples", [])
+
+            if not samples:
+                continue
+
+            new_text = samples_to_text(samples)
+
+            try:
+                obj = SubStrandReference.objects.get(sub_strand=sub_strand)
+                combined_text = (obj.reference_text or "") + "\n\n" + new_text
+                obj.reference_text = deduplicate_by_question(combined_text)
+                obj.last_updated = timezone.now()
+                obj.save()
+            except SubStrandReference.DoesNotExist:
+                SubStrandReference.objects.create(
+                    strand=strand,
+                    sub_strand=sub_strand,
+                    reference_text=new_text,
+                    created_from=doc,
+                )
+                
+        doc.update_to_success()
+
+    except Exception as e:
+        doc.status = "Failed"
+        doc.generation_error = f"Unexpected error: {str(e)}"
+        doc.save()
+        print(f"Background Sample Generation failed for Doc ID {doc.id}: {e}")
@@ -1,10 +1,10 @@
-import fitz
 import re
 
 def extract_text_from_file(doc_instance):
     ext = doc_instance.extension.lower()
     file_path = doc_instance.file.path
     if ext == 'pdf':
+        import fitz
         doc = fitz.open(file_path)
         text = "\n".join(page.get_text() for page in doc)
     else:
@@ -1,15 +1,13 @@
-from celery import shared_task
 from rest_framework.status import *
 from rest_framework.decorators import api_view, permission_classes
 from rest_framework.permissions import IsAuthenticated
 from rag.utils import *
 from rag.serializers import TeacherDocumentSerializer
-from rag.models import TeacherDocument, SubStrandReference
+from rag.models import TeacherDocument
 from permissions import IsAdmin, IsTeacherOrAdmin
 from rest_framework.response import Response
 from django.utils import timezone
-from gen.curriculum import get_strand_sub_strand_pairs
-from gen.utils import generate_llm_strand_context_list
+from rag.tasks import generate_doc_samples
 
 
 @api_view(['POST'])
@@ -117,65 +115,3 @@ def approve_teacher_document(request):
     except Exception as e:
         print(f"Error approving document: {e}")
         return Response({"message": "Something went wrong while approving the document."}, status=HTTP_500_INTERNAL_SERVER_ERROR)
-
-
-# ==================================================================== RAG
-
-# =============================================
-# ==========ANY CHANGE TO THIS=================
-# =======!!!!RESTART CELERY!!!=================
-# =============================================
-
-@shared_task
-def generate_doc_samples(doc_id):
-    try:
-        doc = TeacherDocument.objects.get(id=doc_id)
-        doc.update_to_chunking()
-
-        cbc_data = get_strand_sub_strand_pairs()
-        doc_text = extract_text_from_file(doc)
-        extract_res = generate_llm_strand_context_list(
-            cbc_data=cbc_data,
-            reference_text=doc_text
-        )
-
-        if not isinstance(extract_res, list):
-            doc.status = "Failed"
-            doc.generation_error = extract_res.get(
-                "error", "Unknown LLM error")
-            doc.save()
-            return
-        
-        for ref in extract_res:
-            sub_strand = ref.get("sub_strand")
-            strand = ref.get("strand")
-            samples = ref.get("samples", [])
-
-            if not samples:
-                continue
-
-            new_text = samples_to_text(samples)
-
-            try:
-                obj = SubStrandReference.objects.get(sub_strand=sub_strand)
-                combined_text = (obj.reference_text or "") + "\n\n" + new_text
-                obj.reference_text = deduplicate_by_question(combined_text)
-                obj.last_updated = timezone.now()
-                obj.save()
-            except SubStrandReference.DoesNotExist:
-                SubStrandReference.objects.create(
-                    strand=strand,
-                    sub_strand=sub_strand,
-                    reference_text=new_text,
-                    created_from=doc,
-                )
-                
-        doc.update_to_success()
-
-    except Exception as e:
-        doc.status = "Failed"
-        doc.generation_error = f"Unexpected error: {str(e)}"
-        doc.save()
-        print(f"Background Sample Generation failed for Doc ID {doc.id}: {e}")
-
-